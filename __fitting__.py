@@ -0,0 +1,407 @@
+"""
+Kinetic parameter fitting library of Chemgaloo
+"""
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import __network__ as network
+import __integrator__ as ode
+import __reactor__ as reactor
+import __parallel__ as parallel
+from __trajectory__ import trajectory, recorder
+
+def __observations__(data = {}, net = None):
+
+    """
+    flatten measured time series into index of chemical, time, value and sigma of every observation
+    """
+    idx_chemi, times, values, sigmas = [], [], [], []
+    for ichemi, iseries in data.items():
+
+        if id(ichemi) not in net.index:
+
+            raise ValueError('measured chemical is not in the chemicals list of network')
+        itimes = np.atleast_1d(np.asarray(iseries[0], dtype = float))
+        ivalues = np.atleast_1d(np.asarray(iseries[1], dtype = float))
+        isigmas = np.broadcast_to(np.asarray(iseries[2] if len(iseries) > 2 else 1., dtype = float), ivalues.shape)
+        idx_chemi += [net.index[id(ichemi)]]*len(itimes)
+        times += itimes.tolist()
+        values += ivalues.tolist()
+        sigmas += isigmas.tolist()
+    return np.array(idx_chemi, dtype = int), np.array(times), np.array(values), np.array(sigmas)
+
+class objective:
+    """
+    Weighted residuals of a kinetic model against measured concentrations and detector hit times, as functions
+    of logarithms of free rate constants, with Jacobian from forward sensitivities\n
+    Parameters:
+    ---
+    net: chemgaloo.network.network
+        compiled network, rate constants of free reactions are overwritten in every evaluation
+    free: 1-d array, class: chemgaloo.reaction
+        reactions whose k are fitted
+    data: dict
+        map from chemgaloo.chemical to (times, values) or (times, values, sigma) of measured concentrations
+    events: dict
+        map from chemgaloo.detector to measured first hit time, or (time, sigma), only concentration
+        detectors are supported
+    t_end: float
+        simulated time of measured concentrations
+    t_max: float
+        latest time detectors are searched for, integration goes on after t_end until all detectors are hit
+        or t_max is reached, if not given, 10 times t_end. Hit time of a detector not hit by t_max is
+        extrapolated from the remaining gap of its signal, so that residual keeps a gradient
+    dt, integrator, rtol, atol:
+        see chemgaloo.reactor.bstr
+    """
+    def __init__(
+        self, net, free = [], data = {}, events = {}, t_end = None, t_max = None, dt = 0.01,
+        integrator = 'rosenbrock', rtol = 1e-6, atol = 1e-9
+    ):
+
+        self.net = net
+        self.free = list(free)
+        self.idx_k = np.array([reactor.__param_locate__(net, irxn)[1] for irxn in self.free], dtype = int)
+        self.k0 = np.array(net.k)
+        self.c0 = net.c0()
+        self.obs_chemi, self.obs_time, self.obs_value, self.obs_sigma = __observations__(data, net)
+        self.dets = network.compile_detectors(list(events.keys()), net = net)
+        event_values = [np.atleast_1d(np.asarray(ievent, dtype = float)) for ievent in events.values()]
+        self.event_time = np.array([ievent[0] for ievent in event_values])
+        self.event_sigma = np.array([ievent[1] if len(ievent) > 1 else 1. for ievent in event_values])
+        if t_end is None:
+
+            t_end = 1.5*np.max(np.concatenate((self.obs_time, self.event_time, [dt])))
+        self.t_end = t_end
+        self.t_max = max(t_end, 10*t_end if t_max is None else t_max)
+        self.dt = dt
+        self.integrator = integrator
+        self.rtol = rtol
+        self.atol = atol
+        self.record_times = np.unique(self.obs_time)
+        self.__cache__ = (None, None, None, None)
+
+    def __getstate__(self):
+        # evaluation cache is not shipped to worker processes
+        state = self.__dict__.copy()
+        state['__cache__'] = (None, None, None, None)
+        return state
+
+    def k(self, theta):
+        """
+        all rate constants of network from logarithms of free ones
+        """
+        k = np.array(self.k0)
+        k[self.idx_k] = np.exp(theta)
+        return k
+
+    def simulate(self, theta):
+        """
+        integrate concentrations with sensitivities to free rate constants, and locate first hits of detectors\n
+        Return:
+        ---
+        c_obs: 2-d array, float
+            concentrations at record_times
+        s_obs: 3-d array, float
+            sensitivities dc/dk at record_times, (n_time, n_species, n_free)
+        t_hits: 1-d array, float
+            first hit time of every detector, extrapolated beyond t_max if not hit
+        dt_hits: 2-d array, float
+            sensitivities of hit times dt_hit/dk, (n_detectors, n_free)
+        if_hit: 1-d array, bool
+            if detector is hit by t_max
+        """
+        self.net.k[:] = self.k(theta)
+        rhs, jac, y = reactor.__sens_system__(self.net, self.c0, self.free)
+        traj = trajectory(y.shape, capacity = max(1, len(self.record_times)))
+        record = recorder(traj, record_times = self.record_times)
+        t, f = 0., rhs(0., y)
+        g = g0 = self.dets.event(y[0], t)
+        t_hits = np.full(self.dets.n_detectors, np.nan)
+        dt_hits = np.zeros((self.dets.n_detectors, len(self.free)))
+        record.start(t, y, f)
+        for t_step, y_step in ode.integrate(
+            rhs, y, dt = self.dt, nstep = int(np.ceil(self.t_max/self.dt)), method = self.integrator, jac = jac,
+            rtol = self.rtol, atol = self.atol
+            ):
+
+            if (t >= self.t_end) and not np.any(np.isnan(t_hits)):
+
+                break
+
+            f_step = rhs(t_step, y_step)
+            g_step = self.dets.event(y_step[0], t_step)
+            if self.dets.n_detectors > 0:
+
+                t_new = self.dets.locate(g, t, y[0], f[0], g_step, t_step, y_step[0], f_step[0])
+                for idx_detector in np.nonzero(np.isnan(t_hits) & ~np.isnan(t_new))[0]:
+
+                    t_hit = float(t_new[idx_detector])
+                    y_hit = ode.hermite(t, y, f, t_step, y_step, f_step, t_hit)
+                    t_hits[idx_detector] = t_hit
+                    dt_hits[idx_detector] = self.__hit_sensitivity__(idx_detector, t_hit, y_hit, rhs(t_hit, y_hit))
+            record.step(t_step, y_step, f_step)
+            t, y, f, g = t_step, y_step, f_step, g_step
+        record.finish()
+        if_hit = ~np.isnan(t_hits)
+        for idx_detector in np.nonzero(~if_hit)[0]:
+            # not hit by t_max: remaining gap of signal is covered at the mean speed needed from t = 0 to t_max
+            idx_signal, dgdc = self.__signal_gradient__(idx_detector, t, y[0])
+            g_end = float(g[idx_signal])
+            speed = abs(g0[idx_signal])/t if g0[idx_signal] != 0 else 1./t
+            t_hits[idx_detector] = t + abs(g_end)/speed
+            dt_hits[idx_detector] = np.sign(g_end)*(y[1:] @ dgdc)/speed
+        return traj.array[:, 0], np.transpose(traj.array[:, 1:], (0, 2, 1)), t_hits, dt_hits, if_hit
+
+    def __signal_gradient__(self, idx_detector, t, c):
+
+        """
+        signal of detector closest to zero at state c, and gradient of its event function dg/dc
+        """
+        signals = np.nonzero(self.dets.owner == idx_detector)[0]
+        g = self.dets.event(c, t)[signals]
+        idx_signal = signals[np.nanargmin(np.abs(g))]
+        dgdc = np.zeros(self.net.n_species + 2)
+        dgdc[self.dets.num[idx_signal]] += 1.
+        dgdc[self.dets.den[idx_signal]] -= self.dets.value[idx_signal]
+        return idx_signal, dgdc[:self.net.n_species]
+
+    def __hit_sensitivity__(self, idx_detector, t_hit, y_hit, f_hit):
+
+        """
+        dt_hit/dk = -(dg/dc . dc/dk)/(dg/dc . dc/dt) for the signal closest to zero at hit
+        """
+        dgdc = self.__signal_gradient__(idx_detector, t_hit, y_hit[0])[1]
+        dgdt = dgdc @ f_hit[0]
+        if dgdt == 0:
+
+            return 0.
+        return -(y_hit[1:] @ dgdc)/dgdt
+
+    def __evaluate__(self, theta):
+
+        theta = np.asarray(theta, dtype = float)
+        if (self.__cache__[0] is None) or np.any(self.__cache__[0] != theta):
+
+            c_obs, s_obs, t_hits, dt_hits, if_hit = self.simulate(theta)
+            idx_time = np.searchsorted(self.record_times, self.obs_time)
+            res = np.concatenate((
+                (c_obs[idx_time, self.obs_chemi] - self.obs_value)/self.obs_sigma,
+                (t_hits - self.event_time)/self.event_sigma
+                ))
+            # chain rule to logarithms of rate constants
+            k_free = np.exp(theta)
+            jac = np.concatenate((
+                s_obs[idx_time, self.obs_chemi]/self.obs_sigma[:, np.newaxis],
+                dt_hits/self.event_sigma[:, np.newaxis]
+                ))*k_free
+            self.__cache__ = (theta.copy(), res, jac, if_hit)
+        return self.__cache__[1], self.__cache__[2]
+
+    def residuals(self, theta):
+        """
+        weighted residuals (model - measured)/sigma, concentrations first and hit times last
+        """
+        return self.__evaluate__(theta)[0]
+
+    def jacobian(self, theta):
+        """
+        d(residuals)/d(theta), theta = log(k) of free reactions
+        """
+        return self.__evaluate__(theta)[1]
+
+    def reached(self, theta):
+        """
+        if every detector is hit by t_max, i.e. no hit time is extrapolated
+        """
+        if self.dets.n_detectors == 0:
+
+            return True
+        self.__evaluate__(theta)
+        return bool(np.all(self.__cache__[3]))
+
+    def cost(self, theta, checkpoint_every = 100):
+        """
+        0.5 * sum of squared weighted residuals of measured concentrations and its gradient with respect to theta
+        by adjoint sensitivity, cost does not grow with number of free reactions, detector hit times are
+        not supported
+        """
+        if self.dets.n_detectors > 0:
+
+            raise ValueError('detector hit times can not be fitted with adjoint gradient')
+        self.net.k[:] = self.k(theta)
+
+        def loss(t, c):
+
+            idx_obs = self.obs_time == t
+            res = (c[self.obs_chemi[idx_obs]] - self.obs_value[idx_obs])/self.obs_sigma[idx_obs]
+            grad = np.zeros(self.net.n_species)
+            np.add.at(grad, self.obs_chemi[idx_obs], res/self.obs_sigma[idx_obs])
+            return 0.5*np.sum(res**2), grad
+
+        value, dk, dc0 = reactor.__adjoint__(
+            self.net, loss, self.record_times, dt = self.dt, nstep = int(np.ceil(self.t_end/self.dt)),
+            integrator = self.integrator, rtol = self.rtol, atol = self.atol, checkpoint_every = checkpoint_every
+            )
+        return value, dk[self.idx_k]*np.exp(theta)
+
+def __fit_start__(obj, theta0, bounds, max_nfev = None, gradient = 'forward'):
+
+    """
+    optimize from one starting point\n
+    Return:
+    ---
+    theta, cost, if_conv, hess_inv: hess_inv is None for gradient 'forward'
+    """
+    if gradient == 'forward':
+
+        from scipy.optimize import least_squares
+        result = least_squares(
+            obj.residuals, theta0, jac = obj.jacobian, bounds = bounds, method = 'trf', x_scale = 'jac',
+            max_nfev = max_nfev
+            )
+        return result.x, result.cost, result.success, None
+    elif gradient == 'adjoint':
+
+        from scipy.optimize import minimize
+        options = {} if max_nfev is None else {'maxfun': max_nfev}
+        result = minimize(
+            obj.cost, theta0, jac = True, method = 'L-BFGS-B', bounds = list(zip(*bounds)), options = options
+            )
+        return result.x, float(result.fun), result.success, result.hess_inv.todense()
+    raise ValueError('unknown gradient: {}'.format(gradient))
+
+def __worker_fit__(task):
+
+    theta0, bounds, max_nfev, gradient = task
+    return __fit_start__(
+        parallel.__WORKER_STATE__['objective'], theta0, bounds, max_nfev = max_nfev, gradient = gradient
+        )
+
+def fit(
+    chemicals = [],
+    reactions = [],
+    free = [],
+    data = {},
+    events = {},
+    bounds = {},
+    t_end = None,
+    t_max = None,
+    dt = 0.01,
+    integrator = 'rosenbrock',
+    rtol = 1e-6,
+    atol = 1e-9,
+    n_starts = 1,
+    n_workers = 1,
+    seed = None,
+    max_nfev = None,
+    gradient = 'forward'
+):
+    """
+    Fit rate constants to measured concentrations and detector hit times by weighted least squares in log(k),
+    gradients come from sensitivities so that every evaluation costs one simulation\n
+    Parameters:
+    ---
+    chemicals: 1-d array, class: chemgaloo.chemical
+        all chemicals in reactor, present concentrations are initial concentrations
+    reactions: 1-d array, class: chemgaloo.reaction
+        all possible reactions in reactor
+    free: 1-d array, class: chemgaloo.reaction
+        reactions whose k are fitted, others keep present k
+    data: dict
+        map from chemgaloo.chemical to (times, values) or (times, values, sigma) of measured concentrations
+    events: dict
+        map from chemgaloo.detector to measured first hit time or (time, sigma), e.g. the time recorded in
+        detector_record, only concentration detectors are supported, motions are ignored. Only the first hit of
+        every detector is fitted, later hits and intervals between hits are not supported
+    bounds: dict
+        map from free reaction to (k_min, k_max), if not given, 1e-3*k to 1e3*k of present k
+    t_end: float
+        simulated time, if not given, 1.5 times the latest measured time
+    t_max: float
+        latest time detectors are searched for, if not given, 10 times t_end, see chemgaloo.fitting.objective.
+        Only starts whose fitted k hit every detector by t_max are accepted, ValueError is raised if none does
+    dt, integrator, rtol, atol:
+        see chemgaloo.reactor.bstr
+    n_starts: int
+        number of starting points, the first one is present k, others are drawn log-uniformly within bounds
+    n_workers: int
+        number of worker processes starting points are split over, 1 to run in present process
+    seed: int
+        seed of random starting points
+    max_nfev: int
+        maximal number of evaluations per start
+    gradient: str
+        how gradients are computed, options:
+    >'forward': forward sensitivities, residual Jacobian is used by scipy.optimize.least_squares\n
+    >'adjoint': adjoint sensitivity of cost, used by L-BFGS-B, for many free reactions,
+    events are not supported\n
+    Return:
+    ---
+    k: 1-d array, float
+        fitted k of free reactions, also written to reaction.k
+    cov: 2-d array, float
+        covariance estimate of k, (J^T J)^-1 scaled by variance of residuals, linearized at optimum,
+        for gradient 'adjoint' the inverse Hessian approximated by L-BFGS-B is used instead of (J^T J)^-1
+    cost: float
+        0.5 * sum of squared weighted residuals at optimum
+    if_conv: bool
+        if optimizer of the best start converged
+    """
+    net = network.compile(chemicals = chemicals, reactions = reactions)
+    obj = objective(
+        net, free = free, data = data, events = events, t_end = t_end, t_max = t_max, dt = dt,
+        integrator = integrator, rtol = rtol, atol = atol
+        )
+    k0 = net.k[obj.idx_k]
+    lower, upper = [], []
+    for idx_free in range(len(free)):
+
+        k_min, k_max = bounds.get(free[idx_free], (1e-3*k0[idx_free], 1e3*k0[idx_free]))
+        if (k_min <= 0) or (k_max <= k_min):
+
+            raise ValueError('bounds of free reaction-{} should satisfy 0 < k_min < k_max'.format(idx_free+1))
+        lower.append(np.log(k_min))
+        upper.append(np.log(k_max))
+    lower, upper = np.array(lower), np.array(upper)
+    rng = np.random.default_rng(seed)
+    starts = [np.clip(np.log(np.maximum(k0, 1e-300)), lower, upper)]
+    for istart in range(1, n_starts):
+
+        starts.append(rng.uniform(lower, upper))
+
+    if n_workers > 1:
+
+        with ProcessPoolExecutor(
+            max_workers = n_workers, initializer = parallel.__worker_init__,
+            initargs = (pickle.dumps({'objective': obj}),)
+            ) as executor:
+
+            results = list(executor.map(
+                __worker_fit__, [(itheta, (lower, upper), max_nfev, gradient) for itheta in starts]
+                ))
+    else:
+
+        results = [
+            __fit_start__(obj, itheta, (lower, upper), max_nfev = max_nfev, gradient = gradient) for itheta in starts
+            ]
+    # hit times extrapolated beyond t_max are a penalty, not a fit, such starts are not accepted
+    results = [iresult for iresult in sorted(results, key = lambda iresult: iresult[1]) if obj.reached(iresult[0])]
+    if not results:
+
+        raise ValueError(
+            'detectors are not hit by t_max = {} at fitted k of any start, increase t_max or n_starts'.format(obj.t_max)
+            )
+    theta, cost, if_conv, hess_inv = results[0]
+
+    n_dof = max(1, len(obj.obs_value) + len(obj.event_time) - len(theta))
+    if hess_inv is None:
+
+        jac = obj.jacobian(theta)
+        hess_inv = np.linalg.pinv(jac.T @ jac)
+    cov_theta = np.asarray(hess_inv)*(2*cost/n_dof)
+    k = np.exp(theta)
+    for idx_free in range(len(free)):
+
+        free[idx_free].k = float(k[idx_free])
+    return k, cov_theta*np.outer(k, k), cost, if_conv
@@ -0,0 +1,410 @@
+"""
+Integrator library of Chemgaloo
+"""
+import numpy as np
+
+# Dormand-Prince 5(4) tableau
+__DP_C__ = [0., 1/5, 3/10, 4/5, 8/9, 1.]
+__DP_A__ = [
+    [],
+    [1/5],
+    [3/40, 9/40],
+    [44/45, -56/15, 32/9],
+    [19372/6561, -25360/2187, 64448/6561, -212/729],
+    [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656]
+]
+__DP_B__ = [35/384, 0., 500/1113, 125/192, -2187/6784, 11/84]
+# difference between 5th and embedded 4th order weights, the last one is for FSAL stage
+__DP_E__ = [71/57600, 0., -71/16695, 71/1920, -17253/339200, 22/525, -1/40]
+
+# Rosenbrock 2(3) of Shampine and Reichelt (ode23s)
+__ROS_D__ = 1/(2 + np.sqrt(2))
+__ROS_E32__ = 6 + np.sqrt(2)
+
+def __fd_jac__(f, t, y, f0):
+
+    """
+    forward finite-difference Jacobian, used when no analytic Jacobian is given
+    """
+    jac = np.empty((len(y), len(y)))
+    for idx in range(len(y)):
+
+        dy = np.sqrt(np.finfo(float).eps) * max(1.0, abs(y[idx]))
+        y_pert = y.copy()
+        y_pert[idx] += dy
+        jac[:, idx] = (f(t, y_pert) - f0)/dy
+    return jac
+
+def __err_norm__(err, y, y_new, rtol, atol):
+
+    """
+    RMS of scaled error, for a batch of states (..., n) the worst case decides, so that
+    all cases advance in lockstep
+    """
+    scale = atol + rtol * np.maximum(np.abs(y), np.abs(y_new))
+    return np.max(np.sqrt(np.mean((err/scale)**2, axis = -1)))
+
+def __w_solver__(jac, gamma):
+
+    """
+    factorize W = I - gamma * jac once and return a function that solves W x = b,
+    sparse LU is used for scipy.sparse Jacobians. A 2-d jac is shared by all rows of a batch b (..., n),
+    e.g. concentrations and their sensitivities
+    """
+    if hasattr(jac, 'tocsc'):
+
+        from scipy.sparse import identity
+        from scipy.sparse.linalg import splu
+        lu = splu((identity(jac.shape[0], format = 'csc') - gamma*jac).tocsc())
+        return lambda b: lu.solve(b.T).T
+    w_inv = np.linalg.inv(np.eye(jac.shape[-1]) - gamma*jac)
+    if w_inv.ndim > 2:
+        # batch of systems, (..., n, n) @ (..., n)
+        return lambda b: (w_inv @ b[..., np.newaxis])[..., 0]
+    return lambda b: b @ w_inv.T
+
+def euler_step(f, t, y, h, f0):
+
+    """
+    explicit Euler step, same as reaction.go(mode = 'BSTR') applied to all reactions at once\n
+    Return:
+    ---
+    y_new: 1-d array, float
+        state at t + h
+    err: None
+        no error estimate is available
+    """
+    return y + h * f0, None
+
+def rk45_step(f, t, y, h, f0):
+
+    """
+    explicit embedded Runge-Kutta step of Dormand and Prince\n
+    Return:
+    ---
+    y_new: 1-d array, float
+        5th-order state at t + h
+    err: 1-d array, float
+        local error estimate
+    f_new: 1-d array, float
+        derivative at t + h, can be reused by the next step (FSAL)
+    """
+    ks = [f0]
+    for idx_stage in range(1, 6):
+
+        dy = 0.
+        for jdx_stage in range(idx_stage):
+
+            dy = dy + __DP_A__[idx_stage][jdx_stage] * ks[jdx_stage]
+        ks.append(f(t + __DP_C__[idx_stage]*h, y + h*dy))
+    dy = 0.
+    for idx_stage in range(6):
+
+        dy = dy + __DP_B__[idx_stage] * ks[idx_stage]
+    y_new = y + h*dy
+    f_new = f(t + h, y_new)
+    ks.append(f_new)
+    err = 0.
+    for idx_stage in range(7):
+
+        err = err + __DP_E__[idx_stage] * ks[idx_stage]
+    return y_new, h*err, f_new
+
+def rosenbrock_step(f, t, y, h, f0, jac):
+
+    """
+    linearly-implicit Rosenbrock 2(3) step, L-stable, suitable for stiff systems\n
+    Parameters:
+    ---
+    jac: 2-d array, float
+        Jacobian df/dy at (t, y), dense or scipy.sparse matrix
+    Return:
+    ---
+    y_new: 1-d array, float
+        2nd-order state at t + h
+    err: 1-d array, float
+        local error estimate
+    f_new: 1-d array, float
+        derivative at t + h
+    """
+    solve = __w_solver__(jac, h*__ROS_D__)
+    k1 = solve(f0)
+    f1 = f(t + 0.5*h, y + 0.5*h*k1)
+    k2 = solve(f1 - k1) + k1
+    y_new = y + h*k2
+    f_new = f(t + h, y_new)
+    k3 = solve(f_new - __ROS_E32__*(k2 - f1) - 2*(k1 - f0))
+    return y_new, h/6*(k1 - 2*k2 + k3), f_new
+
+__ORDER__ = {'rk45': 4, 'rosenbrock': 2}
+
+def hermite(t0, y0, f0, t1, y1, f1, t):
+    """
+    cubic Hermite dense output between two accepted steps, from states and derivatives at both ends
+    """
+    h = t1 - t0
+    s = (t - t0)/h
+    h00 = (1 + 2*s)*(1 - s)**2
+    h10 = s*(1 - s)**2
+    h01 = s**2*(3 - 2*s)
+    h11 = s**2*(s - 1)
+    return h00*y0 + h10*h*f0 + h01*y1 + h11*h*f1
+
+def locate(g, t0, t1, g0, g1, tol = 1e-12, max_iter = 100):
+    """
+    find root of scalar function g in [t0, t1] with g(t0) = g0 and g(t1) = g1 of opposite signs,
+    by Illinois regula falsi\n
+    Return:
+    ---
+    t: float
+        time of root, accurate to tol
+    """
+    tol = tol*max(1.0, abs(t1))
+    side = 0
+    t = t1
+    for iiter in range(max_iter):
+
+        if (t1 - t0 <= tol) or (g1 == 0):
+
+            break
+        t = (t0*g1 - t1*g0)/(g1 - g0)
+        t = min(max(t, t0 + 0.5*tol), t1 - 0.5*tol)
+        gt = g(t)
+        if gt == 0:
+
+            return t
+        if np.sign(gt) == np.sign(g1):
+
+            t1, g1 = t, gt
+            if side == -1:
+
+                g0 *= 0.5
+            side = -1
+        else:
+
+            t0, g0 = t, gt
+            if side == 1:
+
+                g1 *= 0.5
+            side = 1
+    return t1
+
+def integrate(
+    f,
+    y0,
+    dt = 0.01,
+    nstep = 1000,
+    method = 'euler',
+    jac = None,
+    rtol = 1e-6,
+    atol = 1e-9,
+    t0 = 0.
+):
+    """
+    Generator that integrates dy/dt = f(t, y) and yields after every accepted step\n
+    Parameters:
+    ---
+    f: callable
+        right-hand side, f(t, y) -> 1-d array
+    y0: array, float
+        initial state, shape (n,), or (n_cases, n) to integrate a batch of cases in lockstep
+    dt: float
+        step of 'euler', initial step of adaptive methods
+    nstep: int
+        total time = nstep * dt, for 'euler' also the number of steps
+    method: str
+        integrator, options:
+    >'euler': fixed-step explicit Euler\n
+    >'rk45': adaptive explicit Dormand-Prince 5(4), for non-stiff systems\n
+    >'rosenbrock': adaptive linearly-implicit Rosenbrock 2(3), for stiff systems\n
+    jac: callable
+        Jacobian, jac(t, y) -> 2-d array or scipy.sparse matrix, only used by 'rosenbrock',
+        finite difference is used if not given
+    rtol, atol: float
+        relative and absolute tolerance of adaptive methods
+    t0: float
+        initial time
+    Yield:
+    ---
+    t: float
+        time after step
+    y: 1-d array, float
+        state after step
+    """
+    y = np.array(y0, dtype = float)
+    if method == 'euler':
+
+        for istep in range(nstep):
+
+            y, _ = euler_step(f, t0 + istep*dt, y, dt, f(t0 + istep*dt, y))
+            yield t0 + (istep + 1)*dt, y
+        return
+    if method not in __ORDER__:
+
+        raise ValueError('unknown integrator: {}'.format(method))
+
+    t = t0
+    t_end = t0 + nstep*dt
+    h = dt
+    f0 = f(t, y)
+    exponent = -1/(__ORDER__[method] + 1)
+    while t < t_end:
+
+        h = min(h, t_end - t)
+        if h <= 10*np.finfo(float).eps*max(1.0, abs(t)):
+
+            raise RuntimeError('CHEMGALOO| step size underflow at time = {}'.format(t))
+        if method == 'rk45':
+
+            y_new, err, f_new = rk45_step(f, t, y, h, f0)
+        else:
+
+            ijac = __fd_jac__(f, t, y, f0) if jac is None else jac(t, y)
+            y_new, err, f_new = rosenbrock_step(f, t, y, h, f0, ijac)
+        err_norm = __err_norm__(err, y, y_new, rtol, atol)
+        if not np.isfinite(err_norm):
+
+            h = 0.2*h
+            continue
+        if err_norm <= 1.0:
+
+            t = t_end if t_end - (t + h) <= 10*np.finfo(float).eps*abs(t_end) else t + h
+            y = y_new
+            f0 = f_new
+            yield t, y
+            factor = 5.0 if err_norm == 0 else min(5.0, 0.9*err_norm**exponent)
+        else:
+
+            factor = max(0.2, 0.9*err_norm**exponent)
+        h = h*factor
+
+def __solve__(jac, b):
+
+    """
+    solve jac x = b for dense or scipy.sparse jac
+    """
+    if hasattr(jac, 'tocsc'):
+
+        from scipy.sparse.linalg import spsolve
+        return spsolve(jac.tocsc(), b)
+    return np.linalg.solve(jac, b)
+
+def __max_step__(y, dy, positive):
+
+    """
+    largest damping factor <= 1 keeping y + alpha*dy non-negative (fraction to boundary)
+    """
+    if not positive:
+
+        return 1.0
+    idx_neg = dy < 0
+    if not np.any(idx_neg):
+
+        return 1.0
+    return min(1.0, 0.99*np.min(np.maximum(y[idx_neg], 0)/(-dy[idx_neg])))
+
+def newton(f, jac, y0, tol = 1e-8, max_iter = 50, positive = True):
+    """
+    damped Newton iteration with backtracking line search for f(y) = 0\n
+    Parameters:
+    ---
+    f: callable
+        residual, f(y) -> 1-d array
+    jac: callable
+        Jacobian of residual, jac(y) -> 2-d array or scipy.sparse matrix
+    y0: 1-d array, float
+        initial guess
+    tol: float
+        convergence threshold of max(abs(f))
+    max_iter: int
+        maximum number of Newton iterations
+    positive: bool
+        if keep y non-negative, e.g. for concentrations
+    Return:
+    ---
+    y: 1-d array, float
+        solution, or last iterate if not converged
+    res_log: 1-d array, float
+        max(abs(f)) of every iterate
+    if_conv: bool
+        if converged
+    """
+    y = np.array(y0, dtype = float)
+    fy = f(y)
+    res_log = [np.max(np.abs(fy))]
+    for iiter in range(max_iter):
+
+        if res_log[-1] <= tol:
+
+            return y, res_log, True
+        dy = __solve__(jac(y), -fy)
+        if not np.all(np.isfinite(dy)):
+
+            break
+        alpha = __max_step__(y, dy, positive)
+        norm = np.linalg.norm(fy)
+        while alpha > 1e-6:
+
+            y_try = y + alpha*dy
+            f_try = f(y_try)
+            if np.linalg.norm(f_try) <= (1 - 1e-4*alpha)*norm:
+
+                break
+            alpha *= 0.5
+        else:
+            # no descent along Newton direction
+            break
+        y, fy = y_try, f_try
+        res_log.append(np.max(np.abs(fy)))
+    return y, res_log, res_log[-1] <= tol
+
+def pseudo_transient(f, jac, y0, tol = 1e-8, max_iter = 500, dtau = 1e-3, positive = True):
+    """
+    pseudo-transient continuation for f(y) = 0: linearly-implicit Euler steps on dy/dtau = f(y) whose
+    pseudo time step grows as residual decreases (switched evolution relaxation), robust far from solution.
+    Parameters and return are the same as chemgaloo.integrator.newton, dtau is the initial pseudo time step
+    """
+    y = np.array(y0, dtype = float)
+    fy = f(y)
+    res_log = [np.max(np.abs(fy))]
+    for iiter in range(max_iter):
+
+        if res_log[-1] <= tol:
+
+            return y, res_log, True
+        dy = __w_solver__(jac(y), dtau)(dtau*fy)
+        y = y + __max_step__(y, dy, positive)*dy
+        f_new = f(y)
+        norm_old, norm_new = np.linalg.norm(fy), np.linalg.norm(f_new)
+        dtau = dtau*min(10.0, norm_old/max(norm_new, np.finfo(float).tiny))
+        fy = f_new
+        res_log.append(np.max(np.abs(fy)))
+    return y, res_log, res_log[-1] <= tol
+
+def steady_state(f, jac, y0, tol = 1e-8, max_iter = 50, positive = True, ptc_iter = 500, dtau = 1e-3):
+    """
+    solve f(y) = 0 by damped Newton, if Newton fails, restart from y0 with pseudo-transient continuation
+    and polish the result by Newton\n
+    Return:
+    ---
+    y: 1-d array, float
+        solution
+    res_log: 1-d array, float
+        max(abs(f)) of every iterate, over all stages
+    n_iter: int
+        total number of iterations
+    if_conv: bool
+        if converged
+    """
+    y, res_log, if_conv = newton(f, jac, y0, tol = tol, max_iter = max_iter, positive = positive)
+    if not if_conv:
+
+        y, ptc_log, if_conv = pseudo_transient(
+            f, jac, y0, tol = tol, max_iter = ptc_iter, dtau = dtau, positive = positive
+            )
+        res_log += ptc_log
+        if not if_conv:
+
+            y, newton_log, if_conv = newton(f, jac, y, tol = tol, max_iter = max_iter, positive = positive)
+            res_log += newton_log
+    return y, res_log, len(res_log) - 1, if_conv
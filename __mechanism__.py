@@ -0,0 +1,304 @@
+"""
+Mechanism file library of Chemgaloo
+
+Mechanism files are plain text, '#' or '!' starts a comment:
+
+    SPECIES
+    A = 1.0   B = 0.5
+    C
+    END
+    REACTIONS
+    A + 2 B => C ; k = 1.0
+    C <=> A ; k = 0.1, kr = 0.01, deltaH = -5e4
+    A => B ; rate_law = arrhenius, A = 1e13, Ea = 8e4
+    END
+
+species are declared with optional initial concentration, coefficients are separated from names by
+spaces, '+' between species should be surrounded by spaces, so that names like Na+ are allowed.
+Reversible reactions '<=>' give two reactions, the reverse one takes kr, or Ar, Ear, nr or barrier_r
+"""
+import os
+import re
+import hashlib
+import tempfile
+import numpy as np
+import __network__ as network
+
+# bump when arrays stored in cache change, caches of other versions are ignored
+__CACHE_VERSION__ = 1
+__LAW_NAMES__ = dict([(code, name) for name, code in network.__RATE_LAWS__.items()])
+__REVERSE_KEYS__ = {'k': 'kr', 'A': 'Ar', 'Ea': 'Ear', 'n': 'nr', 'barrier': 'barrier_r'}
+__KEYS__ = set(['k', 'rate_law', 'A', 'Ea', 'n', 'barrier', 'deltaH'] + list(__REVERSE_KEYS__.values()))
+
+def __digest__(fname, chunk_size = 1 << 20):
+
+    digest = hashlib.sha256()
+    with open(fname, 'rb') as f:
+
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def __side__(text, index, where):
+
+    """
+    species indices and coefficients of one side of a reaction
+    """
+    species, stois = [], []
+    text = text.strip()
+    if not text:
+
+        return species, stois
+    for iterm in re.split(r'\s+\+\s+', text):
+
+        match = re.match(r'^(?:(\d*\.?\d+(?:[eE][-+]?\d+)?)\s+)?(\S+)$', iterm.strip())
+        if match is None:
+
+            raise ValueError('{}: cannot read term "{}"'.format(where, iterm))
+        if match.group(2) not in index:
+
+            raise ValueError('{}: species {} is not declared'.format(where, match.group(2)))
+        species.append(index[match.group(2)])
+        stois.append(float(match.group(1)) if match.group(1) else 1.)
+    return species, stois
+
+def __parse__(fname):
+
+    """
+    read mechanism file line by line into flat arrays, reactions are never built as objects here
+    """
+    names, c0, index = [], [], {}
+    e_rxn, e_species, e_stoi, e_side = [], [], [], []
+    k, law, law_params, deltaH = [], [], [], []
+    section = None
+    with open(fname, 'r') as f:
+
+        for lineno, line in enumerate(f, 1):
+
+            where = '{}, line {}'.format(fname, lineno)
+            line = re.split(r'[#!]', line, maxsplit = 1)[0].strip()
+            if not line:
+
+                continue
+            keyword = line.split()[0].upper()
+            if keyword in ('SPECIES', 'SPEC', 'REACTIONS', 'REAC', 'END'):
+
+                section = {'SPEC': 'SPECIES', 'REAC': 'REACTIONS', 'END': None}.get(keyword, keyword)
+                continue
+            if section == 'SPECIES':
+
+                for itoken in re.sub(r'\s*=\s*', '=', line).split():
+
+                    name, _, value = itoken.partition('=')
+                    if name in index:
+
+                        raise ValueError('{}: species {} is declared twice'.format(where, name))
+                    index[name] = len(names)
+                    names.append(name)
+                    c0.append(float(value) if value else 0.)
+            elif section == 'REACTIONS':
+
+                equation, _, options = line.partition(';')
+                params = {}
+                for itoken in re.sub(r'\s*=\s*', '=', options).replace(',', ' ').split():
+
+                    key, _, value = itoken.partition('=')
+                    if key not in __KEYS__:
+
+                        raise ValueError('{}: unknown parameter {}'.format(where, key))
+                    params[key] = value if key == 'rate_law' else float(value)
+                match = re.match(r'^(.*?)\s*(<=>|=>)\s*(.*)$', equation)
+                if match is None:
+
+                    raise ValueError('{}: reaction should contain => or <=>'.format(where))
+                rate_law = params.get('rate_law', 'constant')
+                if rate_law not in network.__RATE_LAWS__:
+
+                    raise ValueError('{}: unknown rate law {}'.format(where, rate_law))
+                sides = [__side__(match.group(1), index, where), __side__(match.group(3), index, where)]
+                directions = [('k', 'A', 'Ea', 'n', 'barrier', 1.)]
+                if match.group(2) == '<=>':
+
+                    if not any([ikey in params for ikey in __REVERSE_KEYS__.values()]):
+
+                        raise ValueError('{}: reversible reaction needs kr, Ar or barrier_r'.format(where))
+                    directions.append(tuple(__REVERSE_KEYS__[ikey] for ikey in ('k', 'A', 'Ea', 'n', 'barrier')) + (-1.,))
+                for ik, iA, iEa, i_n, ibarrier, isign in directions:
+
+                    idx_rxn = len(k)
+                    for iside, (species, stois) in enumerate(sides if isign > 0 else sides[::-1]):
+
+                        e_rxn += [idx_rxn]*len(species)
+                        e_species += species
+                        e_stoi += stois
+                        e_side += [iside]*len(species)
+                    k.append(params.get(ik, 0.))
+                    law.append(network.__RATE_LAWS__[rate_law])
+                    law_params.append([params.get(iA, 0.), params.get(iEa, 0.), params.get(i_n, 0.), params.get(ibarrier, 0.)])
+                    deltaH.append(isign*params.get('deltaH', 0.))
+            else:
+
+                raise ValueError('{}: line outside SPECIES and REACTIONS blocks'.format(where))
+    return {
+        'names': np.array(names, dtype = str), 'c0': np.array(c0),
+        'e_rxn': np.array(e_rxn, dtype = np.int64), 'e_species': np.array(e_species, dtype = np.int64),
+        'e_stoi': np.array(e_stoi), 'e_side': np.array(e_side, dtype = np.int8),
+        'k': np.array(k), 'law': np.array(law, dtype = np.int8),
+        'law_params': np.array(law_params).reshape(-1, 4).T, 'deltaH': np.array(deltaH)
+        }
+
+def __build__(arrays, sparse = False, k_cache_size = 128, objects = True):
+
+    """
+    chemicals, reactions and compiled network from flat arrays of a parsed or cached mechanism
+    """
+    from chemgaloo import chemical, reaction
+    names, c0 = arrays['names'].tolist(), arrays['c0'].tolist()
+    chemicals = [chemical(concentration = c0[idx], name = names[idx]) for idx in range(len(names))]
+    e_rxn, e_species, e_stoi, e_side = arrays['e_rxn'], arrays['e_species'], arrays['e_stoi'], arrays['e_side']
+    n_reactions = len(arrays['k'])
+    indptr = np.searchsorted(e_rxn, np.arange(n_reactions + 1)).tolist()
+    species_l, stoi_l, side_l = e_species.tolist(), e_stoi.tolist(), e_side.tolist()
+    k, law, deltaH = arrays['k'].tolist(), arrays['law'].tolist(), arrays['deltaH'].tolist()
+    A, Ea, n, barrier = arrays['law_params'].tolist()
+    reactions = []
+    for idx_rxn in range(n_reactions if objects else 0):
+
+        lo, hi = indptr[idx_rxn], indptr[idx_rxn + 1]
+        n_rxtns = side_l[lo:hi].count(0)
+        reactions.append(reaction(
+            rxtns = [chemicals[idx] for idx in species_l[lo:lo + n_rxtns]],
+            prdts = [chemicals[idx] for idx in species_l[lo + n_rxtns:hi]],
+            stois = stoi_l[lo:hi], k = k[idx_rxn], deltaH = deltaH[idx_rxn], rate_law = __LAW_NAMES__[law[idx_rxn]],
+            A = A[idx_rxn], Ea = Ea[idx_rxn], n = n[idx_rxn], barrier = barrier[idx_rxn]
+            ))
+    is_rxtn = e_side == 0
+    net = network.assemble(
+        chemicals, reactions,
+        stoi_triplets = (e_species, e_rxn, np.where(is_rxtn, -e_stoi, e_stoi)),
+        order_triplets = (e_rxn[is_rxtn], e_species[is_rxtn], e_stoi[is_rxtn]),
+        k = arrays['k'], law = arrays['law'], law_params = arrays['law_params'],
+        sparse = sparse, k_cache_size = k_cache_size
+        )
+    return chemicals, reactions, net
+
+def __read_cache__(cache, digest):
+
+    try:
+        with np.load(cache, allow_pickle = False) as f:
+
+            if (str(f['hash']) != digest) or (int(f['version']) != __CACHE_VERSION__):
+
+                return None
+            return dict([(ikey, f[ikey]) for ikey in f.files])
+    except Exception:
+        # missing, truncated or foreign file, parse the source again
+        return None
+
+def __write_cache__(cache, arrays, digest):
+
+    tmp = None
+    try:
+        fd, tmp = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(cache)), suffix = '.npz')
+        with os.fdopen(fd, 'wb') as f:
+
+            np.savez(f, hash = digest, version = __CACHE_VERSION__, **arrays)
+        # readers never see a half-written cache
+        os.replace(tmp, cache)
+    except OSError:
+        # read-only directory, the cache is only an optimization
+        if (tmp is not None) and os.path.exists(tmp):
+
+            os.remove(tmp)
+
+def load(fname, cache = True, sparse = False, k_cache_size = 128, objects = True):
+    """
+    load a mechanism file, parsed arrays are cached in binary form keyed by SHA-256 of the file content,
+    so loading the same content again skips parsing\n
+    Parameters:
+    ---
+    fname: str
+        mechanism file, see format in chemgaloo.mechanism
+    cache: bool or str
+        if True, cache is fname + '.npz', a str gives the cache file, False disables caching.
+        A cache whose hash does not match the file content is rebuilt
+    sparse, k_cache_size:
+        see chemgaloo.network.compile
+    objects: bool
+        if build chemgaloo.reaction objects, which dominates loading time of large mechanisms, without them
+        reactions is empty and only net can be simulated, e.g. by chemgaloo.reactor.bstr_sweep
+    Return:
+    ---
+    chemicals: 1-d array, class: chemgaloo.chemical
+        declared species, named, with declared initial concentrations
+    reactions: 1-d array, class: chemgaloo.reaction
+        reactions in file order, a reversible reaction gives forward and reverse reactions in a row
+    net: chemgaloo.network.network
+        network of chemicals and reactions, assembled from arrays directly
+    """
+    arrays = None
+    if cache:
+
+        cache = fname + '.npz' if cache is True else cache
+        digest = __digest__(fname)
+        arrays = __read_cache__(cache, digest)
+    if arrays is None:
+
+        arrays = __parse__(fname)
+        if cache:
+
+            __write_cache__(cache, arrays, digest)
+    return __build__(arrays, sparse = sparse, k_cache_size = k_cache_size, objects = objects)
+
+def dump(fname, chemicals = [], reactions = []):
+    """
+    write chemicals and reactions to a mechanism file, present concentrations are written as initial ones,
+    unnamed chemicals are named Chemical-1, Chemical-2, ...\n
+    Parameters:
+    ---
+    fname: str
+        mechanism file
+    chemicals: 1-d array, class: chemgaloo.chemical
+        all chemicals in reactions
+    reactions: 1-d array, class: chemgaloo.reaction
+        reactions written one per line
+    """
+    names = [ichemi.name or 'Chemical-{}'.format(idx_chemi+1) for idx_chemi, ichemi in enumerate(chemicals)]
+    for iname in names:
+
+        if (not iname) or re.search(r'[\s#!;=]', iname):
+
+            raise ValueError('species name {} cannot be written to mechanism file'.format(repr(iname)))
+    index = dict([(id(ichemi), iname) for ichemi, iname in zip(chemicals, names)])
+    term = lambda ichemi, isto: index[id(ichemi)] if isto == 1 else '{} {}'.format(repr(float(isto)), index[id(ichemi)])
+    with open(fname, 'w') as f:
+
+        f.write('SPECIES\n')
+        for ichemi, iname in zip(chemicals, names):
+
+            f.write('{} = {}\n'.format(iname, repr(float(ichemi.c))))
+        f.write('END\nREACTIONS\n')
+        for idx_rxn, irxn in enumerate(reactions):
+
+            for ichemi in list(irxn.rxtns) + list(irxn.prdts):
+
+                if id(ichemi) not in index:
+
+                    raise ValueError('chemical in reaction-{} is not in the chemicals list'.format(idx_rxn+1))
+            lhs = ' + '.join([term(ichemi, isto) for ichemi, isto in zip(irxn.rxtns, irxn.stois[:irxn.n_rxtns])])
+            rhs = ' + '.join([term(ichemi, isto) for ichemi, isto in zip(irxn.prdts, irxn.stois[irxn.n_rxtns:])])
+            params = ['k = {}'.format(repr(float(irxn.k)))]
+            rate_law = getattr(irxn, 'rate_law', 'constant')
+            if rate_law == 'arrhenius':
+
+                params += ['rate_law = arrhenius', 'A = {}'.format(repr(float(irxn.A))),
+                    'Ea = {}'.format(repr(float(irxn.Ea))), 'n = {}'.format(repr(float(irxn.n)))]
+            elif rate_law == 'eyring':
+
+                params += ['rate_law = eyring', 'barrier = {}'.format(repr(float(irxn.barrier)))]
+            if irxn.deltaH != 0:
+
+                params.append('deltaH = {}'.format(repr(float(irxn.deltaH))))
+            f.write('{} ; {}\n'.format('{} => {}'.format(lhs, rhs).strip(), ', '.join(params)))
+        f.write('END\n')
@@ -0,0 +1,769 @@
+"""
+Compiled reaction network of Chemgaloo
+"""
+from collections import OrderedDict
+import numpy as np
+
+# codes of reaction.rate_law
+__RATE_LAWS__ = {'constant': 0, 'arrhenius': 1, 'eyring': 2}
+
+def __csr__(rows, cols, vals, n_rows):
+
+    """
+    (indptr, indices, data) of CSR matrix from triplets, duplicated entries summed, zeros dropped, indices sorted
+    """
+    rows = np.asarray(rows, dtype = int)
+    cols = np.asarray(cols, dtype = int)
+    vals = np.asarray(vals, dtype = float)
+    n_cols = int(np.max(cols, initial = -1)) + 1
+    keys, idx_inv = np.unique(rows*n_cols + cols, return_inverse = True)
+    data = np.zeros(len(keys))
+    np.add.at(data, idx_inv.ravel(), vals)
+    keys, data = keys[data != 0], data[data != 0]
+    indptr = np.searchsorted(keys, np.arange(n_rows + 1)*n_cols) if n_cols else np.zeros(n_rows + 1, dtype = int)
+    return indptr, keys - (keys//max(n_cols, 1))*n_cols, data
+
+def __dense__(csr, shape):
+
+    indptr, indices, data = csr
+    dense = np.zeros(shape)
+    dense[np.repeat(np.arange(shape[0]), np.diff(indptr)), indices] = data
+    return dense
+
+def __gather__(indptr, idx):
+
+    """
+    positions in indices/data of all entries of CSR rows idx
+    """
+    idx = np.atleast_1d(np.asarray(idx, dtype = int))
+    n_nz = indptr[idx + 1] - indptr[idx]
+    return np.repeat(indptr[idx] - np.cumsum(n_nz) + n_nz, n_nz) + np.arange(np.sum(n_nz))
+
+class network:
+    """
+    Reaction network compiled from chemgaloo.chemical and chemgaloo.reaction objects into arrays\n
+    Attributes:
+    ---
+    chemicals: 1-d array, class: chemgaloo.chemical
+        chemicals in the same order as rows of stoi
+    reactions: 1-d array, class: chemgaloo.reaction
+        reactions in the same order as columns of stoi
+    stoi: 2-d array, float
+        net stoichiometry matrix, shape (n_species, n_reactions), negative for reactants and positive for products,
+        scipy.sparse.csr_matrix if compiled sparse
+    order: 2-d array, float
+        reactant-order matrix, shape (n_reactions, n_species), exponents used in mass-action rate,
+        scipy.sparse.csr_matrix if compiled sparse
+    incidence_indptr, incidence_indices: 1-d array, int
+        species-reaction incidence index in CSR form, rates of reactions
+        incidence_indices[incidence_indptr[i]:incidence_indptr[i+1]] depend on concentration of species i
+    change_indptr, change_indices, change_stoi: 1-d array
+        reaction j changes species change_indices[change_indptr[j]:change_indptr[j+1]] by change_stoi of
+        the same slice, CSR form of stoi transposed
+    k: 1-d array, float
+        rate constants, shape (n_reactions,)
+    k_cache_size: int
+        number of temperatures whose rate constants are memoized by k_at, least recently used ones are dropped
+    """
+    def __init__(self, chemicals = [], reactions = [], sparse = False, k_cache_size = 128):
+
+        self.chemicals = list(chemicals)
+        self.reactions = list(reactions)
+        self.n_species = len(self.chemicals)
+        self.n_reactions = len(self.reactions)
+        self.sparse = sparse
+
+        index = {}
+        for idx_chemi in range(self.n_species):
+
+            index[id(self.chemicals[idx_chemi])] = idx_chemi
+        self.index = index
+
+        # entries of stoichiometry and order matrices are gathered as triplets, a sparse network never
+        # allocates a dense (n_species, n_reactions) matrix
+        s_rows, s_cols, s_vals = [], [], []
+        o_rows, o_cols, o_vals = [], [], []
+        for idx_rxn in range(self.n_reactions):
+
+            irxn = self.reactions[idx_rxn]
+            for idx_rxtn in range(irxn.n_rxtns):
+
+                idx_chemi = self.__locate__(irxn.rxtns[idx_rxtn], idx_rxn)
+                s_rows.append(idx_chemi)
+                s_cols.append(idx_rxn)
+                s_vals.append(-irxn.stois[idx_rxtn])
+                o_rows.append(idx_rxn)
+                o_cols.append(idx_chemi)
+                o_vals.append(irxn.stois[idx_rxtn])
+            for idx_prdt in range(irxn.n_prdts):
+
+                s_rows.append(self.__locate__(irxn.prdts[idx_prdt], idx_rxn))
+                s_cols.append(idx_rxn)
+                s_vals.append(irxn.stois[irxn.n_rxtns + idx_prdt])
+        self.__assemble__((s_rows, s_cols, s_vals), (o_rows, o_cols, o_vals))
+        self.k = np.zeros(self.n_reactions)
+        self.k_cache_size = k_cache_size
+        self.update_k()
+
+    def __assemble__(self, stoi_triplets, order_triplets):
+
+        """
+        build stoichiometry, orders, padded reactant table and incidence index from (rows, cols, values)
+        triplets of stoi and order, duplicated entries are summed
+        """
+        s_rows, s_cols, s_vals = [np.asarray(iarr) for iarr in stoi_triplets]
+        o_rows, o_cols, o_vals = [np.asarray(iarr) for iarr in order_triplets]
+        stoi_csr = __csr__(s_rows, s_cols, s_vals, self.n_species)
+        order_csr = __csr__(o_rows, o_cols, o_vals, self.n_reactions)
+        if self.sparse:
+
+            from scipy.sparse import csr_matrix
+            self.stoi = csr_matrix(stoi_csr[::-1], shape = (self.n_species, self.n_reactions))
+            self.order = csr_matrix(order_csr[::-1], shape = (self.n_reactions, self.n_species))
+        else:
+
+            self.stoi = __dense__(stoi_csr, (self.n_species, self.n_reactions))
+            self.order = __dense__(order_csr, (self.n_reactions, self.n_species))
+        # incidence index: reactions whose rates read species i, and species changed by reaction j with
+        # their net stoichiometry, CSR arrays of nnz entries
+        self.incidence_indptr, self.incidence_indices, _ = __csr__(o_cols, o_rows, o_vals, self.n_species)
+        self.change_indptr, self.change_indices, self.change_stoi = __csr__(s_cols, s_rows, s_vals, self.n_reactions)
+        self.__dependency__ = None
+        # reactants of each reaction gathered in a padded table, so that rate evaluation only
+        # touches nonzero orders, padding entries have order 0 and contribute a factor of 1
+        o_indptr, o_indices, o_data = order_csr
+        n_nz = np.diff(o_indptr)
+        n_pad = max(1, int(np.max(n_nz, initial = 0)))
+        o_rows = np.repeat(np.arange(self.n_reactions), n_nz)
+        o_pos = np.arange(len(o_indices)) - o_indptr[o_rows]
+        self.__rxtn_idx__ = np.zeros((self.n_reactions, n_pad), dtype = int)
+        self.__rxtn_ord__ = np.zeros((self.n_reactions, n_pad))
+        self.__rxtn_idx__[o_rows, o_pos] = o_indices
+        self.__rxtn_ord__[o_rows, o_pos] = o_data
+        # nonzero entries of dr/dc in the padded table
+        self.__drdc_mask__ = self.__rxtn_ord__ > 0
+        self.__drdc_rows__ = np.nonzero(self.__drdc_mask__)[0]
+        self.__drdc_cols__ = self.__rxtn_idx__[self.__drdc_mask__]
+
+    def __setstate__(self, state):
+
+        # index is keyed by id of chemicals, which changes after unpickling, e.g. in worker processes
+        self.__dict__.update(state)
+        self.index = {}
+        for idx_chemi in range(self.n_species):
+
+            self.index[id(self.chemicals[idx_chemi])] = idx_chemi
+
+    def __locate__(self, chemi, idx_rxn):
+
+        try:
+            return self.index[id(chemi)]
+        except KeyError:
+            raise ValueError(
+                'chemical in reaction-{} is not in the chemicals list of network'.format(idx_rxn+1)
+                )
+
+    def update_k(self):
+        """
+        refresh rate constant vector and rate law parameters from reaction objects, call it after modifying
+        any reaction.k or rate law, memoized k_at are dropped
+        """
+        self.__law__ = np.zeros(self.n_reactions, dtype = int)
+        self.__law_params__ = np.zeros((4, self.n_reactions))
+        for idx_rxn in range(self.n_reactions):
+
+            irxn = self.reactions[idx_rxn]
+            self.k[idx_rxn] = irxn.k
+            rate_law = getattr(irxn, 'rate_law', 'constant')
+            if rate_law not in __RATE_LAWS__:
+
+                raise ValueError('unknown rate law of reaction-{}: {}'.format(idx_rxn+1, rate_law))
+            self.__law__[idx_rxn] = __RATE_LAWS__[rate_law]
+            self.__law_params__[:, idx_rxn] = [
+                getattr(irxn, 'A', 0.), getattr(irxn, 'Ea', 0.), getattr(irxn, 'n', 0.), getattr(irxn, 'barrier', 0.)
+                ]
+        self.__k_cache__ = OrderedDict()
+        return self.k
+
+    def __k_of_T__(self, temperature):
+
+        from chemgaloo import R, kb, h
+        T = np.asarray(temperature, dtype = float)[..., np.newaxis]
+        A, Ea, n, barrier = self.__law_params__
+        with np.errstate(over = 'ignore', divide = 'ignore', invalid = 'ignore'):
+
+            k_arrhenius = A * T**n * np.exp(-Ea/(R*T))
+            k_eyring = kb*T/h * np.exp(-barrier/(R*T))
+        return np.where(self.__law__ == 1, k_arrhenius, np.where(self.__law__ == 2, k_eyring, self.k))
+
+    def dlnk_dT(self, temperature):
+        """
+        temperature derivatives of logarithms of rate constants, Ea/(R*T^2) + n/T for 'arrhenius',
+        1/T + barrier/(R*T^2) for 'eyring' and 0 for 'constant', shape (..., n_reactions)
+        """
+        from chemgaloo import R
+        T = np.asarray(temperature, dtype = float)[..., np.newaxis]
+        A, Ea, n, barrier = self.__law_params__
+        return np.where(
+            self.__law__ == 1, Ea/(R*T**2) + n/T, np.where(self.__law__ == 2, 1/T + barrier/(R*T**2), 0.)
+            )
+
+    def k_at(self, temperature, cache = True):
+        """
+        rate constants of all reactions at temperature, evaluated vectorized over reactions, see reaction.k_at.
+        For a single temperature the result is memoized in a least-recently-used cache, so temperature
+        programs revisiting temperatures do not recompute exponentials\n
+        Parameters:
+        ---
+        temperature: float or array
+            temperature in K, an array of shape (...) gives rate constants of shape (..., n_reactions)
+        cache: bool
+            if memoize result, temperatures that are met only once, e.g. integrated temperature of
+            non-isothermal reactor, should not fill the cache
+        Return:
+        ---
+        k: array, float
+            rate constants, read-only for a single temperature
+        """
+        if (np.ndim(temperature) > 0) or (not cache):
+
+            return self.__k_of_T__(temperature)
+        key = float(temperature)
+        cache = self.__k_cache__
+        if key in cache:
+
+            cache.move_to_end(key)
+            return cache[key]
+        k = self.__k_of_T__(key)
+        k.flags.writeable = False
+        cache[key] = k
+        if len(cache) > self.k_cache_size:
+
+            cache.popitem(last = False)
+        return k
+
+    def conservation_laws(self, tol = 1e-9):
+        """
+        linear conservation laws of the network, L @ c stays constant for any rates because L @ stoi = 0.
+        Rows of L span the left null space of stoi and are brought to reduced row echelon form, so every law
+        has one dependent chemical with coefficient 1 that appears in no other law, computed once and cached\n
+        Parameters:
+        ---
+        tol: float
+            coefficients smaller than tol are taken as zero
+        Return:
+        ---
+        L: 2-d array, float
+            conservation laws, shape (n_laws, n_species)
+        idx_dep: 1-d array, int
+            index of dependent chemical of every law
+        idx_ind: 1-d array, int
+            indices of independent chemicals, the state that reduced integration runs over
+        """
+        if getattr(self, '__conservation__', None) is not None:
+
+            return self.__conservation__
+        from scipy.linalg import null_space, qr
+        if not self.n_reactions:
+
+            L = np.eye(self.n_species)
+        elif not self.sparse:
+
+            L = null_space(self.stoi.T, rcond = tol).T
+        else:
+            # stoi.T = Q @ R by QR over blocks of reactions, R has the singular values of stoi and the same null
+            # space, dense blocks are at most (2*n_species, n_species)
+            stoi_t = self.stoi.T.tocsr()
+            R = np.zeros((0, self.n_species))
+            for idx_rxn in range(0, self.n_reactions, max(self.n_species, 1)):
+
+                R = qr(np.vstack((R, stoi_t[idx_rxn:idx_rxn + self.n_species].toarray())), mode = 'r')[0]
+                R = R[:self.n_species]
+            L = null_space(R, rcond = tol).T
+        # Gauss-Jordan elimination with partial pivoting, pivot columns become dependent chemicals
+        idx_dep = []
+        for idx_col in range(self.n_species):
+
+            irow = len(idx_dep)
+            if irow == len(L):
+
+                break
+            idx_pivot = irow + np.argmax(np.abs(L[irow:, idx_col]))
+            if abs(L[idx_pivot, idx_col]) < tol:
+
+                continue
+            L[[irow, idx_pivot]] = L[[idx_pivot, irow]]
+            L[irow] /= L[irow, idx_col]
+            others = np.arange(len(L)) != irow
+            L[others] -= np.outer(L[others, idx_col], L[irow])
+            idx_dep.append(idx_col)
+        L[np.abs(L) < tol] = 0.
+        idx_dep = np.array(idx_dep, dtype = int)
+        idx_ind = np.setdiff1d(np.arange(self.n_species), idx_dep)
+        self.__conservation__ = (L, idx_dep, idx_ind)
+        return self.__conservation__
+
+    def totals(self, c):
+        """
+        conserved totals L @ c of concentrations c, shape (..., n_laws), see conservation_laws
+        """
+        L = self.conservation_laws()[0]
+        return np.asarray(c, dtype = float) @ L.T
+
+    def expand(self, x, totals):
+        """
+        rebuild all concentrations from independent ones x, shape (..., n_independent), and conserved totals,
+        shape (..., n_laws), dependent chemicals are c_dep = totals - L[:, idx_ind] @ x
+        """
+        L, idx_dep, idx_ind = self.conservation_laws()
+        x = np.asarray(x, dtype = float)
+        c = np.empty(x.shape[:-1] + (self.n_species,))
+        c[..., idx_ind] = x
+        c[..., idx_dep] = totals - x @ L[:, idx_ind].T
+        return c
+
+    def c0(self):
+        """
+        read present concentrations of chemicals into a new 1-d array
+        """
+        return np.array([ichemi.c for ichemi in self.chemicals], dtype = float)
+
+    def load(self, c, save_state = True):
+        """
+        write concentrations back to chemicals and reactions' cache, so that objects
+        are in the same state as after the same steps of reaction.go()
+        Parameters:
+        ---
+        c: 1-d array, float
+            concentrations of chemicals
+        save_state: bool
+            if also refresh reaction.__c_bak__, can be skipped when only chemical.c is read
+        """
+        for idx_chemi in range(self.n_species):
+
+            self.chemicals[idx_chemi].c = float(c[idx_chemi])
+        if save_state:
+
+            for irxn in self.reactions:
+
+                irxn.__save_state__()
+
+    def rate(self, c, k = None):
+        """
+        vectorized mass-action rates r = k * prod(c**order)\n
+        Parameters:
+        ---
+        c: array, float
+            concentrations, shape (..., n_species)
+        k: array, float
+            rate constants, shape (..., n_reactions), if not given, self.k will be used
+        Return:
+        ---
+        r: array, float
+            rates of all reactions, shape (..., n_reactions)
+        """
+        if k is None:
+
+            k = self.k
+        c = np.asarray(c, dtype = float)
+        return k * np.prod(c[..., self.__rxtn_idx__]**self.__rxtn_ord__, axis = -1)
+
+    def dependency_graph(self):
+        """
+        reaction dependency graph in CSR form, built once: when reaction j occurs, rates of reactions
+        indices[indptr[j]:indptr[j+1]] change, j itself included\n
+        Return:
+        ---
+        indptr, indices: 1-d array, int
+        """
+        if self.__dependency__ is None:
+
+            n_nz = np.diff(self.change_indptr)
+            rows = np.repeat(np.arange(self.n_reactions), n_nz)
+            # every (reaction j, changed species i) pair expands to the reactions reading i
+            n_read = np.diff(self.incidence_indptr)[self.change_indices]
+            rows = np.concatenate((np.repeat(rows, n_read), np.arange(self.n_reactions)))
+            cols = np.concatenate((
+                self.incidence_indices[__gather__(self.incidence_indptr, self.change_indices)],
+                np.arange(self.n_reactions)
+                ))
+            indptr, indices, _ = __csr__(rows, cols, np.ones(len(rows)), self.n_reactions)
+            self.__dependency__ = (indptr, indices)
+        return self.__dependency__
+
+    def __rate_factors__(self, c, k = None):
+
+        """
+        derivatives of rates with respect to every reactant in the padded reactant table,
+        dr_j/dc_i = k_j * o_ji * c_i**(o_ji - 1) * prod_{l != i} c_l**o_jl, shape (..., n_reactions, n_pad)
+        """
+        if k is None:
+
+            k = self.k
+        c = np.asarray(c, dtype = float)
+        c_rxtn = c[..., self.__rxtn_idx__]
+        factors = c_rxtn**self.__rxtn_ord__
+        # exclusive prefix and suffix products give the product of all other reactants without division
+        ones = np.ones(factors.shape[:-1] + (1,))
+        left = np.cumprod(np.concatenate((ones, factors[..., :-1]), axis = -1), axis = -1)
+        right = np.cumprod(np.concatenate((ones, factors[..., :0:-1]), axis = -1), axis = -1)[..., ::-1]
+        d_factors = self.__rxtn_ord__ * c_rxtn**np.maximum(self.__rxtn_ord__ - 1, 0)
+        return np.asarray(k)[..., np.newaxis] * d_factors * left * right
+
+    def __jac_pattern__(self):
+
+        """
+        build and cache the sparsity pattern of the Jacobian, J.data = __jac_map__ @ drdc.data
+        """
+        if hasattr(self, '__jac_map__'):
+
+            return
+        from scipy.sparse import csc_matrix, csr_matrix
+        d_rows = self.__drdc_rows__
+        d_cols = self.__drdc_cols__
+        stoi = csc_matrix(self.stoi)
+        stoi.sort_indices()
+        # pair every entry of dr/dc (reaction j, species i) with every species changed by reaction j
+        n_hit = np.diff(stoi.indptr)[d_rows]
+        idx_entry = np.repeat(np.arange(len(d_rows)), n_hit)
+        offset = np.arange(len(idx_entry)) - np.repeat(np.cumsum(n_hit) - n_hit, n_hit)
+        idx_stoi = stoi.indptr[d_rows][idx_entry] + offset
+        j_rows = stoi.indices[idx_stoi]
+        j_cols = d_cols[idx_entry]
+        keys, idx_nz = np.unique(j_rows*self.n_species + j_cols, return_inverse = True)
+        self.__jac_indices__ = keys % self.n_species
+        self.__jac_indptr__ = np.searchsorted(keys//self.n_species, np.arange(self.n_species + 1))
+        self.__jac_map__ = csr_matrix(
+            (stoi.data[idx_stoi], (idx_nz, idx_entry)), shape = (len(keys), len(d_rows))
+            )
+
+    def jacobian(self, c, k = None, sparse = None):
+        """
+        analytic Jacobian of mass-action rate equations, J = d(dc/dt)/dc = stoi @ dr/dc\n
+        Parameters:
+        ---
+        c: array, float
+            concentrations, shape (n_species,), or (..., n_species) for dense Jacobian
+        k: array, float
+            rate constants, if not given, self.k will be used
+        sparse: bool
+            if return scipy.sparse.csr_matrix, sparsity pattern is built once and cached,
+            if not given, follow the sparse option the network is compiled with
+        Return:
+        ---
+        jac: 2-d array, float
+            jac[i, j] = d(dc_i/dt)/dc_j, shape (..., n_species, n_species) when dense
+        """
+        if sparse is None:
+
+            sparse = self.sparse
+        drdc = self.__rate_factors__(c, k = k)
+        if sparse:
+
+            from scipy.sparse import csr_matrix
+            self.__jac_pattern__()
+            return csr_matrix(
+                (self.__jac_map__ @ drdc[self.__drdc_mask__], self.__jac_indices__, self.__jac_indptr__),
+                shape = (self.n_species, self.n_species)
+                )
+        if not self.sparse:
+
+            return self.stoi @ self.rate_jacobian(c, k = k)
+        # dense Jacobian of sparse network is scattered from the cached pattern, stoi is never expanded
+        self.__jac_pattern__()
+        drdc = drdc[..., self.__drdc_mask__]
+        jac_data = (self.__jac_map__ @ drdc.reshape(-1, drdc.shape[-1]).T).T
+        jac = np.zeros(drdc.shape[:-1] + (self.n_species, self.n_species))
+        jac_rows = np.repeat(np.arange(self.n_species), np.diff(self.__jac_indptr__))
+        jac[..., jac_rows, self.__jac_indices__] = jac_data.reshape(drdc.shape[:-1] + (-1,))
+        return jac
+
+    def rate_jacobian(self, c, k = None):
+        """
+        derivatives of rates with respect to concentrations, dr_j/dc_i, shape (..., n_reactions, n_species)
+        """
+        drdc = self.__rate_factors__(c, k = k)
+        drdc_full = np.zeros(drdc.shape[:-2] + (self.n_reactions, self.n_species))
+        drdc_full[..., self.__drdc_rows__, self.__drdc_cols__] = drdc[..., self.__drdc_mask__]
+        return drdc_full
+
+    def __stoi_times__(self, r):
+
+        """
+        stoi_ij * r_j, shape (..., n_species, n_reactions), scipy.sparse.csr_matrix for a single r if compiled
+        sparse, a batch of r on sparse network is scattered from nonzeros of stoi
+        """
+        r = np.asarray(r, dtype = float)
+        if not self.sparse:
+
+            return self.stoi * r[..., np.newaxis, :]
+        if r.ndim == 1:
+
+            return self.stoi.multiply(r).tocsr()
+        stoi = self.stoi.tocoo()
+        out = np.zeros(r.shape[:-1] + (self.n_species, self.n_reactions))
+        out[..., stoi.row, stoi.col] = stoi.data * r[..., stoi.col]
+        return out
+
+    def jacobian_k(self, c):
+        """
+        derivatives of dc/dt with respect to rate constants, d(dc_i/dt)/dk_j = stoi_ij * prod(c**order_j),
+        shape (..., n_species, n_reactions), scipy.sparse.csr_matrix for a single state if compiled sparse
+        """
+        return self.__stoi_times__(self.rate(c, k = np.ones(self.n_reactions)))
+
+    def dcdt(self, c, k = None):
+        """
+        time derivative of concentrations dc/dt = stoi @ r(c), shape the same as c
+        """
+        r = self.rate(c, k = k)
+        if r.ndim == 1:
+
+            return self.stoi @ r
+        # batch of states, (..., n_reactions) -> (..., n_species)
+        return (self.stoi @ r.reshape(-1, self.n_reactions).T).T.reshape(
+            r.shape[:-1] + (self.n_species,)
+            )
+
+class detector_set:
+    """
+    Detectors compiled into index arrays and threshold vectors, all detectors are evaluated by one
+    vectorized comparison per step, on a single state (n_species,) or a batch of cases (n_cases, n_species).
+    Every detector is split into signals s = c_num/c_den, where c is extended with [1, time, temperature], so that
+    concentrations, ratios, time and temperature share the same gather. A state with n_species + 1 columns
+    carries temperature in its last column, as in non-isothermal reactor, otherwise temperature is nan\n
+    Attributes:
+    ---
+    if_print, if_quench, if_record: 1-d array, bool
+        motions of detectors decoded ahead of time: 'record' and 'quench' act if they appear in motion,
+        and state report is printed unless motion contains 'silent'
+    """
+    def __init__(self, detectors = [], index = {}, n_species = 0):
+
+        self.n_detectors = len(detectors)
+        self.n_species = n_species
+        idx_one = n_species
+        idx_time = n_species + 1
+        idx_temp = n_species + 2
+        num, den, value, scale, is_time, owner = [], [], [], [], [], []
+        for idx_detector in range(self.n_detectors):
+
+            idetector = detectors[idx_detector]
+            if (idetector.attr == 'c') and (idetector.mode == 'isolated'):
+
+                for idx_chemi in range(len(idetector.detect)):
+
+                    num.append(index[id(idetector.detect[idx_chemi])])
+                    den.append(idx_one)
+                    value.append(idetector.value[idx_chemi])
+                    is_time.append(False)
+            elif (idetector.attr == 'c') and (idetector.mode == 'ratio'):
+
+                num.append(index[id(idetector.detect[0])])
+                den.append(index[id(idetector.detect[1])])
+                value.append(idetector.value[0])
+                is_time.append(False)
+            elif idetector.attr == 'time':
+
+                num.append(idx_time)
+                den.append(idx_one)
+                value.append(idetector.value[0])
+                is_time.append(True)
+            elif idetector.attr == 'temp':
+
+                num.append(idx_temp)
+                den.append(idx_one)
+                value.append(idetector.value[0])
+                is_time.append(False)
+            else:
+                # not implemented signals never hit
+                num.append(idx_one)
+                den.append(idx_one)
+                value.append(np.nan)
+                is_time.append(False)
+            while len(scale) < len(num):
+
+                scale.append(10.0**idetector.ndigits)
+                owner.append(idx_detector)
+        self.num = np.array(num, dtype = int)
+        self.den = np.array(den, dtype = int)
+        self.value = np.array(value, dtype = float)
+        self.scale = np.array(scale, dtype = float)
+        self.is_time = np.array(is_time, dtype = bool)
+        self.owner = np.array(owner, dtype = int)
+        # signals of one detector are contiguous
+        self.__starts__ = np.searchsorted(self.owner, np.arange(self.n_detectors))
+        self.__if_single__ = len(self.owner) == self.n_detectors
+        self.__if_time__ = bool(np.any(self.is_time))
+        self.__ext__ = np.ones(n_species + 3)
+        motions = [idetector.motion for idetector in detectors]
+        self.if_record = np.array(['record' in imotion for imotion in motions], dtype = bool)
+        self.if_quench = np.array(['quench' in imotion for imotion in motions], dtype = bool)
+        self.if_print = np.array(['silent' not in imotion for imotion in motions], dtype = bool)
+
+    def __extend__(self, c, time):
+
+        c = np.asarray(c, dtype = float)
+        if c.ndim == 1:
+            # single state, reuse buffer so that the per-step loop does not allocate
+            ext = self.__ext__
+        else:
+
+            ext = np.empty(c.shape[:-1] + (self.n_species + 3,))
+            ext[..., self.n_species] = 1.0
+        ext[..., :self.n_species] = c[..., :self.n_species]
+        ext[..., self.n_species + 1] = time
+        ext[..., self.n_species + 2] = c[..., self.n_species] if c.shape[-1] > self.n_species else np.nan
+        return ext
+
+    def turn_on(self, c, time = 0.):
+        """
+        vectorized chemgaloo.detector.turn_on of all detectors, a concentration or ratio signal hits when
+        round(abs(signal - value), ndigits) == 0 (temperature signals likewise), evaluated without division as
+        abs(c_num - value*c_den)*10**ndigits <= 0.5*abs(c_den), a time signal hits when time > value\n
+        Return:
+        ---
+        hits: array, bool
+            shape (..., n_detectors)
+        """
+        if self.n_detectors == 0:
+
+            return np.zeros(np.shape(c)[:-1] + (0,), dtype = bool)
+        ext = self.__extend__(c, time)
+        c_den = ext[..., self.den]
+        g = ext[..., self.num] - self.value*c_den
+        hit = np.abs(g)*self.scale <= 0.5*np.abs(c_den)
+        if self.__if_time__:
+
+            hit = np.where(self.is_time, g > 0, hit)
+        if self.__if_single__:
+
+            return hit
+        return np.logical_or.reduceat(hit, self.__starts__, axis = -1)
+
+    def event(self, c, time = 0.):
+        """
+        vectorized continuous event functions of all signals, c_num - value*c_den, a detector is reached where
+        its signal changes sign: c_i - value_i for 'isolated', c_i - value*c_j for 'ratio' (sign of c_i/c_j - value),
+        time - value for 'time' and temperature - value for 'temp', temperature signals are nan if state carries
+        no temperature\n
+        Return:
+        ---
+        g: array, float
+            shape (..., n_signals), nan for signals not implemented
+        """
+        ext = self.__extend__(c, time)
+        return ext[..., self.num] - self.value*ext[..., self.den]
+
+    def locate(self, g0, t0, c0, f0, g1, t1, c1, f1):
+        """
+        find signals changing sign within step [t0, t1] and locate crossing times by root-finding on
+        cubic Hermite dense output\n
+        Return:
+        ---
+        t_hits: 1-d array, float
+            earliest crossing time of each detector, nan if not hit
+        """
+        from __integrator__ import hermite, locate
+        t_hits = np.full(self.n_detectors, np.nan)
+        crossing = np.isfinite(g0) & np.isfinite(g1) & (g0 != 0) & (np.sign(g0) != np.sign(g1))
+        for idx_signal in np.nonzero(crossing)[0]:
+
+            t_hit = locate(
+                lambda t: self.event(hermite(t0, c0, f0, t1, c1, f1, t), t)[idx_signal],
+                t0, t1, g0[idx_signal], g1[idx_signal]
+                )
+            idx_detector = self.owner[idx_signal]
+            t_hits[idx_detector] = np.fmin(t_hits[idx_detector], t_hit)
+        return t_hits
+
+def compile_detectors(detectors = [], net = None, chemicals = []):
+    """
+    compile detectors into a chemgaloo detector_set\n
+    Parameters:
+    ---
+    detectors: 1-d array, class: chemgaloo.detector
+        detectors to compile
+    net: chemgaloo.network.network
+        network whose species order is used, if not given, order of chemicals is used
+    chemicals: 1-d array, class: chemgaloo.chemical
+        species order when net is not given
+    """
+    if net is not None:
+
+        return detector_set(detectors, net.index, net.n_species)
+    index = {}
+    for idx_chemi in range(len(chemicals)):
+
+        index[id(chemicals[idx_chemi])] = idx_chemi
+    return detector_set(detectors, index, len(chemicals))
+
+def assemble(
+    chemicals = [], reactions = [], stoi_triplets = ([], [], []), order_triplets = ([], [], []), k = [],
+    law = None, law_params = None, sparse = False, k_cache_size = 128
+):
+    """
+    build a network directly from arrays without walking through reaction objects, e.g. for mechanisms
+    loaded by chemgaloo.mechanism.load, arrays should describe the same network as chemicals and reactions\n
+    Parameters:
+    ---
+    chemicals, reactions:
+        see compile, reactions may be empty when law is given, then the network only works on arrays,
+        e.g. in chemgaloo.reactor.bstr_sweep, and network.load does not refresh reactions
+    stoi_triplets, order_triplets: tuple
+        (rows, cols, values) of entries of stoi and order, duplicated entries are summed
+    k: 1-d array, float
+        rate constants
+    law: 1-d array, int
+        codes of rate laws (see __RATE_LAWS__), if not given, read from reactions by network.update_k
+    law_params: 2-d array, float
+        A, Ea, n and barrier of all reactions, shape (4, n_reactions)
+    sparse, k_cache_size:
+        see compile
+    Return:
+    ---
+    net: chemgaloo.network.network
+        compiled network
+    """
+    net = network.__new__(network)
+    net.chemicals = list(chemicals)
+    net.reactions = list(reactions)
+    net.k = np.array(k, dtype = float)
+    net.n_species = len(net.chemicals)
+    net.n_reactions = len(net.k)
+    net.sparse = sparse
+    net.index = {}
+    for idx_chemi in range(net.n_species):
+
+        net.index[id(net.chemicals[idx_chemi])] = idx_chemi
+    net.__assemble__(stoi_triplets, order_triplets)
+    net.k_cache_size = k_cache_size
+    if law is None:
+
+        net.update_k()
+    else:
+
+        net.__law__ = np.array(law, dtype = int)
+        net.__law_params__ = np.array(law_params, dtype = float)
+        net.__k_cache__ = OrderedDict()
+    return net
+
+def compile(chemicals = [], reactions = [], sparse = False, k_cache_size = 128):
+    """
+    compile chemicals and reactions into a chemgaloo network\n
+    Parameters:
+    ---
+    chemicals: 1-d array, class: chemgaloo.chemical
+        all chemicals in reactor, every chemical used in reactions must be included
+    reactions: 1-d array, class: chemgaloo.reaction
+        all possible reactions in reactor
+    sparse: bool
+        if store stoichiometry matrix as scipy.sparse.csr_matrix, recommended for large mechanisms
+    k_cache_size: int
+        number of temperatures memoized by network.k_at
+    Return:
+    ---
+    net: chemgaloo.network.network
+        compiled network
+    """
+    return network(chemicals = chemicals, reactions = reactions, sparse = sparse, k_cache_size = k_cache_size)
@@ -0,0 +1,138 @@
+"""
+Parallel execution library of Chemgaloo
+"""
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import __reactor__ as reactor
+
+# network and detectors of present worker process, set once by __worker_init__
+__WORKER_STATE__ = {}
+
+def __worker_init__(payload):
+
+    """
+    unpickle network and detectors once per worker process, objects referenced by both are
+    unpickled together so detectors still find their chemicals in network.index
+    """
+    __WORKER_STATE__.update(pickle.loads(payload))
+
+def __worker_sweep__(task):
+
+    ks, c0s, options = task
+    return reactor.__bstr_sweep_cases__(
+        __WORKER_STATE__['net'], ks, c0s, detectors = __WORKER_STATE__['detectors'], **options
+        )
+
+def __chunks__(n_cases, n_workers, chunk_size):
+
+    if chunk_size is None:
+
+        chunk_size = max(1, -(-n_cases//n_workers))
+    return [(i, min(i + chunk_size, n_cases)) for i in range(0, n_cases, chunk_size)]
+
+def __stack_logs__(logs, n_time, fill = np.nan):
+
+    """
+    pad logs of chunks quenched at different steps to the same length and stack along cases
+    """
+    stacked = []
+    for ilog in logs:
+
+        pad = np.full((n_time - len(ilog),) + ilog.shape[1:], fill)
+        stacked.append(np.concatenate((ilog, pad)))
+    return np.concatenate(stacked, axis = 1)
+
+def __align_logs__(times, logs, fill = np.nan):
+
+    """
+    place rows of chunks on the union of their time points and stack along cases, a chunk quenched early
+    ends with a row off the record_every grid, which must not be shifted onto a time of another chunk
+    """
+    time = np.unique(np.concatenate([np.asarray(itime, dtype = float) for itime in times]))
+    stacked = []
+    for itime, ilog in zip(times, logs):
+
+        aligned = np.full((len(time),) + ilog.shape[1:], fill)
+        aligned[np.searchsorted(time, itime)] = ilog
+        stacked.append(aligned)
+    return time, np.concatenate(stacked, axis = 1)
+
+def bstr_sweep(
+    net,
+    params = {},
+    n_workers = None,
+    chunk_size = None,
+    dt = 0.01,
+    nstep = 1000,
+    detectors = [],
+    integrator = 'euler',
+    rtol = 1e-6,
+    atol = 1e-9,
+    record_every = 1,
+    record_times = None,
+    temperature = None
+):
+    """
+    Parallel chemgaloo.reactor.bstr_sweep: split cases into chunks and run them in worker processes\n
+    Parameters:
+    ---
+    net: chemgaloo.network.network
+        compiled network, pickled once and shipped to every worker together with detectors
+    params: dict
+        sweep parameters, see chemgaloo.reactor.bstr_sweep
+    n_workers: int
+        number of worker processes, if not given, number of cpus
+    chunk_size: int
+        number of cases integrated in lockstep by one task, if not given, cases are evenly
+        split over workers
+    dt, nstep, detectors, integrator, rtol, atol, record_every, record_times, temperature:
+        see chemgaloo.reactor.bstr_sweep, sinks are not supported across processes
+    Return:
+    ---
+    time: 1-d or 2-d array
+        for integrator 'euler' or given record_times, union of time points of all chunks, for adaptive integrators
+        every chunk chooses its own steps, then time[index_of_time][index_of_case], padded with nan
+    chem_c_log: 3-d array, float
+        chem_c_log[index_of_time][index_of_case][index_of_chemical], in the same order as params,
+        nan where a case has no recorded point at that time
+    if_expire: 1-d array, bool
+        for each case, turn to False if it is quenched by detector
+    detector_record: 2-d array
+        time points recorded by detectors: detector_record[index_of_case]
+    """
+    if n_workers is None:
+
+        n_workers = os.cpu_count()
+    ks, c0s = reactor.__sweep_cases__(net, params, temperature = temperature)
+    options = {
+        'dt': dt, 'nstep': nstep, 'integrator': integrator, 'rtol': rtol, 'atol': atol,
+        'record_every': record_every, 'record_times': record_times
+        }
+    tasks = [(ks[i:j], c0s[i:j], options) for i, j in __chunks__(len(ks), n_workers, chunk_size)]
+    payload = pickle.dumps({'net': net, 'detectors': detectors})
+
+    with ProcessPoolExecutor(
+        max_workers = n_workers, initializer = __worker_init__, initargs = (payload,)
+        ) as executor:
+
+        results = list(executor.map(__worker_sweep__, tasks))
+
+    if_expire = np.concatenate([iresult[2] for iresult in results])
+    detector_record = []
+    for iresult in results:
+
+        detector_record += iresult[3]
+    if (integrator == 'euler') or (record_times is not None):
+        # same time grid, rows are matched by time, chunks without a row at some time get nan
+        time, chem_c_log = __align_logs__([iresult[0] for iresult in results], [iresult[1] for iresult in results])
+    else:
+
+        n_time = max([len(iresult[0]) for iresult in results])
+        chem_c_log = __stack_logs__([iresult[1] for iresult in results], n_time)
+        time = __stack_logs__(
+            [np.tile(np.asarray(iresult[0])[:, np.newaxis], (1, len(iresult[2]))) for iresult in results],
+            n_time
+            )
+    return time, chem_c_log, if_expire, detector_record
@@ -1,6 +1,57 @@
 """
 Reactor library of Chemgaloo
 """
+import numpy as np
+import __network__ as network
+import __integrator__ as ode
+from __trajectory__ import trajectory, recorder
+
+def __log_capacity__(nstep = 1000, integrator = 'euler', record_every = 1, record_times = None):
+
+    """
+    number of time points to preallocate, adaptive integrators usually need far fewer steps than nstep,
+    their trajectory grows on demand
+    """
+    if record_times is not None:
+
+        return len(record_times) + 1
+    n_log = nstep//max(1, record_every) + 2
+    return n_log if integrator == 'euler' else min(n_log, 1024)
+
+def __bstr_report__(logger, istep, t, c, ks, c_unit = 'mol/L', t_unit = 'second', temperature = None):
+
+    """
+    state report of bstr when detectors with printing motions are activated
+    """
+    lines = ['CHEMGALOO| ...', '='*40+'\n'+'DETECTOR(S) ACTIVATED, STATE REPORT']
+    lines.append('Simulation step = {}, time = {} {}'.format(istep, t, t_unit))
+    if temperature is not None:
+        lines.append('Temperature = {} K'.format(temperature))
+    lines.append('-'*40+'\nConcentration(s):')
+    for idx_chemi in range(len(c)):
+        lines.append('Chemical-{}, c = {} {}'.format(idx_chemi+1, c[idx_chemi], c_unit))
+    lines.append('Reaction rate constant(s):')
+    for idx_rxn in range(len(ks)):
+        lines.append('Reaction-{}, k = {}'.format(idx_rxn+1, ks[idx_rxn]))
+    lines.append('='*40)
+    logger('\n'.join(lines))
+
+def __bstr_go_steps__(reactions = [], dt = 0.01, nstep = 1000):
+
+    """
+    original explicit Euler stepping by calling reaction.go() of every reaction, yields in the same
+    way as chemgaloo.integrator.integrate but concentrations are only updated in chemical objects
+    """
+    for istep in range(nstep):
+        # accumulate change of concentration of each chemical by iteratively calling reactions
+        for irxn in reactions:
+
+            irxn.go(dt = dt, mode = 'BSTR')
+        # save final concentrations to each reaction's self.__c_bak___
+        for irxn in reactions:
+
+            irxn.__save_state__()
+        yield (istep + 1)*dt, None
 
 def bstr(
     chemicals = [],
@@ -9,7 +60,24 @@ def bstr(
     dt = 0.01,
     nstep = 1000,
     t_unit = 'second',
-    detectors = []
+    detectors = [],
+    engine = 'compiled',
+    integrator = 'euler',
+    rtol = 1e-6,
+    atol = 1e-9,
+    sparse = False,
+    record_every = 1,
+    record_times = None,
+    sink = None,
+    locate_events = False,
+    logger = None,
+    sensitivity = None,
+    temperature = None,
+    heat_balance = None,
+    heat_capacity = 4184.,
+    UA = 0.,
+    T_jacket = 298.15,
+    reduce = False
 ):
 
     """
@@ -30,19 +98,81 @@ def bstr(
         unit of time
     detectors: 1-d array, class: chemgaloo.detector
         detectors defined that want to use in present reaction system
+    engine: str
+        how concentrations are advanced, options:
+    >'compiled': compile chemicals and reactions into chemgaloo.network and advance one concentration vector per step\n
+    >'python': call reaction.go() of every reaction, the original implementation, only supports integrator = 'euler'\n
+    integrator: str
+        time integration method, options:
+    >'euler': fixed-step explicit Euler, dt should not be specified as a too large number\n
+    >'rk45': adaptive embedded Runge-Kutta (Dormand-Prince), for non-stiff reactions, dt is the initial step\n
+    >'rosenbrock': adaptive linearly-implicit Rosenbrock method, for stiff reactions, dt is the initial step\n
+    rtol: float
+        relative tolerance of adaptive integrators
+    atol: float
+        absolute tolerance of adaptive integrators, in c_unit
+    sparse: bool
+        if compile network with sparse stoichiometry matrix and use sparse analytic Jacobian, recommended for large mechanisms
+    record_every: int
+        record concentrations every Nth step only, the last step is always recorded
+    record_times: 1-d array, float
+        if given, record concentrations only at these times (interpolated between steps), record_every is ignored
+    sink: chemgaloo.trajectory.callback_sink, generator_sink, npy_sink or memmap_sink
+        if given, recorded points are streamed to sink in chunks as the run proceeds, memory stays bounded
+        and chem_c_log only keeps the last chunk, rate constants in its header are those at initial temperature
+    locate_events: bool
+        if True, detectors act where their continuous event functions change sign (see
+        chemgaloo.network.detector_set.event), hit times are located by root-finding on dense output instead of rounding at whole steps, so ndigits is
+        ignored and large adaptive steps can be used, quench stops reactions exactly at hit time.
+        Only for engine = 'compiled'
+    logger: callable
+        receives report messages as str when detectors are activated, e.g. print or logging.Logger.info,
+        if not given, nothing is reported
+    sensitivity: 1-d array, class: chemgaloo.reaction or chemgaloo.chemical
+        if given, forward sensitivities of concentrations with respect to k of these reactions and initial
+        concentrations of these chemicals are integrated together with concentrations, from analytic derivatives of
+        mass-action rates. Only for engine = 'compiled', 'rosenbrock' uses the Jacobian of concentrations for
+        sensitivities too
+    temperature: float or callable
+        if given, rate constants follow rate laws of reactions (see chemgaloo.reaction.k_at) instead of reaction.k:
+        a float for isothermal reactor, or temperature program T(t) in K, rate constants of temperatures
+        already met are memoized by network.k_at. Only for engine = 'compiled', programs do not support sensitivity.
+        With heat_balance, initial temperature
+    heat_balance: str
+        if given, reactor is non-isothermal and temperature is integrated together with concentrations from
+        reaction.deltaH (J/mol, heat released by reactions is -deltaH*r), chem_c_log then has one more column,
+        temperature, after all chemicals, and detectors with attr 'temp' can be used. Options:
+    >'adiabatic': no heat exchange\n
+    >'jacketed': heat exchange UA*(T - T_jacket) with jacket\n
+    Only for engine = 'compiled', sensitivity is not supported
+    heat_capacity: float
+        heat capacity of reacting mixture per volume, in J/K per volume unit of c_unit, default is water in J/(L*K)
+    UA: float
+        heat transfer coefficient times area per volume of reactor, in J/(s*K) per volume unit of c_unit,
+        only for heat_balance 'jacketed'
+    T_jacket: float or callable
+        temperature of jacket in K, or its program T_jacket(t), only for heat_balance 'jacketed'
+    reduce: bool
+        if True, integrate only independent chemicals and rebuild the others from conservation laws of the network
+        (see chemgaloo.network.network.conservation_laws) after every step, so Jacobian and linear solves shrink
+        and conserved totals do not drift. Only for engine = 'compiled', sensitivity is not supported
     Return:
     ---
     time: 1-d array
-        discrete time points in list, useful when want to plot
-    chem_c_log: 2-d array
-        all chemicals' concentrations recorded at every simulation step: chem_c_log[index_of_chemical][index_of_time]
+        discrete time points, useful when want to plot
+    chem_c_log: chemgaloo.trajectory.trajectory
+        all chemicals' concentrations recorded at every simulation step, preallocated (n_time, n_species) array:
+        chem_c_log[index_of_chemical][index_of_time], chem_c_log.at(index_of_time), chem_c_log.array,
+        with heat_balance, chem_c_log[-1] is temperature
     if_expire: bool
         state variable, if reactions are quenched, will turn to True
+    detector_record: 1-d array
+        time points recorded by detectors
+    sens_log: chemgaloo.trajectory.trajectory
+        only returned when sensitivity is given, recorded at the same time points as chem_c_log,
+        sens_log.array[index_of_time][index_of_chemical][index_of_parameter] = dc/dp
     """
 
-    time = [0.0]
-    chem_c_log = []
-
     if_expire = True
 #    if_record = False
 
@@ -55,78 +185,619 @@ def bstr(
 #            detector_record = []
 #            break
 
-    for ichemi in chemicals:
+    # temperature and rate constants in effect, for state reports and sink header
+    T_of = lambda t, c: None
+    k_of = lambda T: [irxn.k for irxn in reactions]
+    if engine == 'compiled':
 
-        chem_c_log.append([ichemi.c])
-    for istep in range(nstep):
+        net = network.compile(chemicals = chemicals, reactions = reactions, sparse = sparse)
+        c = net.c0()
+        k_of = lambda T: net.k if T is None else net.k_at(T, cache = heat_balance is None)
+        if (temperature is not None) and (not callable(temperature)) and (heat_balance is None):
+            # isothermal, rate constants are evaluated once
+            net.k[:] = net.k_at(temperature)
+            T_of = lambda t, c: temperature
+        if heat_balance is not None:
 
-        # accumulate change of concentration of each chemical by iteratively calling reactions
-        for irxn in reactions:
+            if heat_balance not in ('adiabatic', 'jacketed'):
 
-            irxn.go(dt = dt, mode = 'BSTR')
-        # save final concentrations to each reaction's self.__c_bak___
-        for irxn in reactions:
+                raise ValueError('unknown heat balance: {}'.format(heat_balance))
+            if (temperature is None) or callable(temperature):
 
-            irxn.__save_state__()
-        # update record of concentrations of reactor
-        for idx_chemi in range(len(chemicals)):
+                raise ValueError('initial temperature should be given as a float for non-isothermal reactor')
+            if sensitivity is not None:
 
-            chem_c_log[idx_chemi].append(chemicals[idx_chemi].c)
+                raise ValueError('sensitivity is not supported by non-isothermal reactor')
+            rhs, jac, y = __thermal_system__(
+                net, c, temperature, heat_capacity = heat_capacity, UA = UA if heat_balance == 'jacketed' else 0.,
+                T_jacket = T_jacket
+                )
+            # temperature is recorded and seen by detectors as the last column
+            ck = lambda y: y
+            T_of = lambda t, c: c[-1]
+        elif callable(temperature):
 
-        time.append((istep + 1)*dt)
+            if sensitivity is not None:
 
-        # Detector motions, may be integrated into another place in future version
-        detector_if_print = False
-        detector_if_quench = False
-        
-        for idx_detector in range(len(detectors)):
-
-            if detectors[idx_detector].turn_on():
-                print('CHEMGALOO| Detector-{} get expected value at time = {}'.format(idx_detector+1, time[-1]))
-
-                if detectors[idx_detector].motion == 'print':
-                    detector_if_print = True
-                elif detectors[idx_detector].motion == 'quench':
-                    detector_if_quench = True
-                elif detectors[idx_detector].motion == 'record':
-                    detector_record.append(time[-1])
-
-                detector_if_print = True # print, anyway
-
-                if detectors[idx_detector].motion == 'quench_and_silent':
-                    detector_if_quench = True
-                    detector_if_print = False
-                elif detectors[idx_detector].motion == 'silent':
-                    detector_if_print = False
-                elif detectors[idx_detector].motion == 'record_and_silent':
-                    detector_record.append(time[-1])
-                    detector_if_print = False
-                elif detectors[idx_detector].motion == 'record_and_quench_and_silent':
-                    detector_record.append(time[-1])
-                    detector_if_quench = True
-                    detector_if_print = False
-
-        if detector_if_print:
-            print('CHEMGALOO| ...')
-            print('='*40+'\n'+'DETECTOR(S) ACTIVATED, STATE REPORT')
-            print('Simulation step = {}, time = {} {}'.format(istep, time[-1], t_unit))
-            print('-'*40+'\nConcentration(s):')
-            for idx_chemi in range(len(chemicals)):
-                print('Chemical-{}, c = {} {}'.format(idx_chemi+1, chem_c_log[idx_chemi][-1], c_unit))
-            print('Reaction rate constant(s):')
-            for idx_rxn in range(len(reactions)):
-                print('Reaction-{}, k = {}'.format(idx_rxn+1, reactions[idx_rxn].k))
-            print('='*40)
-        if detector_if_quench:
-            print('CHEMGALOO| Reactions are quenched according to detector setting...')
+                raise ValueError('sensitivity is not supported with temperature program')
+            rhs = lambda t, c: net.dcdt(c, k = net.k_at(temperature(t)))
+            jac = lambda t, c: net.jacobian(c, k = net.k_at(temperature(t)))
+            y = c
+            ck = lambda y: y
+            T_of = lambda t, c: temperature(t)
+        elif sensitivity is None:
+
+            rhs, jac, y = lambda t, c: net.dcdt(c), lambda t, c: net.jacobian(c), c
+            # concentrations are the whole state
+            ck = lambda y: y
+        else:
+
+            rhs, jac, y = __sens_system__(net, c, sensitivity)
+            ck = lambda y: y[0]
+        if reduce:
+
+            if sensitivity is not None:
+
+                raise ValueError('sensitivity is not supported by reduced integration')
+            steps = __reduced_steps__(net, rhs, jac, y, dt = dt, nstep = nstep, integrator = integrator, rtol = rtol, atol = atol)
+        else:
+
+            steps = ode.integrate(rhs, y, dt = dt, nstep = nstep, method = integrator, jac = jac, rtol = rtol, atol = atol)
+    elif engine == 'python':
+
+        if integrator != 'euler':
+
+            raise ValueError('engine python only supports integrator euler')
+        if sensitivity is not None:
+
+            raise ValueError('sensitivity is only supported by engine compiled')
+        if (temperature is not None) or (heat_balance is not None):
+
+            raise ValueError('temperature is only supported by engine compiled')
+        if reduce:
+
+            raise ValueError('reduce is only supported by engine compiled')
+        steps = __bstr_go_steps__(reactions = reactions, dt = dt, nstep = nstep)
+    else:
+
+        raise ValueError('unknown engine: {}'.format(engine))
+
+    chem_c_log = trajectory(
+        len(chemicals) + (heat_balance is not None), capacity = __log_capacity__(nstep, integrator, record_every, record_times),
+        sink = sink
+        )
+    record = recorder(chem_c_log, record_every = record_every, record_times = record_times)
+    # derivatives are kept for dense output when hit times or record times are interpolated
+    if_dense = (engine == 'compiled') and (locate_events or (record_times is not None))
+    if locate_events and (engine != 'compiled'):
+
+        raise ValueError('locate_events is only supported by engine compiled')
+    if engine == 'compiled':
+
+        dets = network.compile_detectors(detectors, net = net)
+    else:
+
+        dets = network.compile_detectors(detectors, chemicals = chemicals)
+    if if_dense:
+
+        t, f = 0.0, rhs(0.0, y)
+        g = dets.event(ck(y), t)
+    record.start(0.0, ck(y) if heat_balance is not None else [ichemi.c for ichemi in chemicals], ck(f) if if_dense else None)
+    # rate constants at initial temperature
+    k_ref = np.array(k_of(T_of(0.0, ck(y) if engine == 'compiled' else None)), dtype = float)
+    if sensitivity is not None:
+
+        sens_log = trajectory(
+            (net.n_species, len(sensitivity)), capacity = __log_capacity__(nstep, integrator, record_every, record_times)
+            )
+        sens_record = recorder(sens_log, record_every = record_every, record_times = record_times)
+        sens_record.start(0.0, y[1:].T, f[1:].T if if_dense else None)
+    for istep, (t_step, c_step) in enumerate(steps):
+
+        if engine == 'compiled':
+            # c_step is the integrated state, with sensitivities if any
+            if if_dense:
+
+                t_prev, y_prev, f_prev = t, y, f
+                f = rhs(t_step, c_step)
+            t, y = t_step, c_step
+            if locate_events:
+
+                g_prev, g = g, dets.event(ck(y), t)
+                t_hits = dets.locate(g_prev, t_prev, ck(y_prev), ck(f_prev), g, t, ck(y), ck(f))
+                t_quench = np.min(t_hits[dets.if_quench], initial = np.inf)
+                if t_quench < t:
+                    # stop inside the step, detectors hit later than quench do not act
+                    t = t_quench
+                    y = ode.hermite(t_prev, y_prev, f_prev, t_step, c_step, f, t)
+                    f = rhs(t, y)
+                    t_hits[t_hits > t] = np.nan
+                hits = ~np.isnan(t_hits)
+            c = ck(y)
+            if not locate_events:
+
+                hits = dets.turn_on(c, t)
+            record.step(t, c, ck(f) if if_dense else None)
+            if sensitivity is not None:
+
+                sens_record.step(t, y[1:].T, f[1:].T if if_dense else None)
+        else:
+            t = t_step
+            c = np.array([ichemi.c for ichemi in chemicals])
+            hits = dets.turn_on(c, t)
+            # update record of concentrations of reactor
+            record.step(t, c)
+
+        # Detector motions, decoded to flags when detectors are compiled
+        if not np.any(hits):
+
+            continue
+        for idx_detector in np.nonzero(hits)[0]:
+
+            t_hit = float(t_hits[idx_detector]) if locate_events else t
+            if logger is not None:
+                logger('CHEMGALOO| Detector-{} get expected value at time = {}'.format(idx_detector+1, t_hit))
+            if dets.if_record[idx_detector]:
+                detector_record.append(t_hit)
+
+        if (logger is not None) and np.any(hits & dets.if_print):
+            T = T_of(t, c)
+            __bstr_report__(
+                logger, istep, t, c[:len(chemicals)], k_of(T), c_unit = c_unit, t_unit = t_unit, temperature = T
+                )
+        if np.any(hits & dets.if_quench):
+            if logger is not None:
+                logger('CHEMGALOO| Reactions are quenched according to detector setting...')
             if_expire = False
             break
+
+    if hasattr(sink, 'describe'):
+
+        sink.describe(
+            names = [ichemi.name or 'Chemical-{}'.format(idx_chemi+1) for idx_chemi, ichemi in enumerate(chemicals)]
+            + (['temperature'] if heat_balance is not None else []),
+            c_unit = c_unit, t_unit = t_unit, k = k_ref, detector_record = detector_record
+            )
+    record.finish()
+    if engine == 'compiled':
+        # leave chemicals and reactions in the same final state as the python engine does
+        net.load(c[:net.n_species])
+    if sensitivity is not None:
+
+        sens_record.finish()
+        return chem_c_log.time, chem_c_log, if_expire, detector_record, sens_log
     
-    return time, chem_c_log, if_expire, detector_record
+    return chem_c_log.time, chem_c_log, if_expire, detector_record
 
 # old name of bstr used in this file, preserve it for compatibility for old version users
 batch_reactor = bstr
 
+def __adjoint_segment__(net, t_a, c_a, t_b, dt, integrator, rtol, atol):
+
+    """
+    recompute forward steps between two checkpoints, kept in memory for dense output of backward pass
+    """
+    n_sub = max(1, int(np.ceil((t_b - t_a)/dt - 1e-9)))
+    ts, cs, fs = [t_a], [np.array(c_a)], [net.dcdt(c_a)]
+    for t, c in ode.integrate(
+        lambda t, c: net.dcdt(c), c_a, dt = (t_b - t_a)/n_sub, nstep = n_sub, method = integrator,
+        jac = lambda t, c: net.jacobian(c), rtol = rtol, atol = atol, t0 = t_a
+        ):
+
+        ts.append(t)
+        cs.append(c)
+        fs.append(net.dcdt(c))
+    ts = np.array(ts)
+    ts[-1] = t_b
+
+    def dense(t):
+
+        idx = min(max(int(np.searchsorted(ts, t)), 1), len(ts) - 1)
+        return ode.hermite(ts[idx - 1], cs[idx - 1], fs[idx - 1], ts[idx], cs[idx], fs[idx], t)
+    return dense
+
+# 3-point Gauss-Legendre nodes and weights on [0, 1]
+__GAUSS_X__ = 0.5 + 0.5*np.sqrt(0.6)*np.array([-1., 0., 1.])
+__GAUSS_W__ = np.array([5/18, 8/18, 5/18])
+
+def __adjoint_backward__(net, dense, lam, mu, t_hi, t_lo, dt, integrator, rtol, atol):
+
+    """
+    integrate adjoint lambda from t_hi back to t_lo in reversed time s = t_hi - t, d(lambda)/ds = J^T lambda,
+    and accumulate mu = integral of (df/dk)^T lambda = dJ/dk by Gauss quadrature over every step on dense
+    output of lambda, so that the number of reactions does not enlarge the stiff system
+    """
+    if t_hi <= t_lo:
+
+        return lam, mu
+    rhs = lambda s, lam: net.jacobian(dense(t_hi - s)).T @ lam
+    n_sub = max(1, int(np.ceil((t_hi - t_lo)/dt - 1e-9)))
+    s_prev, lam_prev, f_prev = 0., lam, rhs(0., lam)
+    mu = np.array(mu)
+    for s, lam in ode.integrate(
+        rhs, lam, dt = (t_hi - t_lo)/n_sub, nstep = n_sub, method = integrator,
+        jac = lambda s, lam: net.jacobian(dense(t_hi - s)).T, rtol = rtol, atol = atol
+        ):
+
+        f = rhs(s, lam)
+        for x_q, w_q in zip(__GAUSS_X__, __GAUSS_W__):
+
+            s_q = s_prev + x_q*(s - s_prev)
+            lam_q = ode.hermite(s_prev, lam_prev, f_prev, s, lam, f, s_q)
+            mu += w_q*(s - s_prev)*(net.jacobian_k(dense(t_hi - s_q)).T @ lam_q)
+        s_prev, lam_prev, f_prev = s, lam, f
+    return lam, mu
+
+def __adjoint__(net, loss, loss_times, dt = 0.01, nstep = 1000, integrator = 'euler', rtol = 1e-6, atol = 1e-9,
+    checkpoint_every = 100):
+
+    """
+    adjoint gradient of J = sum_i loss(t_i, c(t_i)) of compiled network, see bstr_adjoint
+    """
+    loss_times = np.sort(np.atleast_1d(np.asarray(loss_times, dtype = float)))
+    checkpoint_every = max(1, int(checkpoint_every))
+    c0 = net.c0()
+    # forward pass keeps only checkpoints
+    checkpoints = [(0., c0)]
+    t = 0.
+    for istep, (t, c) in enumerate(ode.integrate(
+        lambda t, c: net.dcdt(c), c0, dt = dt, nstep = nstep, method = integrator,
+        jac = lambda t, c: net.jacobian(c), rtol = rtol, atol = atol
+        )):
+
+        if (istep + 1) % checkpoint_every == 0:
+
+            checkpoints.append((t, np.array(c)))
+    if checkpoints[-1][0] < t:
+
+        checkpoints.append((t, np.array(c)))
+    if (len(loss_times) > 0) and ((loss_times[0] < 0) or (loss_times[-1] > t*(1 + 1e-12))):
+
+        raise ValueError('loss times should be within simulated time [0, {}]'.format(t))
+
+    # backward pass, segments between checkpoints are recomputed one at a time
+    value = 0.
+    lam = np.zeros(net.n_species)
+    mu = np.zeros(net.n_reactions)
+    for iseg in range(len(checkpoints) - 1, 0, -1):
+
+        t_a, c_a = checkpoints[iseg - 1]
+        t_b = checkpoints[iseg][0]
+        dense = __adjoint_segment__(net, t_a, c_a, t_b, dt, integrator, rtol, atol)
+        t_hi = t_b
+        for t_obs in loss_times[(loss_times > t_a) & (loss_times <= t_b)][::-1]:
+
+            lam, mu = __adjoint_backward__(net, dense, lam, mu, t_hi, t_obs, dt, integrator, rtol, atol)
+            ivalue, igrad = loss(t_obs, dense(t_obs))
+            value += ivalue
+            lam = lam + igrad
+            t_hi = t_obs
+        lam, mu = __adjoint_backward__(net, dense, lam, mu, t_hi, t_a, dt, integrator, rtol, atol)
+    for t_obs in loss_times[loss_times <= 0]:
+
+        ivalue, igrad = loss(t_obs, c0)
+        value += ivalue
+        lam = lam + igrad
+    return value, mu, lam
+
+def bstr_adjoint(
+    chemicals = [],
+    reactions = [],
+    loss = None,
+    loss_times = [],
+    dt = 0.01,
+    nstep = 1000,
+    integrator = 'euler',
+    rtol = 1e-6,
+    atol = 1e-9,
+    sparse = False,
+    checkpoint_every = 100
+):
+    """
+    Adjoint sensitivity of batch reactor: gradient of a scalar objective J = sum_i loss(t_i, c(t_i)) with respect to
+    k of every reaction and every initial concentration, at the cost of about two simulations whatever the number
+    of reactions. Forward pass stores concentrations every checkpoint_every steps only, backward pass recomputes
+    one segment between checkpoints at a time and integrates adjoint equations over it\n
+    Parameters:
+    ---
+    chemicals: 1-d array, class: chemgaloo.chemical
+        all chemicals in reactor, present concentrations are initial concentrations, not modified
+    reactions: 1-d array, class: chemgaloo.reaction
+        all possible reactions in reactor
+    loss: callable
+        loss(t, c) -> (value, dvalue/dc), c and dvalue/dc are 1-d arrays of n_species
+    loss_times: 1-d array, float
+        time points loss is evaluated at, within [0, nstep * dt]
+    dt, nstep, integrator, rtol, atol, sparse:
+        see bstr, adjoint equations are integrated by the same integrator
+    checkpoint_every: int
+        number of forward steps between checkpoints, memory holds len(steps)/checkpoint_every checkpoints plus
+        checkpoint_every steps of one segment
+    Return:
+    ---
+    value: float
+        objective J
+    dk: 1-d array, float
+        dJ/dk of every reaction
+    dc0: 1-d array, float
+        dJ/dc0 of every chemical
+    """
+    net = network.compile(chemicals = chemicals, reactions = reactions, sparse = sparse)
+    return __adjoint__(
+        net, loss, loss_times, dt = dt, nstep = nstep, integrator = integrator, rtol = rtol, atol = atol,
+        checkpoint_every = checkpoint_every
+        )
+
+def __param_locate__(net, key):
+
+    """
+    locate a parameter key of network: ('c0', index of chemical) or ('k', index of reaction)
+    """
+    if id(key) in net.index:
+
+        return 'c0', net.index[id(key)]
+    for idx_rxn in range(net.n_reactions):
+
+        if net.reactions[idx_rxn] is key:
+
+            return 'k', idx_rxn
+    raise ValueError('parameter is neither a chemical nor a reaction of network')
+
+def __thermal_system__(net, c0, temperature, heat_capacity = 4184., UA = 0., T_jacket = 298.15):
+
+    """
+    concentrations augmented with temperature of non-isothermal batch reactor, y = [c, T]:
+    dc/dt = stoi @ r(c, k(T)), dT/dt = (sum_j (-deltaH_j)*r_j - UA*(T - T_jacket))/heat_capacity,
+    with analytic Jacobian including temperature dependence of rate laws\n
+    Return:
+    ---
+    rhs, jac: callable
+        right-hand side and Jacobian of augmented state for chemgaloo.integrator.integrate
+    y: 1-d array, float
+        initial augmented state
+    """
+    n = net.n_species
+    heat = -np.array([irxn.deltaH for irxn in net.reactions], dtype = float)
+    jacket = T_jacket if callable(T_jacket) else (lambda t: T_jacket)
+
+    def rhs(t, y):
+
+        k = net.k_at(y[n], cache = False)
+        r = net.rate(y[:n], k = k)
+        return np.concatenate((net.stoi @ r, [(heat @ r - UA*(y[n] - jacket(t)))/heat_capacity]))
+
+    def jac(t, y):
+
+        k = net.k_at(y[n], cache = False)
+        drdc = net.rate_jacobian(y[:n], k = k)
+        drdT = net.rate(y[:n], k = k)*net.dlnk_dT(y[n])
+        jac = np.empty((n + 1, n + 1))
+        jac[:n, :n] = net.stoi @ drdc
+        jac[:n, n] = net.stoi @ drdT
+        jac[n, :n] = heat @ drdc/heat_capacity
+        jac[n, n] = (heat @ drdT - UA)/heat_capacity
+        return jac
+    return rhs, jac, np.append(c0, float(temperature))
+
+def __sens_system__(net, y0, sensitivity = []):
+
+    """
+    concentrations augmented with forward sensitivities S = dc/dp, integrated as rows of one
+    (1 + n_params, n_species) state: y[0] = c, y[1 + j] = S[:, j], dS/dt = J S + df/dp,
+    the analytic Jacobian J of concentrations is shared by all rows\n
+    Return:
+    ---
+    rhs, jac: callable
+        right-hand side and Jacobian of augmented state for chemgaloo.integrator.integrate
+    y: 2-d array, float
+        initial augmented state, S = 0 for rate constants and S = identity for initial concentrations
+    """
+    params = [__param_locate__(net, ikey) for ikey in sensitivity]
+    idx_k = [idx for kind, idx in params if kind == 'k']
+    row_k = 1 + np.array([icol for icol in range(len(params)) if params[icol][0] == 'k'], dtype = int)
+    y = np.zeros((1 + len(params), net.n_species))
+    y[0] = y0
+    for icol in range(len(params)):
+
+        if params[icol][0] == 'c0':
+
+            y[1 + icol, params[icol][1]] = 1.
+
+    def rhs(t, y):
+
+        dydt = np.empty_like(y)
+        dydt[0] = net.dcdt(y[0])
+        dydt[1:] = (net.jacobian(y[0]) @ y[1:].T).T
+        jac_k = net.jacobian_k(y[0])[:, idx_k]
+        dydt[row_k] += (jac_k.toarray() if net.sparse else jac_k).T
+        return dydt
+    return rhs, lambda t, y: net.jacobian(y[0]), y
+
+def __reduced_steps__(net, rhs, jac, y, dt = 0.01, nstep = 1000, integrator = 'euler', rtol = 1e-6, atol = 1e-9):
+
+    """
+    integrate y = [c, extra] over independent chemicals and extra states only, c = E @ x + b with x = c[idx_ind],
+    and yield full states rebuilt from conserved totals of y
+    """
+    L, idx_dep, idx_ind = net.conservation_laws()
+    n_extra = len(y) - net.n_species
+    totals = net.totals(y[:net.n_species])
+    idx_keep = np.concatenate((idx_ind, net.n_species + np.arange(n_extra)))
+    expand = lambda x: np.concatenate((net.expand(x[:len(idx_ind)], totals), x[len(idx_ind):]))
+    # E = dy/dx, identity on kept states, -L[:, idx_ind] on dependent chemicals
+    E = np.zeros((len(y), len(idx_keep)))
+    E[idx_keep, np.arange(len(idx_keep))] = 1.
+    E[idx_dep, :len(idx_ind)] = -L[:, idx_ind]
+    if net.sparse:
+
+        from scipy.sparse import csr_matrix
+        E = csr_matrix(E)
+    steps = ode.integrate(
+        lambda t, x: rhs(t, expand(x))[idx_keep], y[idx_keep], dt = dt, nstep = nstep, method = integrator,
+        jac = lambda t, x: jac(t, expand(x))[idx_keep] @ E, rtol = rtol, atol = atol
+        )
+    for t, x in steps:
+
+        yield t, expand(x)
+
+def __sweep_cases__(net, params = {}, temperature = None):
+
+    """
+    expand sweep parameters into rate constants and initial concentrations of every case
+    """
+    n_cases = 1
+    for ivalues in list(params.values()) + [temperature]:
+
+        if np.ndim(ivalues) > 0:
+
+            n_cases = max(n_cases, len(ivalues))
+    if temperature is None:
+
+        ks = np.tile(net.k, (n_cases, 1))
+    else:
+
+        ks = np.array(np.broadcast_to(net.k_at(np.broadcast_to(temperature, (n_cases,))), (n_cases, net.n_reactions)))
+    c0s = np.tile(net.c0(), (n_cases, 1))
+    for ikey, ivalues in params.items():
+
+        kind, idx = __param_locate__(net, ikey)
+        if kind == 'c0':
+
+            c0s[:, idx] = ivalues
+        else:
+
+            ks[:, idx] = ivalues
+    return ks, c0s
+
+def bstr_sweep(
+    net,
+    params = {},
+    c_unit = 'mol/L',
+    dt = 0.01,
+    nstep = 1000,
+    t_unit = 'second',
+    detectors = [],
+    integrator = 'euler',
+    rtol = 1e-6,
+    atol = 1e-9,
+    record_every = 1,
+    record_times = None,
+    sink = None,
+    temperature = None
+):
+    """
+    Batch reactor parameter sweep: integrate many cases of one network in lockstep as a
+    (n_cases, n_species) concentration array, instead of calling bstr once per case\n
+    Parameters:
+    ---
+    net: chemgaloo.network.network
+        compiled network, see chemgaloo.network.compile, chemicals and reactions are not modified
+    params: dict
+        map from chemgaloo.reaction (sweep its k) or chemgaloo.chemical (sweep its initial concentration)
+        to 1-d array of values, all arrays should have the same length n_cases, scalars are broadcast.
+        Quantities not in params take present values of reaction.k and chemical.c
+    c_unit: str
+        unit of concentration
+    dt: float
+        time step of 'euler', initial step of adaptive integrators
+    nstep: int
+        total time = nstep * dt
+    t_unit: str
+        unit of time
+    detectors: 1-d array, class: chemgaloo.detector
+        detectors evaluated on every case, motions containing 'record' and 'quench' act per case,
+        printing is never done in sweeps
+    integrator: str
+        'euler', 'rk45' or 'rosenbrock', see bstr, adaptive steps are shared by all cases
+    rtol, atol: float
+        tolerances of adaptive integrators
+    record_every, record_times, sink:
+        decimation and streaming of recorded points, see bstr, states streamed have shape (n_cases, n_species)
+    temperature: float or 1-d array
+        if given, rate constants of every case are evaluated by rate laws at this temperature (see network.k_at)
+        before params are applied, an array sweeps temperature over cases
+    Return:
+    ---
+    time: 1-d array
+        discrete time points shared by all cases
+    chem_c_log: 3-d array, float
+        chem_c_log[index_of_time][index_of_case][index_of_chemical], nan after a case is quenched
+    if_expire: 1-d array, bool
+        for each case, turn to False if it is quenched by detector
+    detector_record: 2-d array
+        time points recorded by detectors: detector_record[index_of_case]
+    """
+    ks, c0s = __sweep_cases__(net, params, temperature = temperature)
+    return __bstr_sweep_cases__(
+        net, ks, c0s, c_unit = c_unit, dt = dt, nstep = nstep, t_unit = t_unit, detectors = detectors,
+        integrator = integrator, rtol = rtol, atol = atol,
+        record_every = record_every, record_times = record_times, sink = sink
+        )
+
+def __bstr_sweep_cases__(
+    net,
+    ks,
+    c0s,
+    c_unit = 'mol/L',
+    dt = 0.01,
+    nstep = 1000,
+    t_unit = 'second',
+    detectors = [],
+    integrator = 'euler',
+    rtol = 1e-6,
+    atol = 1e-9,
+    record_every = 1,
+    record_times = None,
+    sink = None
+):
+
+    """
+    kernel of bstr_sweep working on expanded arrays, ks: (n_cases, n_reactions), c0s: (n_cases, n_species)
+    """
+    n_cases = len(ks)
+    active = np.ones(n_cases, dtype = bool)
+    if_expire = np.ones(n_cases, dtype = bool)
+    detector_record = [[] for idx_case in range(n_cases)]
+    dets = network.compile_detectors(detectors, net = net)
+
+    # quenched cases are frozen by zeroing their derivatives
+    steps = ode.integrate(
+        lambda t, c: net.dcdt(c, k = ks) * active[:, np.newaxis], c0s, dt = dt, nstep = nstep,
+        method = integrator, jac = lambda t, c: net.jacobian(c, k = ks, sparse = False),
+        rtol = rtol, atol = atol
+        )
+    c_log = trajectory(
+        (n_cases, net.n_species), capacity = __log_capacity__(nstep, integrator, record_every, record_times),
+        sink = sink
+        )
+    record = recorder(c_log, record_every = record_every, record_times = record_times)
+    record.start(0.0, c0s)
+    for t, c in steps:
+
+        record.step(t, np.where(active[:, np.newaxis], c, np.nan))
+
+        # all detectors on all cases in one comparison, hits: (n_cases, n_detectors)
+        hits = dets.turn_on(c, t) & active[:, np.newaxis]
+        if np.any(hits):
+
+            for idx_case in np.nonzero(np.any(hits & dets.if_record, axis = 1))[0]:
+
+                detector_record[idx_case] += [t]*int(np.sum(hits[idx_case] & dets.if_record))
+            if_expire &= ~np.any(hits & dets.if_quench, axis = 1)
+        active &= if_expire
+        if not np.any(active):
+
+            break
+    if hasattr(sink, 'describe'):
+
+        sink.describe(
+            names = [ichemi.name or 'Chemical-{}'.format(idx_chemi+1) for idx_chemi, ichemi in enumerate(net.chemicals)],
+            c_unit = c_unit, t_unit = t_unit, k = ks, detector_record = detector_record
+            )
+    record.finish()
+
+    return c_log.time, c_log.array, if_expire, detector_record
+
 import random as rnd
 from copy import deepcopy
 import math
@@ -139,6 +810,97 @@ def __cstr_get_gau1d_val__(x, mu, sigma):
         -(x-mu)**2/2/sigma**2
     )
 
+def __cstr_rtd_nodes__(res_time_dist_f = 'Gaussian', rtf_param1 = 0., rtf_param2 = 0., n_node = 100):
+
+    """
+    quadrature nodes and weights of residence time distribution E(t), weights are normalized to 1
+    so that truncated tails do not bias the outlet\n
+    Return:
+    ---
+    nodes: 1-d array, float
+        residence times
+    weights: 1-d array, float
+        quadrature weights, E(t)*dt
+    """
+    if res_time_dist_f == 'Gaussian':
+        # mean rtf_param1, standard deviation rtf_param2, negative residence times are cut off
+        if rtf_param2 < 0:
+
+            raise ValueError('standard deviation of Gaussian residence time distribution should not be negative')
+        if rtf_param2 == 0:
+
+            # plug flow: every fluid element stays exactly the mean residence time
+            return np.array([float(rtf_param1)]), np.ones(1)
+        t_lo = max(0., rtf_param1 - 5*rtf_param2)
+        nodes = np.linspace(t_lo, rtf_param1 + 5*rtf_param2, n_node)
+        e_vals = np.array([__cstr_get_gau1d_val__(inode, rtf_param1, rtf_param2) for inode in nodes])
+    elif res_time_dist_f == 'exponential':
+        # ideal CSTR, mean residence time rtf_param1
+        nodes = np.linspace(0., -rtf_param1*math.log(1e-8), n_node)
+        e_vals = np.exp(-nodes/rtf_param1)/rtf_param1
+    elif res_time_dist_f == 'tabulated':
+        # rtf_param1: time points, rtf_param2: E(t) values
+        nodes = np.asarray(rtf_param1, dtype = float)
+        e_vals = np.asarray(rtf_param2, dtype = float)
+    else:
+
+        raise ValueError('unknown residence time distribution function: {}'.format(res_time_dist_f))
+    # trapezoidal rule
+    widths = np.zeros(len(nodes))
+    widths[1:] += 0.5*np.diff(nodes)
+    widths[:-1] += 0.5*np.diff(nodes)
+    weights = e_vals*widths
+    return nodes, weights/np.sum(weights)
+
+def __cstr_segregated__(
+    chemicals = [],
+    reactions = [],
+    n_node = 100,
+    res_time_dist_f = 'Gaussian',
+    rtf_param1 = 0.,
+    rtf_param2 = 0.,
+    dt = 0.01,
+    integrator = 'euler',
+    verbosity = 'high'
+):
+
+    """
+    segregated-flow CSTR: every fluid element is a batch reactor fed with chemical.ccstr_in, outlet is the
+    batch trajectory averaged over residence time distribution, one trajectory serves all residence times
+    """
+    nodes, weights = __cstr_rtd_nodes__(res_time_dist_f, rtf_param1, rtf_param2, n_node)
+    net = network.compile(chemicals = chemicals, reactions = reactions)
+    c_in = np.array([ichemi.ccstr_in for ichemi in chemicals], dtype = float)
+
+    traj = trajectory(net.n_species, capacity = len(nodes) + 1)
+    record = recorder(traj, record_times = nodes)
+    record.start(0., c_in, net.dcdt(c_in))
+    for t, c in ode.integrate(
+        lambda t, c: net.dcdt(c), c_in, dt = dt, nstep = int(math.ceil(nodes[-1]/dt)),
+        method = integrator, jac = lambda t, c: net.jacobian(c)
+        ):
+
+        record.step(t, c, net.dcdt(c))
+    record.finish()
+
+    chemi_out_per_thread = traj.array
+    chemi_out = weights @ chemi_out_per_thread
+    time = float(weights @ nodes)
+    for idx_chemi in range(net.n_species):
+
+        chemicals[idx_chemi].ccstr_out = float(chemi_out[idx_chemi])
+    if verbosity != 'low':
+        print('Chemgaloo| (CSTR) segregated flow over {} residence times, mean residence time = {}'.format(
+            len(nodes), time))
+    if (verbosity != 'low') and (verbosity != 'medium'):
+        print('Chemgaloo| (CSTR) outflux information:')
+        for idx_chemi in range(len(chemi_out)):
+
+            print('            Chemical-{}, c = {}'.format(idx_chemi+1, round(chemi_out[idx_chemi], 4)))
+    if verbosity != 'low':
+        print('='*40)
+    return chemi_out, chemi_out_per_thread, time, traj.time
+
 def __cstr_c_initializer__(chemicals = [], iter_list = []):
 
     if len(iter_list) == 0:
@@ -173,6 +935,58 @@ def __vector_similar__(v1 = [], v2 = []):
     norm_v2 = math.sqrt(norm_v2)
     return corr/norm_v1/norm_v2
 
+def __cstr_newton__(
+    chemicals = [],
+    reactions = [],
+    res_time = 1.,
+    conv_thr = 1e-8,
+    max_iter = 50,
+    sparse = False,
+    verbosity = 'high'
+):
+
+    """
+    steady state of ideal CSTR, (c_in - c)/tau + stoi @ r(c) = 0, solved by damped Newton with analytic
+    Jacobian, pseudo-transient continuation is used as fallback
+    """
+    net = network.compile(chemicals = chemicals, reactions = reactions, sparse = sparse)
+    c_in = np.array([ichemi.ccstr_in for ichemi in chemicals], dtype = float)
+    if sparse:
+
+        from scipy.sparse import identity
+        eye = identity(net.n_species, format = 'csr')
+    else:
+
+        eye = np.eye(net.n_species)
+
+    c_out, res_log, n_iter, if_conv = ode.steady_state(
+        lambda c: (c_in - c)/res_time + net.dcdt(c),
+        lambda c: net.jacobian(c) - eye/res_time,
+        c_in, tol = conv_thr/res_time, max_iter = max_iter, dtau = 0.1*res_time
+        )
+    for idx_chemi in range(net.n_species):
+
+        chemicals[idx_chemi].ccstr_out = float(c_out[idx_chemi])
+
+    if verbosity != 'low':
+        print('Chemgaloo| (CSTR) Newton solver {} after {} iteration(s):\n'.format(
+            'converged' if if_conv else 'NOT converged', n_iter)
+            +'            residual = {}\n'.format(res_log[-1]*res_time)
+            +'            conv_thr = {}'.format(conv_thr)
+            )
+    if (verbosity != 'low') and (verbosity != 'medium'):
+        print('Chemgaloo| (CSTR) outflux information:')
+        for idx_chemi in range(len(c_out)):
+
+            print('            Chemical-{}, c = {}'.format(idx_chemi+1, round(c_out[idx_chemi], 4)))
+    if verbosity == 'debug':
+        for idx_iter in range(len(res_log)):
+
+            print('            iteration {}, residual = {}'.format(idx_iter, res_log[idx_iter]*res_time))
+    if verbosity != 'low':
+        print('='*40)
+    return c_out, np.array(res_log)*res_time, n_iter
+
 def cstr(
     chemicals = [],
     reactions = [],
@@ -184,11 +998,13 @@ def cstr(
     conv_thr = 1e-3,
     max_iter = 5,
     mixing = 0.1,
-    verbosity = 'high'
+    verbosity = 'high',
+    solver = 'iterative',
+    sparse = False,
+    integrator = 'euler'
 ):
     """
-    WARNING-1: options n_thread > 1 are not implemented! DO NOT USE!\n
-    WARNING-2: options res_time_dist_f != 'Gaussian' are not implemented! DO NOT USE!\n
+    WARNING: options res_time_dist_f != 'Gaussian' are not implemented for n_thread = 1! DO NOT USE!\n
     Continuum-stirring-tank-reactor (CSTR)\n
     Parameters:
     ---
@@ -197,9 +1013,16 @@ def cstr(
     reactions: 1-d array, class:  chemgaloo.chemical
         reactions that may occur in present reactor
     n_thred: int
-        number of perturbation of residual time considered, perturbation obeys residual time function that user defined
+        number of perturbation of residual time considered, perturbation obeys residual time function that user defined.
+        For n_thread > 1, segregated flow is simulated: one batch trajectory from chemical.ccstr_in is recorded at
+        n_thread residence times and averaged with quadrature weights of residence time distribution E(t)
     res_time_dist_f: str
-        function type of residual time distribution function
+        function type of residual time distribution function, options:
+    >'Gaussian': rtf_param1 is mean and rtf_param2 is standard deviation, standard deviation 0 is plug flow at
+    the mean residence time\n
+    >'exponential': ideal CSTR, rtf_param1 is mean residence time, only for n_thread > 1\n
+    >'tabulated': user-supplied E(t), rtf_param1 is 1-d array of time points and rtf_param2 is 1-d array of E(t),
+    n_thread only needs to be larger than 1, only for n_thread > 1\n
     rtf_param(i): float
         parameters of specific residual time distribution function
     dt: float
@@ -210,7 +1033,42 @@ def cstr(
         maximum number of iterations
     verbosity: str
         on which level to print information, availble options: low, medium, high and debug
+    solver: str
+        how stable state is found, options:
+    >'iterative': integrate residual time with dt and mix outlet with feed until outlet converges\n
+    >'newton': solve steady-state balance (c_in - c)/tau + stoi @ r(c) = 0 directly by damped Newton with analytic
+    Jacobian and pseudo-transient continuation as fallback, tau = rtf_param1, c_in = chemical.ccstr_in, conv_thr
+    is the threshold of max residual times tau (in unit of concentration), max_iter is the number of Newton iterations.
+    Only n_thread = 1 is supported, outlet concentrations are also saved in chemical.ccstr_out\n
+    sparse: bool
+        if use sparse analytic Jacobian, only for solver 'newton'
+    integrator: str
+        integrator of batch trajectory for n_thread > 1, 'euler', 'rk45' or 'rosenbrock', see bstr
+    Return:
+    ---
+    for n_thread > 1: chemi_out (1-d array, outlet concentrations averaged over residence times),
+    chemi_out_per_thread (2-d array, outlet concentrations of every residence time), time (float, mean
+    residence time), time_per_thread (1-d array, residence times)\n
+    only for solver 'newton':\n
+    c_out: 1-d array, float
+        outlet concentrations
+    res_log: 1-d array, float
+        max residual times tau of every iteration
+    n_iter: int
+        number of iterations
     """
+    if solver == 'newton':
+
+        if n_thread != 1:
+
+            raise ValueError('solver newton only supports n_thread = 1')
+        return __cstr_newton__(
+            chemicals = chemicals, reactions = reactions, res_time = rtf_param1, conv_thr = conv_thr,
+            max_iter = max_iter, sparse = sparse, verbosity = verbosity
+            )
+    elif solver != 'iterative':
+
+        raise ValueError('unknown solver: {}'.format(solver))
     if n_thread == 1:
 
         if res_time_dist_f == 'Gaussian':
@@ -274,17 +1132,63 @@ def cstr(
 
     elif n_thread > 1:
 
-        if res_time_dist_f == 'Gaussian':
-
-            pass
-        else:
-
-            pass
+        return __cstr_segregated__(
+            chemicals = chemicals, reactions = reactions, n_node = n_thread, res_time_dist_f = res_time_dist_f,
+            rtf_param1 = rtf_param1, rtf_param2 = rtf_param2, dt = dt, integrator = integrator,
+            verbosity = verbosity
+            )
     else:
 
         raise ValueError
     pass
 
+def __pfr_transport__(n_cells, dl, velocity, dispersion = 0.):
+
+    """
+    sparse operator of first-order upwind convection and central axial dispersion on cell values,
+    inlet enters the first cell by convection only (see __pfr_rhs__), Danckwerts boundaries
+    """
+    from scipy.sparse import diags
+    main = np.full(n_cells, -velocity/dl - 2*dispersion/dl**2)
+    main[0] += dispersion/dl**2
+    main[-1] += dispersion/dl**2
+    return diags(
+        [np.full(n_cells - 1, velocity/dl + dispersion/dl**2), main, np.full(n_cells - 1, dispersion/dl**2)],
+        [-1, 0, 1], format = 'csr'
+        )
+
+def __pfr_rhs__(net, c_in, dl, velocity, dispersion = 0.):
+
+    """
+    method-of-lines right-hand side, all cells are advanced as one (n_cells, n_species) array
+    """
+    def rhs(t, c):
+
+        c_up = np.concatenate((c_in[np.newaxis], c[:-1]))
+        dcdt = net.dcdt(c) - velocity*(c - c_up)/dl
+        if dispersion > 0:
+
+            # Danckwerts boundaries, no dispersive flux through inlet and outlet
+            c_up[0] = c[0]
+            c_down = np.concatenate((c[1:], c[-1:]))
+            dcdt += dispersion*(c_up - 2*c + c_down)/dl**2
+        return dcdt
+    return rhs
+
+def __pfr_jacobian__(net, c, transport):
+
+    """
+    sparse Jacobian of flattened method-of-lines system: block diagonal of reaction Jacobians
+    of every cell plus transport coupling neighbouring cells
+    """
+    from scipy.sparse import bsr_matrix, identity, kron
+    n_cells, n_species = c.shape
+    blocks = bsr_matrix(
+        (net.jacobian(c, sparse = False), np.arange(n_cells), np.arange(n_cells + 1)),
+        shape = (n_cells*n_species, n_cells*n_species)
+        )
+    return (blocks + kron(transport, identity(n_species), format = 'bsr')).tocsr()
+
 def pfr(
     chemicals = [],
     reactions = [],
@@ -293,9 +1197,142 @@ def pfr(
     dl = 0.05,
     l_unit = 'm',
     velocity = 10,
-    v_unit = ''
+    v_unit = '',
+    mode = 'steady',
+    dispersion = 0.,
+    integrator = 'euler',
+    rtol = 1e-6,
+    atol = 1e-9,
+    dt = 0.01,
+    nstep = 1000,
+    t_unit = 'second',
+    c_init = None,
+    record_every = 1,
+    record_times = None,
+    sink = None,
+    conv_thr = 1e-8,
+    max_iter = 50
 ):
     """
-    WARNING: not implemented yet!
+    Plug flow reactor, discretized axially into cells of width dl\n
+    Parameters:
+    ---
+    chemicals: 1-d array, class: chemgaloo.chemical
+        all chemicals in reactor, chemical.concentration is taken as inlet concentration
+    reactions: 1-d array, class: chemgaloo.reaction
+        all possible reactions in reactor
+    c_unit: str
+        unit of concentration
+    length: float
+        length of reactor
+    dl: float
+        width of cells, adjusted so that length is divided into an integer number of cells
+    l_unit: str
+        unit of length
+    velocity: float
+        superficial velocity, in l_unit per t_unit
+    v_unit: str
+        unit of velocity
+    mode: str
+        what to simulate, options:
+    >'steady': steady axial profile. Without dispersion, dc/dl = stoi @ r(c) / velocity is marched from inlet
+    with the integrator; with dispersion, the method-of-lines system is solved by Newton with the marched profile
+    as initial guess\n
+    >'transient': method of lines, all cells are advanced in time as one (n_cells, n_species) array\n
+    dispersion: float
+        axial dispersion coefficient, in l_unit^2 per t_unit, 0 for ideal plug flow
+    integrator: str
+        'euler', 'rk45' or 'rosenbrock', see bstr, for 'rosenbrock' the sparse Jacobian of all cells is used
+    rtol, atol: float
+        tolerances of adaptive integrators
+    dt, nstep, t_unit:
+        time step, number of steps and unit of time, only for mode 'transient'
+    c_init: array, float
+        initial concentrations in reactor, shape (n_species,) or (n_cells, n_species), only for mode 'transient',
+        if not given, reactor is initially empty
+    record_every, record_times, sink:
+        see bstr, only for mode 'transient'
+    conv_thr: float
+        convergence threshold of residual in c_unit per t_unit, only for mode 'steady' with dispersion
+    max_iter: int
+        maximal number of Newton iterations, only for mode 'steady' with dispersion
+    Return:
+    ---
+    for mode 'steady':\n
+    l: 1-d array, float
+        axial positions, from inlet (0) to outlet (length)
+    chem_c_profile: 2-d array, float
+        chem_c_profile[index_of_position][index_of_chemical]\n
+    for mode 'transient':\n
+    time: 1-d array, float
+        recorded time points
+    l: 1-d array, float
+        axial positions, from inlet (0) to outlet (length)
+    chem_c_log: chemgaloo.trajectory.trajectory
+        chem_c_log.array[index_of_time][index_of_position][index_of_chemical]
     """
-    pass
+    net = network.compile(chemicals = chemicals, reactions = reactions)
+    c_in = net.c0()
+    n_cells = max(1, int(round(length/dl)))
+    dl = length/n_cells
+    l = dl*np.arange(n_cells + 1)
+    transport = __pfr_transport__(n_cells, dl, velocity, dispersion)
+    rhs = __pfr_rhs__(net, c_in, dl, velocity, dispersion)
+    shape = (n_cells, net.n_species)
+
+    if mode == 'steady':
+        # march along l, residence time l/velocity plays the role of time
+        profile = trajectory(net.n_species, capacity = n_cells + 1)
+        record = recorder(profile, record_times = l)
+        record.start(0., c_in, net.dcdt(c_in)/velocity)
+        for il, c in ode.integrate(
+            lambda il, c: net.dcdt(c)/velocity, c_in, dt = dl, nstep = n_cells, method = integrator,
+            jac = lambda il, c: net.jacobian(c)/velocity, rtol = rtol, atol = atol
+            ):
+
+            record.step(il, c, net.dcdt(c)/velocity)
+        record.finish()
+        chem_c_profile = profile.array
+        if dispersion > 0:
+
+            c_cells, res_log, n_iter, if_conv = ode.steady_state(
+                lambda y: rhs(0., y.reshape(shape)).ravel(),
+                lambda y: __pfr_jacobian__(net, y.reshape(shape), transport),
+                chem_c_profile[1:].ravel(), tol = conv_thr, max_iter = max_iter, dtau = 0.1*dl/velocity
+                )
+            if not if_conv:
+
+                raise RuntimeError('steady axial profile not converged after {} iteration(s), residual = {}'.format(
+                    n_iter, res_log[-1]))
+            chem_c_profile[1:] = c_cells.reshape(shape)
+        return l, chem_c_profile
+    elif mode != 'transient':
+
+        raise ValueError('unknown pfr mode: {}'.format(mode))
+
+    c = np.zeros(shape)
+    if c_init is not None:
+
+        c[:] = c_init
+    chem_c_log = trajectory(
+        (n_cells + 1, net.n_species),
+        capacity = __log_capacity__(nstep, integrator, record_every, record_times), sink = sink
+        )
+    record = recorder(chem_c_log, record_every = record_every, record_times = record_times)
+    # inlet row is kept in front of cells so that recorded profiles span the whole reactor
+    c_full = np.empty((n_cells + 1, net.n_species))
+    c_full[0] = c_in
+    c_full[1:] = c
+    f_in = np.zeros((1, net.n_species))
+    if_dense = record.record_times is not None
+
+    record.start(0., c_full, np.concatenate((f_in, rhs(0., c))) if if_dense else None)
+    for t_step, y in ode.integrate(
+        lambda t, y: rhs(t, y.reshape(shape)).ravel(), c.ravel(), dt = dt, nstep = nstep, method = integrator,
+        jac = lambda t, y: __pfr_jacobian__(net, y.reshape(shape), transport), rtol = rtol, atol = atol
+        ):
+
+        c_full[1:] = y.reshape(shape)
+        record.step(t_step, c_full, np.concatenate((f_in, rhs(t_step, c_full[1:]))) if if_dense else None)
+    record.finish()
+    return chem_c_log.time, l, chem_c_log
@@ -0,0 +1,332 @@
+"""
+Mechanism reduction library of Chemgaloo
+"""
+import numpy as np
+import __network__ as network
+import __reactor__ as reactor
+
+def flux_contributions(net, c):
+    """
+    share of every reaction in the total production and consumption flux of every chemical,
+    |stoi_ij * r_j| / sum_j |stoi_ij * r_j|\n
+    Parameters:
+    ---
+    net: chemgaloo.network.network
+        compiled network
+    c: array, float
+        concentrations, shape (..., n_species)
+    Return:
+    ---
+    share: array, float
+        share[..., index_of_chemical, index_of_reaction], 0 for chemicals without any flux,
+        scipy.sparse.csr_matrix for a single state if net is compiled sparse
+    """
+    flux = abs(net.__stoi_times__(net.rate(c)))
+    if hasattr(flux, 'toarray'):
+
+        from scipy.sparse import diags
+        total = np.asarray(flux.sum(axis = 1)).ravel()
+        return (diags(np.divide(1., total, out = np.zeros_like(total), where = total > 0)) @ flux).tocsr()
+    total = np.sum(flux, axis = -1, keepdims = True)
+    return np.divide(flux, total, out = np.zeros_like(flux), where = total > 0)
+
+def timescales(net, c, t_fast = 1.):
+    """
+    timescale analysis of the Jacobian along a trajectory, with pointers of computational singular perturbation
+    (CSP): the pointer of a chemical is its diagonal entry of the projector onto fast modes, close to 1 when the
+    chemical is the one that relaxes in the fast modes, i.e. it is in quasi-steady state\n
+    Parameters:
+    ---
+    net: chemgaloo.network.network
+        compiled network
+    c: 2-d array, float
+        concentrations at sampled times, shape (n_time, n_species)
+    t_fast: float
+        modes decaying faster than t_fast, i.e. Re(eigenvalue) < -1/t_fast, are fast
+    Return:
+    ---
+    tau: 2-d array, float
+        timescales 1/|Re(eigenvalue)| at every time, ascending, inf for conserved and neutral modes
+    pointer: 2-d array, float
+        pointer[index_of_time][index_of_chemical]
+    """
+    jac = net.jacobian(np.asarray(c, dtype = float), sparse = False)
+    lam, A = np.linalg.eig(jac)
+    try:
+        B = np.linalg.inv(A)
+    except np.linalg.LinAlgError:
+        # defective Jacobian at some times, e.g. equal rate constants along a chain
+        B = np.array([np.linalg.pinv(iA) for iA in A])
+    fast = lam.real < -1/t_fast
+    pointer = np.einsum('tir,tri,tr->ti', A, B, fast).real
+    with np.errstate(divide = 'ignore'):
+
+        tau = np.sort(1/np.abs(lam.real), axis = -1)
+    return tau, pointer
+
+def __important__(net, share, idx_targets, flux_thr):
+
+    """
+    chemicals reached from targets in the directed relation graph (Lu and Law), chemical i depends on j when
+    reactions touching j carry at least flux_thr of the flux of i at some time, all chemicals without targets
+    """
+    if len(idx_targets) == 0:
+
+        return np.arange(net.n_species)
+    # reactions touching species j, from both sides of the incidence index
+    touch = np.zeros((net.n_reactions, net.n_species))
+    touch[np.repeat(np.arange(net.n_reactions), np.diff(net.change_indptr)), net.change_indices] = 1.
+    touch[net.incidence_indices, np.repeat(np.arange(net.n_species), np.diff(net.incidence_indptr))] = 1.
+    coupling = np.max(share @ touch, axis = 0) >= flux_thr
+    important = np.zeros(net.n_species, dtype = bool)
+    stack = list(idx_targets)
+    while stack:
+
+        idx_chemi = stack.pop()
+        if important[idx_chemi]:
+
+            continue
+        important[idx_chemi] = True
+        stack += np.nonzero(coupling[idx_chemi] & ~important)[0].tolist()
+    return np.nonzero(important)[0]
+
+def __equilibria__(reactions, rates, eq_thr):
+
+    """
+    pairs of mutually reverse reactions whose net rate stays a small fraction of their gross rate
+    """
+    signature = lambda species, stois: tuple(sorted(zip([id(ichemi) for ichemi in species], stois)))
+    pairs = []
+    for idx_rxn, irxn in enumerate(reactions):
+
+        forward = (signature(irxn.rxtns, irxn.stois[:irxn.n_rxtns]), signature(irxn.prdts, irxn.stois[irxn.n_rxtns:]))
+        for jdx_rxn in range(idx_rxn + 1, len(reactions)):
+
+            jrxn = reactions[jdx_rxn]
+            backward = (signature(jrxn.prdts, jrxn.stois[jrxn.n_rxtns:]), signature(jrxn.rxtns, jrxn.stois[:jrxn.n_rxtns]))
+            if forward != backward:
+
+                continue
+            gross = rates[:, idx_rxn] + rates[:, jdx_rxn]
+            net_rate = np.abs(rates[:, idx_rxn] - rates[:, jdx_rxn])
+            if np.all(net_rate <= eq_thr*gross) and np.any(gross > 0):
+
+                pairs.append((irxn, jrxn))
+    return pairs
+
+def __eliminate_qss__(chemi, reactions):
+
+    """
+    eliminate quasi-steady-state chemical decaying only by first order reactions chemi -> products,
+    its producers directly form the products of its decay channels, branched by k_c/sum(k_c).
+    Return new reactions list, or None if chemi is not in this form
+    """
+    from chemgaloo import reaction
+    consumers, producers, others = [], [], []
+    for irxn in reactions:
+
+        in_rxtns = any(ichemi is chemi for ichemi in irxn.rxtns)
+        in_prdts = any(ichemi is chemi for ichemi in irxn.prdts)
+        if in_rxtns:
+
+            if in_prdts or (irxn.n_rxtns != 1) or (irxn.stois[0] != 1):
+
+                return None
+            consumers.append(irxn)
+        elif in_prdts:
+
+            producers.append(irxn)
+        else:
+
+            others.append(irxn)
+    k_sum = sum([irxn.k for irxn in consumers])
+    if (not consumers) or (k_sum <= 0):
+
+        return None
+    branches = [irxn.k/k_sum for irxn in consumers]
+    for irxn in producers:
+
+        prdts, stois = [], []
+        def add(ichemi, isto):
+
+            for idx_prdt in range(len(prdts)):
+
+                if prdts[idx_prdt] is ichemi:
+
+                    stois[idx_prdt] += isto
+                    return
+            prdts.append(ichemi)
+            stois.append(isto)
+
+        s_qss = 0.
+        for idx_prdt in range(irxn.n_prdts):
+
+            if irxn.prdts[idx_prdt] is chemi:
+
+                s_qss += irxn.stois[irxn.n_rxtns + idx_prdt]
+            else:
+
+                add(irxn.prdts[idx_prdt], irxn.stois[irxn.n_rxtns + idx_prdt])
+        for icons, ibranch in zip(consumers, branches):
+
+            for idx_prdt in range(icons.n_prdts):
+
+                add(icons.prdts[idx_prdt], s_qss*ibranch*icons.stois[1 + idx_prdt])
+        deltaH = irxn.deltaH + s_qss*sum([ibranch*icons.deltaH for icons, ibranch in zip(consumers, branches)])
+        others.append(reaction(
+            rxtns = list(irxn.rxtns), prdts = prdts, stois = list(irxn.stois[:irxn.n_rxtns]) + stois, k = irxn.k,
+            deltaH = deltaH, rate_law = irxn.rate_law, A = irxn.A, Ea = irxn.Ea, n = irxn.n, barrier = irxn.barrier
+            ))
+    # keep reactions in their original order as far as possible
+    order = {id(irxn): idx_rxn for idx_rxn, irxn in enumerate(reactions)}
+    return sorted(others, key = lambda irxn: order.get(id(irxn), len(reactions)))
+
+def reduce(
+    chemicals = [],
+    reactions = [],
+    reference = None,
+    record_times = None,
+    targets = [],
+    flux_thr = 1e-3,
+    t_fast = None,
+    pointer_thr = 0.9,
+    eq_thr = 1e-2,
+    dt = 0.01,
+    integrator = 'rosenbrock',
+    rtol = 1e-6,
+    atol = 1e-9
+):
+    """
+    Reduce a mechanism along a reference batch reactor simulation: reactions whose share in the flux of every
+    chemical stays below flux_thr are pruned, quasi-steady-state (QSS) chemicals found by timescale analysis are
+    eliminated, chemicals left without reactions are dropped, and the reduced mechanism is simulated again to
+    report its error. Chemicals and reactions given are not modified, reactions changed by reduction are new
+    objects, so the result can be passed to bstr or cstr directly.\n
+    A QSS chemical is eliminated when it decays only by first order reactions X -> products, then its producers
+    form the products of the decay channels directly, branched by k/sum(k) at present reaction.k, which covers
+    fast pre-equilibria X <=> A too. QSS chemicals in other forms cannot be written as mass-action reactions and
+    are kept and reported\n
+    Parameters:
+    ---
+    chemicals: 1-d array, class: chemgaloo.chemical
+        all chemicals in reactor, present concentrations are initial concentrations of the reference simulation
+    reactions: 1-d array, class: chemgaloo.reaction
+        all possible reactions in reactor
+    reference: tuple
+        (time, chem_c_log) of a reference simulation, e.g. first two returns of bstr, chem_c_log[0] is taken as
+        initial state. If not given, the reference is simulated at record_times
+    record_times: 1-d array, float
+        time points of reference simulation, only used if reference is not given
+    targets: 1-d array, class: chemgaloo.chemical
+        chemicals that are never eliminated or dropped, error is measured on them, if not given, all chemicals
+        kept in reduced mechanism
+    flux_thr: float
+        threshold of flux share: chemicals carrying at least flux_thr of the flux of an important chemical are
+        important too, starting from targets, reactions below flux_thr in every important chemical are pruned
+    t_fast: float
+        modes faster than t_fast are fast, if not given, the mean interval of reference time points
+    pointer_thr: float
+        minimal CSP pointer (see timescales) of a QSS chemical at every time point after start
+    eq_thr: float
+        reverse reaction pairs whose net rate stays below eq_thr of gross rate are reported as fast equilibria
+    dt, integrator, rtol, atol:
+        see chemgaloo.reactor.bstr
+    Return:
+    ---
+    chemicals: 1-d array, class: chemgaloo.chemical
+        chemicals of reduced mechanism, the same objects as given
+    reactions: 1-d array, class: chemgaloo.reaction
+        reactions of reduced mechanism
+    report: dict
+        'pruned': reactions pruned\n
+        'qss': chemicals eliminated as QSS\n
+        'qss_kept': QSS chemicals that cannot be eliminated\n
+        'dropped': chemicals left without reactions\n
+        'equilibria': pairs of reactions in fast equilibrium\n
+        'pointer': CSP pointers, (n_time, n_species)\n
+        'tau': timescales of full mechanism, (n_time, n_species)\n
+        'error': maximal deviation of targets from reference, relative to peak concentration of every target\n
+    """
+    net = network.compile(chemicals = chemicals, reactions = reactions)
+    if reference is None:
+
+        if record_times is None:
+
+            raise ValueError('either reference or record_times should be given')
+        time = np.sort(np.asarray(record_times, dtype = float))
+        c_ref = reactor.__bstr_sweep_cases__(
+            net, net.k[np.newaxis], net.c0()[np.newaxis], dt = dt, nstep = int(np.ceil(time[-1]/dt)),
+            integrator = integrator, rtol = rtol, atol = atol, record_times = time
+            )[1][:, 0]
+    else:
+
+        time = np.asarray(reference[0], dtype = float)
+        c_ref = np.asarray(getattr(reference[1], 'array', reference[1]), dtype = float)[:, :net.n_species]
+    if t_fast is None:
+
+        t_fast = (time[-1] - time[0])/max(len(time) - 1, 1)
+    c_ref_pos = np.maximum(c_ref, 0.)
+    target_ids = set([id(ichemi) for ichemi in targets])
+
+    # prune reactions by flux share in important chemicals, found from targets by directed relation graph
+    share = flux_contributions(net, c_ref_pos)
+    important = __important__(net, share, [net.index[id(ichemi)] for ichemi in targets], flux_thr)
+    keep = np.max(share[:, important], axis = (0, 1), initial = 0.) >= flux_thr
+    pruned = [irxn for irxn, ikeep in zip(reactions, keep) if not ikeep]
+    kept = [irxn for irxn, ikeep in zip(reactions, keep) if ikeep]
+
+    # QSS candidates from timescales of the full mechanism, strongest pointer first
+    tau, pointer = timescales(net, c_ref_pos, t_fast = t_fast)
+    strength = np.min(pointer[1:] if len(pointer) > 1 else pointer, axis = 0)
+    qss, qss_kept = [], []
+    for idx_chemi in np.argsort(-strength):
+
+        ichemi = chemicals[idx_chemi]
+        if (strength[idx_chemi] < pointer_thr) or (id(ichemi) in target_ids):
+
+            continue
+        reduced = __eliminate_qss__(ichemi, kept)
+        if reduced is None:
+
+            qss_kept.append(ichemi)
+        else:
+
+            qss.append(ichemi)
+            kept = reduced
+    # rates of kept reactions at reference states, pruning and QSS elimination shift positions in kept,
+    # so columns of the full network are found by reaction, lumped reactions need a network of their own
+    column = {id(irxn): idx_rxn for idx_rxn, irxn in enumerate(reactions)}
+    if all([id(irxn) in column for irxn in kept]):
+
+        rates_kept = net.rate(c_ref_pos)[:, [column[id(irxn)] for irxn in kept]]
+    else:
+
+        rates_kept = network.compile(chemicals = chemicals, reactions = kept).rate(c_ref_pos)
+    equilibria = __equilibria__(kept, rates_kept[1:], eq_thr) if len(time) > 1 else []
+    # drop chemicals that no reaction touches anymore
+    touched = set()
+    for irxn in kept:
+
+        touched |= set([id(ichemi) for ichemi in list(irxn.rxtns) + list(irxn.prdts)])
+    qss_ids = set([id(ichemi) for ichemi in qss])
+    chemicals_red = [
+        ichemi for ichemi in chemicals
+        if (id(ichemi) in target_ids) or ((id(ichemi) in touched) and (id(ichemi) not in qss_ids))
+        ]
+    dropped = [ichemi for ichemi in chemicals if (ichemi not in chemicals_red) and (id(ichemi) not in qss_ids)]
+
+    # error of reduced mechanism on the reference time points
+    net_red = network.compile(chemicals = chemicals_red, reactions = kept)
+    idx_full = np.array([net.index[id(ichemi)] for ichemi in chemicals_red], dtype = int)
+    c_red = reactor.__bstr_sweep_cases__(
+        net_red, net_red.k[np.newaxis], c_ref[0, idx_full][np.newaxis], dt = dt, nstep = int(np.ceil(time[-1]/dt)),
+        integrator = integrator, rtol = rtol, atol = atol, record_times = time
+        )[1][:, 0]
+    idx_target = [idx for idx, ichemi in enumerate(chemicals_red) if (not target_ids) or (id(ichemi) in target_ids)]
+    peak = np.maximum(np.max(np.abs(c_ref[:, idx_full[idx_target]]), axis = 0), atol)
+    error = float(np.max(np.abs(c_red[:, idx_target] - c_ref[:, idx_full[idx_target]])/peak, initial = 0.))
+    report = {
+        'pruned': pruned, 'qss': qss, 'qss_kept': qss_kept, 'dropped': dropped, 'equilibria': equilibria,
+        'pointer': pointer, 'tau': tau, 'error': error
+        }
+    return chemicals_red, kept, report
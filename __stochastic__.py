@@ -0,0 +1,604 @@
+"""
+Stochastic simulation library of Chemgaloo
+"""
+import math
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import __network__ as network
+import __integrator__ as ode
+import __parallel__ as parallel
+
+class priority_queue:
+    """
+    Indexed binary min-heap of putative reaction times, the position of every reaction in heap is
+    tracked so that the time of any reaction is updated in O(log M)\n
+    Parameters:
+    ---
+    times: 1-d array, float
+        initial putative time of every reaction, math.inf for reactions that cannot fire
+    """
+    def __init__(self, times = []):
+
+        self.times = list(times)
+        self.heap = list(range(len(self.times)))
+        self.heap.sort(key = lambda idx_rxn: self.times[idx_rxn])
+        self.pos = [0]*len(self.times)
+        for ipos in range(len(self.heap)):
+
+            self.pos[self.heap[ipos]] = ipos
+
+    def top(self):
+        """
+        index and time of the earliest reaction
+        """
+        return self.heap[0], self.times[self.heap[0]]
+
+    def update(self, idx_rxn, time):
+        """
+        change putative time of reaction idx_rxn and restore heap order
+        """
+        time_old = self.times[idx_rxn]
+        self.times[idx_rxn] = time
+        if time < time_old:
+
+            self.__sift_up__(self.pos[idx_rxn])
+        elif time > time_old:
+
+            self.__sift_down__(self.pos[idx_rxn])
+
+    def __swap__(self, ipos, jpos):
+
+        heap = self.heap
+        heap[ipos], heap[jpos] = heap[jpos], heap[ipos]
+        self.pos[heap[ipos]] = ipos
+        self.pos[heap[jpos]] = jpos
+
+    def __sift_up__(self, ipos):
+
+        heap, times = self.heap, self.times
+        while ipos > 0:
+
+            iparent = (ipos - 1)//2
+            if times[heap[ipos]] >= times[heap[iparent]]:
+
+                break
+            self.__swap__(ipos, iparent)
+            ipos = iparent
+
+    def __sift_down__(self, ipos):
+
+        heap, times = self.heap, self.times
+        n_heap = len(heap)
+        while True:
+
+            ichild = 2*ipos + 1
+            if ichild >= n_heap:
+
+                break
+            if (ichild + 1 < n_heap) and (times[heap[ichild + 1]] < times[heap[ichild]]):
+
+                ichild += 1
+            if times[heap[ichild]] >= times[heap[ipos]]:
+
+                break
+            self.__swap__(ipos, ichild)
+            ipos = ichild
+
+class stochastic_network:
+    """
+    Reaction network converted to molecule counts in a fixed volume, propensity of reaction j is
+    a_j = c_j * prod_i x_i*(x_i - 1)*...*(x_i - order_ij + 1), c_j = k_j / (NA*volume)^(total order - 1)\n
+    Parameters:
+    ---
+    net: chemgaloo.network.network
+        compiled network
+    volume: float
+        reaction volume, c_unit*volume should be in mol, e.g. L for mol/L
+    NA: float
+        Avogadro constant, same as chemgaloo.NA
+    """
+    def __init__(self, net, volume = 1e-15, NA = 6.02E23):
+
+        self.n_species = net.n_species
+        self.n_reactions = net.n_reactions
+        self.volume = volume
+        self.omega = NA*volume
+        # sparse networks keep stoi sparse, only leaping methods expand it
+        self.stoi = net.stoi.astype(np.int64)
+        # python lists, events are processed one by one and scalar access to lists is the fastest,
+        # all tables are read from the padded reactant table and incidence index of network
+        rxtn_mask = net.__rxtn_ord__ > 0
+        self.rxtn_idx = []
+        self.rxtn_ord = []
+        self.change = []
+        self.c_stoch = []
+        for idx_rxn in range(self.n_reactions):
+
+            self.rxtn_idx.append(net.__rxtn_idx__[idx_rxn, rxtn_mask[idx_rxn]].tolist())
+            self.rxtn_ord.append(np.rint(net.__rxtn_ord__[idx_rxn, rxtn_mask[idx_rxn]]).astype(int).tolist())
+            ch_slice = slice(net.change_indptr[idx_rxn], net.change_indptr[idx_rxn + 1])
+            self.change.append(list(zip(
+                net.change_indices[ch_slice].tolist(), np.rint(net.change_stoi[ch_slice]).astype(int).tolist()
+                )))
+            self.c_stoch.append(float(net.k[idx_rxn]) / self.omega**(sum(self.rxtn_ord[-1]) - 1))
+        # reaction j affects propensity of reaction i if j changes any reactant of i
+        dep_indptr, dep_indices = net.dependency_graph()
+        self.dependents = [
+            dep_indices[dep_indptr[idx_rxn]:dep_indptr[idx_rxn + 1]].tolist() for idx_rxn in range(self.n_reactions)
+            ]
+        # padded reactant table for vectorized propensities, as network.__rxtn_idx__
+        self.__rxtn_idx__ = net.__rxtn_idx__
+        self.__rxtn_ord__ = np.rint(net.__rxtn_ord__).astype(np.int64)
+        self.__max_ord__ = int(np.max(self.__rxtn_ord__, initial = 0))
+        self.__c_stoch__ = np.array(self.c_stoch)
+        # highest total order of reactions consuming each species, and the largest number of its molecules
+        # consumed by a reaction of that order, for step selection of tau-leaping
+        self.hor = np.zeros(self.n_species, dtype = np.int64)
+        self.hor_mol = np.zeros(self.n_species, dtype = np.int64)
+        for idx_rxn in range(self.n_reactions):
+
+            total = sum(self.rxtn_ord[idx_rxn])
+            for idx, order in zip(self.rxtn_idx[idx_rxn], self.rxtn_ord[idx_rxn]):
+
+                if total > self.hor[idx]:
+
+                    self.hor[idx], self.hor_mol[idx] = total, order
+                elif total == self.hor[idx]:
+
+                    self.hor_mol[idx] = max(self.hor_mol[idx], order)
+
+    def counts(self, c):
+        """
+        concentrations to molecule counts, rounded to nearest integer
+        """
+        return np.rint(np.asarray(c, dtype = float)*self.omega).astype(np.int64)
+
+    def concentrations(self, x):
+        """
+        molecule counts to concentrations
+        """
+        return np.asarray(x, dtype = float)/self.omega
+
+    def propensity(self, x, idx_rxn):
+        """
+        propensity of reaction idx_rxn at counts x
+        """
+        a = self.c_stoch[idx_rxn]
+        for idx, order in zip(self.rxtn_idx[idx_rxn], self.rxtn_ord[idx_rxn]):
+
+            n = x[idx]
+            for iorder in range(order):
+
+                a *= n - iorder
+            if a <= 0:
+
+                return 0.
+        return a
+
+    def propensities(self, x):
+        """
+        propensities of all reactions at counts x, vectorized over leading axes of x (..., n_species),
+        counts may be non-integer in hybrid simulation
+        """
+        x_rxtn = np.asarray(x, dtype = float)[..., self.__rxtn_idx__]
+        a = np.broadcast_to(self.__c_stoch__, x_rxtn.shape[:-1]).copy()
+        for iorder in range(self.__max_ord__):
+
+            a *= np.prod(np.where(self.__rxtn_ord__ > iorder, np.maximum(x_rxtn - iorder, 0.), 1.), axis = -1)
+        return a
+
+    def g(self, x):
+        """
+        g_i of Cao, Gillespie and Petzold, relative change of propensities is bounded by g_i times relative
+        change of x_i
+        """
+        x1 = np.maximum(np.asarray(x, dtype = float) - 1, 1.)
+        x2 = np.maximum(np.asarray(x, dtype = float) - 2, 1.)
+        # chemicals consumed by no reaction do not bound the leap, g = 1 keeps them finite
+        g = np.where(self.hor > 0, self.hor, 1).astype(float)
+        g = np.where((self.hor == 2) & (self.hor_mol == 2), 2 + 1/x1, g)
+        g = np.where((self.hor == 3) & (self.hor_mol == 2), 1.5*(2 + 1/x1), g)
+        g = np.where((self.hor == 3) & (self.hor_mol == 3), 3 + 1/x1 + 2/x2, g)
+        return g
+
+def __next_reaction__(snet, x0, record_times, rng, t0 = 0.):
+
+    """
+    one realization by the next reaction method of Gibson and Bruck, counts are recorded at record_times
+    as the state holding at that time\n
+    Return:
+    ---
+    x_log: 2-d array, int
+        x_log[index_of_time][index_of_chemical]
+    n_event: int
+        number of reaction events
+    """
+    x = [int(ix) for ix in x0]
+    x_log = np.empty((len(record_times), snet.n_species), dtype = np.int64)
+    n_rand = 4096
+    rand = rng.exponential(size = n_rand).tolist()
+    i_rand = 0
+
+    a = [snet.propensity(x, idx_rxn) for idx_rxn in range(snet.n_reactions)]
+    times = []
+    for idx_rxn in range(snet.n_reactions):
+
+        times.append(t0 + rand[i_rand]/a[idx_rxn] if a[idx_rxn] > 0 else math.inf)
+        i_rand += 1
+        if i_rand == n_rand:
+
+            rand = rng.exponential(size = n_rand).tolist()
+            i_rand = 0
+    queue = priority_queue(times)
+    times = queue.times
+
+    idx_time = 0
+    n_time = len(record_times)
+    n_event = 0
+    while idx_time < n_time:
+
+        mu, t_next = queue.top()
+        while (idx_time < n_time) and (record_times[idx_time] < t_next):
+
+            x_log[idx_time] = x
+            idx_time += 1
+        if idx_time == n_time:
+
+            break
+        t = t_next
+        n_event += 1
+        for idx, dx in snet.change[mu]:
+
+            x[idx] += dx
+        for idx_rxn in snet.dependents[mu]:
+
+            a_old = a[idx_rxn]
+            a_new = snet.propensity(x, idx_rxn)
+            a[idx_rxn] = a_new
+            if a_new <= 0:
+
+                queue.update(idx_rxn, math.inf)
+            elif (idx_rxn != mu) and (a_old > 0):
+                # reuse the unexpired waiting time, rescaled to the new propensity
+                queue.update(idx_rxn, t + (a_old/a_new)*(times[idx_rxn] - t))
+            else:
+
+                queue.update(idx_rxn, t + rand[i_rand]/a_new)
+                i_rand += 1
+                if i_rand == n_rand:
+
+                    rand = rng.exponential(size = n_rand).tolist()
+                    i_rand = 0
+    return x_log, n_event
+
+def __tau_leaping__(snet, x0, record_times, rng, t0 = 0., eps = 0.03, n_critical = 10, n_ssa = 100):
+
+    """
+    one realization by adaptive tau-leaping with step selection of Cao, Gillespie and Petzold (2006), reactions
+    close to exhausting a reactant are critical and fire at most once per leap, exact steps are taken when the
+    leap would be shorter than a few exact steps\n
+    Return:
+    ---
+    x_log: 2-d array, float
+        x_log[index_of_time][index_of_chemical]
+    n_event: int
+        number of leaps and exact steps
+    """
+    x = np.array(x0, dtype = np.int64)
+    x_log = np.empty((len(record_times), snet.n_species))
+    stoi = snet.stoi.toarray() if hasattr(snet.stoi, 'toarray') else snet.stoi
+    consumed = np.maximum(-stoi, 0)
+    is_rxtn = np.any(consumed > 0, axis = 1)
+
+    t = t0
+    idx_time = 0
+    n_time = len(record_times)
+    n_event = 0
+    while (idx_time < n_time) and (record_times[idx_time] <= t):
+
+        x_log[idx_time] = x
+        idx_time += 1
+    while idx_time < n_time:
+
+        t_rec = record_times[idx_time]
+        a = snet.propensities(x)
+        a0 = np.sum(a)
+        if a0 <= 0:
+
+            x_log[idx_time:] = x
+            break
+        # number of times each reaction can fire before a reactant runs out
+        with np.errstate(divide = 'ignore'):
+
+            n_fire = np.min(np.where(consumed > 0, x[:, np.newaxis]//np.maximum(consumed, 1), np.inf), axis = 0)
+        critical = (a > 0) & (n_fire < n_critical)
+        a_nc = np.where(critical, 0., a)
+        mu = stoi @ a_nc
+        sigma2 = (stoi**2) @ a_nc
+        bound = np.maximum(eps*x/snet.g(x), 1.)
+        with np.errstate(divide = 'ignore'):
+
+            tau1 = np.min(np.where(is_rxtn & (mu != 0), bound/np.abs(mu), np.inf), initial = np.inf)
+            tau1 = min(tau1, np.min(np.where(is_rxtn & (sigma2 > 0), bound**2/sigma2, np.inf), initial = np.inf))
+
+        if tau1 < 10/a0:
+            # leap too short to pay off, take exact steps of the direct method, propensities of
+            # dependent reactions only are refreshed after each event
+            x_list = x.tolist()
+            a_list = a.tolist()
+            rand = rng.random(size = 2*n_ssa).tolist()
+            for issa in range(n_ssa):
+
+                tau = -math.log(1 - rand[2*issa])/a0
+                if t + tau > t_rec:
+
+                    t = t_rec
+                    break
+                t += tau
+                target = rand[2*issa + 1]*a0
+                mu_fire = 0
+                while (mu_fire < snet.n_reactions - 1) and (target >= a_list[mu_fire]):
+
+                    target -= a_list[mu_fire]
+                    mu_fire += 1
+                for idx, dx in snet.change[mu_fire]:
+
+                    x_list[idx] += dx
+                for idx_rxn in snet.dependents[mu_fire]:
+
+                    a_list[idx_rxn] = snet.propensity(x_list, idx_rxn)
+                n_event += 1
+                a0 = sum(a_list)
+                if a0 <= 0:
+
+                    break
+            x = np.array(x_list, dtype = np.int64)
+        else:
+
+            a0_c = np.sum(a[critical])
+            while True:
+
+                tau2 = rng.exponential()/a0_c if a0_c > 0 else np.inf
+                tau = min(tau1, tau2, t_rec - t)
+                k = rng.poisson(a_nc*tau)
+                if tau == tau2:
+
+                    a_c = np.where(critical, a, 0.)
+                    mu_fire = np.searchsorted(np.cumsum(a_c), rng.random()*a0_c, side = 'right')
+                    k[min(mu_fire, snet.n_reactions - 1)] += 1
+                x_new = x + stoi @ k
+                if np.all(x_new >= 0):
+
+                    break
+                tau1 = 0.5*tau1
+            x = x_new
+            t = t_rec if tau == t_rec - t else t + tau
+            n_event += 1
+        while (idx_time < n_time) and (record_times[idx_time] <= t):
+
+            x_log[idx_time] = x
+            idx_time += 1
+    return x_log, n_event
+
+def __hybrid__(
+    snet, x0, record_times, rng, t0 = 0., integrator = 'rosenbrock', n_fast = 100, fast_events = 10,
+    n_substep = 10, rtol = 1e-6, atol = 1e-6
+):
+    """
+    one realization by hybrid simulation, reactions are re-partitioned at every recording interval and after
+    every stochastic event. A reaction is fast if it is expected to fire at least fast_events times in the interval
+    and every chemical it changes has at least n_fast molecules, fast reactions are integrated as rate equations
+    of counts, slow reactions fire stochastically with propensities that vary along the deterministic trajectory:
+    the next slow event occurs when integral of total slow propensity reaches an exponential random number,
+    located on dense output\n
+    Return:
+    ---
+    x_log: 2-d array, float
+        x_log[index_of_time][index_of_chemical], counts of chemicals driven by fast reactions are continuous
+    n_event: int
+        number of slow events
+    """
+    stoi = (snet.stoi.toarray() if hasattr(snet.stoi, 'toarray') else snet.stoi).astype(float)
+    # only chemicals changed by a reaction need to be abundant, catalysts stay discrete
+    involved = stoi != 0
+    x = np.array(x0, dtype = float)
+    x_log = np.empty((len(record_times), snet.n_species))
+
+    t = t0
+    idx_time = 0
+    n_time = len(record_times)
+    n_event = 0
+    while (idx_time < n_time) and (record_times[idx_time] <= t):
+
+        x_log[idx_time] = x
+        idx_time += 1
+    while idx_time < n_time:
+
+        t_rec = record_times[idx_time]
+        a = snet.propensities(x)
+        n_min = np.min(np.where(involved, x[:, np.newaxis], np.inf), axis = 0)
+        fast = (a*(t_rec - t) >= fast_events) & (n_min >= n_fast)
+        stoi_fast = stoi[:, fast]
+        slow = ~fast
+
+        def f(ti, y):
+
+            ai = snet.propensities(y[:-1])
+            return np.concatenate((stoi_fast @ ai[fast], [np.sum(ai[slow])]))
+
+        threshold = rng.exponential()
+        y = np.concatenate((x, [0.]))
+        fy = f(t, y)
+        t_hit = None
+        if np.any(fast):
+
+            for ti, yi in ode.integrate(
+                f, y, dt = (t_rec - t)/n_substep, nstep = n_substep, method = integrator,
+                rtol = rtol, atol = atol, t0 = t
+                ):
+
+                fi = f(ti, yi)
+                if yi[-1] >= threshold:
+
+                    t_prev, y_prev, f_prev = t, y, fy
+                    t_hit = ode.locate(
+                        lambda tj: ode.hermite(t_prev, y_prev, f_prev, ti, yi, fi, tj)[-1] - threshold,
+                        t_prev, ti, y_prev[-1] - threshold, yi[-1] - threshold
+                        )
+                    y = ode.hermite(t_prev, y_prev, f_prev, ti, yi, fi, t_hit)
+                    break
+                t, y, fy = ti, yi, fi
+        elif fy[-1]*(t_rec - t) >= threshold:
+            # no fast reactions, slow propensities are constant until next event
+            t_hit = t + threshold/fy[-1]
+        t = t_rec if t_hit is None else t_hit
+        if np.any(fast):
+
+            x = np.maximum(y[:-1], 0.)
+        if t_hit is not None:
+
+            a_slow = np.where(slow, snet.propensities(x), 0.)
+            mu_fire = np.searchsorted(np.cumsum(a_slow), rng.random()*np.sum(a_slow), side = 'right')
+            x = np.maximum(x + stoi[:, min(mu_fire, snet.n_reactions - 1)], 0.)
+            n_event += 1
+        while (idx_time < n_time) and (record_times[idx_time] <= t):
+
+            x_log[idx_time] = x
+            idx_time += 1
+    return x_log, n_event
+
+__METHODS__ = {'next_reaction': __next_reaction__, 'tau_leaping': __tau_leaping__, 'hybrid': __hybrid__}
+
+def __ssa_runs__(snet, x0, record_times, seeds, method = 'next_reaction', options = {}):
+
+    """
+    run one realization for every seed and stack counts as (n_time, n_runs, n_species)
+    """
+    if method not in __METHODS__:
+
+        raise ValueError('unknown stochastic method: {}'.format(method))
+    x_log = np.empty((len(record_times), len(seeds), snet.n_species))
+    n_event = 0
+    for irun in range(len(seeds)):
+
+        x_log[:, irun], n_event_run = __METHODS__[method](
+            snet, x0, record_times, np.random.default_rng(seeds[irun]), **options
+            )
+        n_event += n_event_run
+    return x_log, n_event
+
+def __worker_ssa__(task):
+
+    seeds, options = task
+    return __ssa_runs__(parallel.__WORKER_STATE__['snet'], seeds = seeds, **options)
+
+def ssa(
+    chemicals = [],
+    reactions = [],
+    volume = 1e-15,
+    c_unit = 'mol/L',
+    dt = 0.01,
+    nstep = 1000,
+    t_unit = 'second',
+    record_times = None,
+    n_runs = 1,
+    method = 'next_reaction',
+    seed = None,
+    n_workers = 1,
+    NA = 6.02E23,
+    eps = 0.03,
+    n_critical = 10,
+    integrator = 'rosenbrock',
+    n_fast = 100,
+    fast_events = 10
+):
+    """
+    Stochastic batch reactor, chemicals are counted as molecules in volume and reactions fire one by one\n
+    Parameters:
+    ---
+    chemicals: 1-d array, class: chemgaloo.chemical
+        all chemicals in reactor, initial counts are round(concentration*NA*volume)
+    reactions: 1-d array, class: chemgaloo.reaction
+        all possible reactions in reactor, orders should be integers
+    volume: float
+        reaction volume, c_unit*volume should be in mol, e.g. L for mol/L
+    c_unit: str
+        unit of concentration
+    dt: float
+        interval of time grid that realizations are recorded on
+    nstep: int
+        number of intervals, total time = nstep * dt
+    t_unit: str
+        unit of time
+    record_times: 1-d array, float
+        if given, record realizations at these times instead of dt*[0, 1, ..., nstep]
+    n_runs: int
+        number of independent realizations
+    method: str
+        simulation method, options:
+    >'next_reaction': exact, next reaction method of Gibson and Bruck, one event costs O(log n_reactions) with
+    dependency graph and indexed priority queue\n
+    >'tau_leaping': approximate, adaptive tau-leaping of Cao, Gillespie and Petzold, many events per step when
+    copy numbers are large, falls back to exact steps when copy numbers are small\n
+    >'hybrid': fast reactions among abundant chemicals are integrated deterministically by integrator, rare
+    reactions stay stochastic, reactions are re-partitioned at every dt and after every stochastic event\n
+    seed: int
+        seed of random numbers, every realization gets an independent stream spawned from it
+    n_workers: int
+        number of worker processes realizations are split over, 1 to run in present process
+    NA: float
+        Avogadro constant
+    eps: float
+        bound of relative change of propensities in one leap, only for method 'tau_leaping'
+    n_critical: int
+        reactions that can fire fewer times than n_critical before exhausting a reactant are simulated exactly,
+        only for method 'tau_leaping'
+    integrator: str
+        integrator of fast reactions, see chemgaloo.reactor.bstr, only for method 'hybrid'
+    n_fast: float
+        minimal number of molecules of every chemical involved in a fast reaction, only for method 'hybrid'
+    fast_events: float
+        minimal expected number of events in dt of a fast reaction, only for method 'hybrid'
+    Return:
+    ---
+    time: 1-d array, float
+        time grid
+    chem_c_log: 3-d array, float
+        chem_c_log[index_of_time][index_of_run][index_of_chemical], concentrations of every realization
+    chem_c_mean: 2-d array, float
+        chem_c_mean[index_of_time][index_of_chemical], mean over realizations
+    chem_c_std: 2-d array, float
+        chem_c_std[index_of_time][index_of_chemical], standard deviation over realizations
+    """
+    net = network.compile(chemicals = chemicals, reactions = reactions)
+    snet = stochastic_network(net, volume = volume, NA = NA)
+    x0 = snet.counts(net.c0())
+    if record_times is None:
+
+        record_times = dt*np.arange(nstep + 1)
+    record_times = np.sort(np.asarray(record_times, dtype = float))
+    seeds = np.random.SeedSequence(seed).spawn(n_runs)
+    options = {'x0': x0, 'record_times': record_times, 'method': method, 'options': {}}
+    if method == 'tau_leaping':
+
+        options['options'] = {'eps': eps, 'n_critical': n_critical}
+    elif method == 'hybrid':
+
+        options['options'] = {'integrator': integrator, 'n_fast': n_fast, 'fast_events': fast_events}
+
+    if n_workers > 1:
+
+        tasks = [(seeds[i:j], options) for i, j in parallel.__chunks__(n_runs, n_workers, None)]
+        with ProcessPoolExecutor(
+            max_workers = n_workers, initializer = parallel.__worker_init__,
+            initargs = (pickle.dumps({'snet': snet}),)
+            ) as executor:
+
+            results = list(executor.map(__worker_ssa__, tasks))
+        x_log = np.concatenate([iresult[0] for iresult in results], axis = 1)
+    else:
+
+        x_log, _ = __ssa_runs__(snet, seeds = seeds, **options)
+    chem_c_log = snet.concentrations(x_log)
+    return record_times, chem_c_log, np.mean(chem_c_log, axis = 1), np.std(chem_c_log, axis = 1)
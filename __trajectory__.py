@@ -0,0 +1,476 @@
+"""
+Trajectory storage of Chemgaloo
+"""
+import os
+import json
+import numpy as np
+from __integrator__ import hermite
+
+class trajectory:
+    """
+    Concentrations recorded in a preallocated float64 array of shape (n_time, ...state shape),
+    grown geometrically when more points than capacity are appended\n
+    Indexing by chemical is kept compatible with the former nested-list chem_c_log:
+    traj[index_of_chemical][index_of_time], where traj[index_of_chemical] is a zero-copy view\n
+    Parameters:
+    ---
+    shape: int or tuple
+        shape of one recorded state, n_species for bstr, (n_cases, n_species) for sweeps
+    capacity: int
+        number of time points preallocated
+    sink: sink object, e.g. chemgaloo.trajectory.callback_sink
+        if given, points are streamed to sink in chunks of sink.chunk_size instead of growing,
+        and only the last chunk is kept in memory
+    """
+    def __init__(self, shape, capacity = 1024, sink = None):
+
+        self.shape = tuple(np.atleast_1d(shape))
+        self.sink = sink
+        if sink is not None:
+
+            capacity = sink.chunk_size
+        self.__data__ = np.empty((max(1, capacity),) + self.shape)
+        self.__time__ = np.empty(max(1, capacity))
+        self.n_time = 0
+        # number of leading points already written to sink
+        self.__n_flushed__ = 0
+
+    def __grow__(self):
+
+        self.__data__ = np.concatenate((self.__data__, np.empty_like(self.__data__)))
+        self.__time__ = np.concatenate((self.__time__, np.empty_like(self.__time__)))
+
+    def append(self, t, c):
+        """
+        record state c at time t
+        """
+        if self.n_time == len(self.__time__):
+
+            if self.sink is None:
+
+                self.__grow__()
+            else:
+
+                self.flush()
+                self.n_time = 0
+                self.__n_flushed__ = 0
+        self.__time__[self.n_time] = t
+        self.__data__[self.n_time] = c
+        self.n_time += 1
+
+    def flush(self):
+        """
+        write points not yet streamed to sink
+        """
+        if (self.sink is not None) and (self.n_time > self.__n_flushed__):
+
+            self.sink.write(
+                self.__time__[self.__n_flushed__:self.n_time], self.__data__[self.__n_flushed__:self.n_time]
+                )
+            self.__n_flushed__ = self.n_time
+
+    def close(self):
+        """
+        flush and close sink, points of the last chunk are still kept
+        """
+        if self.sink is not None:
+
+            self.flush()
+            self.sink.close()
+
+    @property
+    def time(self):
+        """
+        recorded time points, 1-d view
+        """
+        return self.__time__[:self.n_time]
+
+    @property
+    def array(self):
+        """
+        recorded states, view of shape (n_time, ...state shape)
+        """
+        return self.__data__[:self.n_time]
+
+    def species(self, idx_chemi):
+        """
+        concentrations of one chemical at all time points, zero-copy view
+        """
+        return self.__data__[:self.n_time, ..., idx_chemi]
+
+    def at(self, idx_time):
+        """
+        concentrations of all chemicals at one time point, zero-copy view
+        """
+        return self.array[idx_time]
+
+    def __getitem__(self, idx_chemi):
+
+        return self.species(idx_chemi)
+
+    def __len__(self):
+
+        return self.shape[-1]
+
+    def __iter__(self):
+
+        for idx_chemi in range(len(self)):
+
+            yield self.species(idx_chemi)
+
+    def tolist(self):
+        """
+        nested lists in the former layout, chem_c_log[index_of_chemical][index_of_time]
+        """
+        return np.moveaxis(self.array, 0, -1).tolist()
+
+class recorder:
+    """
+    Decide which integration steps are recorded into a trajectory\n
+    Parameters:
+    ---
+    traj: chemgaloo.trajectory.trajectory
+        where recorded points go
+    record_every: int
+        record every Nth step, the last step is always recorded
+    record_times: 1-d array, float
+        if given, record only at these times, states are interpolated between steps, record_every is ignored.
+        Cubic Hermite interpolation is used when derivatives are offered with states, otherwise linear
+    """
+    def __init__(self, traj, record_every = 1, record_times = None):
+
+        self.traj = traj
+        self.record_every = max(1, int(record_every))
+        self.record_times = None if record_times is None else np.sort(np.asarray(record_times, dtype = float))
+        self.__idx_time__ = 0
+        self.__n_step__ = 0
+        self.__if_last__ = True
+
+    def start(self, t, c, f = None):
+        """
+        record initial state
+        """
+        self.__t_prev__ = t
+        self.__c_prev__ = np.array(c, dtype = float)
+        self.__f_prev__ = f
+        if self.record_times is None:
+
+            self.traj.append(t, c)
+        else:
+
+            self.step(t, c, f)
+
+    def step(self, t, c, f = None):
+        """
+        offer state (and optionally its time derivative) after one step to recorder
+        """
+        if self.record_times is None:
+
+            self.__n_step__ += 1
+            self.__if_last__ = self.__n_step__ % self.record_every == 0
+            if self.__if_last__:
+
+                self.traj.append(t, c)
+        else:
+
+            while (self.__idx_time__ < len(self.record_times)) and (self.record_times[self.__idx_time__] <= t):
+
+                t_rec = self.record_times[self.__idx_time__]
+                if (t > self.__t_prev__) and (f is not None) and (self.__f_prev__ is not None):
+
+                    self.traj.append(t_rec, hermite(self.__t_prev__, self.__c_prev__, self.__f_prev__, t, c, f, t_rec))
+                elif t > self.__t_prev__:
+
+                    w = (t_rec - self.__t_prev__)/(t - self.__t_prev__)
+                    self.traj.append(t_rec, (1 - w)*self.__c_prev__ + w*np.asarray(c))
+                else:
+
+                    self.traj.append(t_rec, c)
+                self.__idx_time__ += 1
+        self.__t_prev__ = t
+        self.__c_prev__ = np.array(c, dtype = float)
+        self.__f_prev__ = f
+
+    def finish(self):
+        """
+        record the last state if it is skipped by record_every, and close sink
+        """
+        if (self.record_times is None) and (not self.__if_last__):
+
+            self.traj.append(self.__t_prev__, self.__c_prev__)
+            self.__if_last__ = True
+        self.traj.close()
+
+class callback_sink:
+    """
+    Sink that passes every chunk of recorded points to a function: callback(time, c)\n
+    Parameters:
+    ---
+    callback: callable
+        called with time (n_chunk,) and c (n_chunk, ...state shape), arrays are reused after return, copy if kept
+    chunk_size: int
+        number of points per chunk
+    """
+    def __init__(self, callback, chunk_size = 1024):
+
+        self.callback = callback
+        self.chunk_size = chunk_size
+
+    def write(self, time, c):
+
+        self.callback(time, c)
+
+    def close(self):
+
+        pass
+
+class generator_sink(callback_sink):
+    """
+    Sink that sends every chunk (time, c) to a generator (coroutine), e.g. a downstream analysis
+    written as `while True: time, c = yield`. generator.close() is called at the end of run
+    """
+    def __init__(self, generator, chunk_size = 1024):
+
+        self.generator = generator
+        next(self.generator)
+        callback_sink.__init__(self, lambda time, c: self.generator.send((time, c)), chunk_size = chunk_size)
+
+    def close(self):
+
+        self.generator.close()
+
+class npy_sink:
+    """
+    Sink that streams points to a .npy file with rows [time, c...], the file can be read by numpy.load,
+    with mmap_mode = 'r' for very long runs\n
+    Parameters:
+    ---
+    fname: str
+        path of .npy file
+    chunk_size: int
+        number of points per chunk
+    """
+    # fixed header size, so that shape can be rewritten in place at close
+    __header_size__ = 128
+
+    def __init__(self, fname, chunk_size = 1024):
+
+        self.fname = fname
+        self.chunk_size = chunk_size
+        self.n_rows = 0
+        self.n_cols = 0
+        self.__file__ = open(fname, 'wb')
+        self.__write_header__()
+
+    def __write_header__(self):
+
+        header = "{{'descr': '<f8', 'fortran_order': False, 'shape': ({}, {}), }}".format(self.n_rows, self.n_cols)
+        magic = np.lib.format.magic(1, 0)
+        n_pad = self.__header_size__ - len(magic) - 2 - len(header) - 1
+        header = (header + ' '*n_pad + '\n').encode('latin1')
+        self.__file__.seek(0)
+        self.__file__.write(magic + np.uint16(len(header)).tobytes() + header)
+        self.__file__.seek(0, 2)
+
+    def write(self, time, c):
+
+        c = np.asarray(c, dtype = float).reshape(len(time), -1)
+        self.n_cols = c.shape[1] + 1
+        rows = np.concatenate((np.asarray(time, dtype = float)[:, np.newaxis], c), axis = 1)
+        self.__file__.write(np.ascontiguousarray(rows, dtype = '<f8').tobytes())
+        self.n_rows += len(time)
+
+    def close(self):
+
+        self.__write_header__()
+        self.__file__.close()
+
+class memmap_sink:
+    """
+    Sink that writes points through numpy.memmap into a chemgaloo trajectory file, for runs outgrowing memory.
+    File layout: 8-byte magic, uint64 size of header block, JSON header (species names, units, rate
+    constants, detector hits, shape), then a raw little-endian float64 block with rows [time, c...].
+    Read it back lazily by chemgaloo.trajectory.read\n
+    Parameters:
+    ---
+    fname: str
+        path of trajectory file
+    chunk_size: int
+        number of points per chunk
+    header_size: int
+        bytes reserved for JSON header, file is rewritten once at close if the header outgrows it
+    """
+    __magic__ = b'CGTRAJ01'
+
+    def __init__(self, fname, chunk_size = 1024, header_size = 65536):
+
+        self.fname = fname
+        self.chunk_size = chunk_size
+        self.header_size = header_size
+        self.header = {
+            'names': [], 'c_unit': '', 't_unit': '', 'k': [], 'detector_record': [],
+            'shape': [0, 0], 'state_shape': []
+            }
+        self.n_rows = 0
+        self.__capacity__ = 0
+        self.__mmap__ = None
+        with open(fname, 'wb') as f:
+
+            f.write(self.__magic__ + np.uint64(header_size).tobytes() + b' '*header_size)
+
+    def describe(self, names = [], c_unit = 'mol/L', t_unit = 'second', k = [], detector_record = []):
+        """
+        set metadata written into header at close, called by reactors
+        """
+        self.header.update({
+            'names': list(names), 'c_unit': c_unit, 't_unit': t_unit,
+            'k': np.asarray(k, dtype = float).tolist(), 'detector_record': detector_record
+            })
+
+    def __remap__(self, capacity):
+
+        offset = 16 + self.header_size
+        n_cols = self.header['shape'][1]
+        if self.__mmap__ is not None:
+
+            self.__mmap__.flush()
+            self.__mmap__ = None
+        with open(self.fname, 'r+b') as f:
+
+            f.truncate(offset + capacity*n_cols*8)
+        self.__capacity__ = capacity
+        if capacity > 0:
+
+            self.__mmap__ = np.memmap(self.fname, dtype = '<f8', mode = 'r+', offset = offset, shape = (capacity, n_cols))
+
+    def write(self, time, c):
+
+        c = np.asarray(c, dtype = float)
+        if self.n_rows == 0:
+
+            self.header['state_shape'] = list(c.shape[1:])
+            self.header['shape'][1] = 1 + int(np.prod(c.shape[1:]))
+        n_new = len(time)
+        if self.n_rows + n_new > self.__capacity__:
+
+            self.__remap__(max(2*self.__capacity__, self.n_rows + n_new, self.chunk_size))
+        self.__mmap__[self.n_rows:self.n_rows + n_new, 0] = time
+        self.__mmap__[self.n_rows:self.n_rows + n_new, 1:] = c.reshape(n_new, -1)
+        self.n_rows += n_new
+
+    def close(self):
+
+        self.__remap__(self.n_rows)
+        self.header['shape'][0] = self.n_rows
+        header = json.dumps(self.header).encode('utf-8')
+        if len(header) > self.header_size:
+
+            self.__relocate__(len(header) + 4096)
+        with open(self.fname, 'r+b') as f:
+
+            f.seek(16)
+            f.write(header + b' '*(self.header_size - len(header)))
+
+    def __relocate__(self, header_size):
+
+        """
+        rewrite file with a larger header block, data is copied in chunks
+        """
+        fname_tmp = self.fname + '.tmp'
+        with open(self.fname, 'rb') as f_old, open(fname_tmp, 'wb') as f_new:
+
+            f_new.write(self.__magic__ + np.uint64(header_size).tobytes() + b' '*header_size)
+            f_old.seek(16 + self.header_size)
+            while True:
+
+                block = f_old.read(1 << 24)
+                if not block:
+
+                    break
+                f_new.write(block)
+        os.replace(fname_tmp, self.fname)
+        self.header_size = header_size
+
+class trajectory_file:
+    """
+    Trajectory file written by chemgaloo.trajectory.memmap_sink, opened lazily by numpy.memmap, only
+    the slices accessed are read from disk. Indexing by chemical is the same as chemgaloo.trajectory.trajectory\n
+    Attributes:
+    ---
+    names: 1-d array, str
+        names of chemicals
+    c_unit, t_unit: str
+        units of concentration and time
+    k: array, float
+        rate constants used in run
+    detector_record: array
+        time points recorded by detectors
+    """
+    def __init__(self, fname):
+
+        with open(fname, 'rb') as f:
+
+            if f.read(8) != memmap_sink.__magic__:
+
+                raise ValueError('{} is not a chemgaloo trajectory file'.format(fname))
+            header_size = int(np.frombuffer(f.read(8), dtype = np.uint64)[0])
+            self.header = json.loads(f.read(header_size).decode('utf-8'))
+        self.names = self.header['names']
+        self.c_unit = self.header['c_unit']
+        self.t_unit = self.header['t_unit']
+        self.k = self.header['k']
+        self.detector_record = self.header['detector_record']
+        self.shape = tuple(self.header['state_shape'])
+        n_rows, n_cols = self.header['shape']
+        if n_rows > 0:
+
+            self.__data__ = np.memmap(fname, dtype = '<f8', mode = 'r', offset = 16 + header_size, shape = (n_rows, n_cols))
+        else:
+
+            self.__data__ = np.empty((0, n_cols))
+        self.n_time = n_rows
+
+    @property
+    def time(self):
+
+        return self.__data__[:, 0]
+
+    @property
+    def array(self):
+
+        return self.__data__[:, 1:].reshape((self.n_time,) + self.shape)
+
+    def species(self, idx_chemi):
+        """
+        concentrations of one chemical, given by index or name, at all time points
+        """
+        if isinstance(idx_chemi, str):
+
+            idx_chemi = self.names.index(idx_chemi)
+        return self.array[..., idx_chemi]
+
+    def at(self, idx_time):
+
+        return self.array[idx_time]
+
+    def window(self, t_start, t_end):
+        """
+        time points and states with t_start <= time <= t_end, located by binary search
+        """
+        idx_start = np.searchsorted(self.time, t_start, side = 'left')
+        idx_end = np.searchsorted(self.time, t_end, side = 'right')
+        return self.time[idx_start:idx_end], self.array[idx_start:idx_end]
+
+    def __getitem__(self, idx_chemi):
+
+        return self.species(idx_chemi)
+
+    def __len__(self):
+
+        return self.shape[-1] if len(self.shape) > 0 else 0
+
+def read(fname):
+    """
+    open a chemgaloo trajectory file lazily, see chemgaloo.trajectory.memmap_sink
+    """
+    return trajectory_file(fname)
@@ -0,0 +1,334 @@
+"""
+Uncertainty propagation library of Chemgaloo
+"""
+import pickle
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import __reactor__ as reactor
+import __parallel__ as parallel
+
+def __ppf__(spec, present):
+
+    """
+    inverse cumulative distribution of one uncertain parameter, maps uniform samples in (0, 1) to values
+    """
+    if callable(spec):
+
+        return spec
+    if hasattr(spec, 'ppf'):
+
+        return spec.ppf
+    from scipy.special import ndtri
+    if np.ndim(spec) == 0:
+
+        spec = ('lognormal', present, spec)
+    kind = spec[0]
+    if kind == 'lognormal':
+
+        if spec[1] <= 0:
+
+            raise ValueError('median of log-normal distribution should be positive')
+        return lambda u: spec[1]*np.exp(spec[2]*ndtri(u))
+    elif kind == 'normal':
+
+        return lambda u: spec[1] + spec[2]*ndtri(u)
+    elif kind == 'uniform':
+
+        return lambda u: spec[1] + (spec[2] - spec[1])*u
+    elif kind == 'loguniform':
+
+        return lambda u: spec[1]*(spec[2]/spec[1])**u
+    raise ValueError('unknown distribution: {}'.format(kind))
+
+def __design__(n_samples, n_dim, design = 'lhs', seed = None):
+
+    """
+    uniform samples in the unit hypercube, (n_samples, n_dim)
+    """
+    if design == 'lhs':
+
+        rng = np.random.default_rng(seed)
+        strata = rng.permuted(np.tile(np.arange(n_samples), (n_dim, 1)), axis = 1).T
+        return (strata + rng.random((n_samples, n_dim)))/n_samples
+    elif design == 'sobol':
+
+        from scipy.stats import qmc
+        u = qmc.Sobol(d = n_dim, scramble = True, seed = seed).random(n_samples)
+        # scrambled points never hit 0 or 1 exactly in exact arithmetic, guard the infinite tails anyway
+        return np.clip(u, 0.5/2**32, 1 - 0.5/2**32)
+    elif design == 'random':
+
+        return np.random.default_rng(seed).random((n_samples, n_dim))
+    raise ValueError('unknown sampling design: {}'.format(design))
+
+class __moments__:
+    """
+    running mean and variance merged batch by batch (Chan et al.)
+    """
+    def __init__(self, shape):
+
+        self.n = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def update(self, values):
+
+        n_b = values.shape[-1]
+        mean_b = np.mean(values, axis = -1)
+        m2_b = np.sum((values - mean_b[..., np.newaxis])**2, axis = -1)
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta*n_b/n
+        self.m2 = self.m2 + m2_b + delta**2*self.n*n_b/n
+        self.n = n
+
+    def var(self):
+
+        return self.m2/max(self.n - 1, 1)
+
+class __sketch__:
+    """
+    mergeable quantile summary of many independent samples per cell: a batch is merged into the stored
+    points, and when more than size points are held they are compressed to size equally weighted points
+    placed at evenly spaced ranks, so memory is bounded by (n_cells, size + batch)
+    """
+    def __init__(self, n_cells, size = 2000):
+
+        self.size = size
+        self.points = np.empty((n_cells, 0))
+        self.weights = np.empty(0)
+
+    def __ranks__(self):
+
+        order = np.argsort(self.points, axis = 1)
+        points = np.take_along_axis(self.points, order, axis = 1)
+        weights = self.weights[order]
+        return points, np.cumsum(weights, axis = 1) - weights/2
+
+    def __interp__(self, points, ranks, targets):
+
+        """
+        piecewise linear value at target ranks (n_cells, n_targets) of every cell at once, rows are shifted
+        apart so one call of np.interp serves all cells
+        """
+        n_cells = len(points)
+        targets = np.clip(targets, ranks[:, :1], ranks[:, -1:])
+        shift = (ranks[:, -1:] + 1.)*np.arange(n_cells)[:, np.newaxis]
+        return np.interp((targets + shift).ravel(), (ranks + shift).ravel(), points.ravel()).reshape(targets.shape)
+
+    def update(self, values):
+
+        self.points = np.concatenate((self.points, values), axis = 1)
+        self.weights = np.concatenate((self.weights, np.ones(values.shape[1])))
+        if len(self.weights) > self.size:
+
+            total = np.sum(self.weights)
+            points, ranks = self.__ranks__()
+            targets = np.broadcast_to(total*(np.arange(self.size) + 0.5)/self.size, (len(points), self.size))
+            self.points = self.__interp__(points, ranks, targets)
+            self.weights = np.full(self.size, total/self.size)
+
+    def quantile(self, q):
+
+        """
+        quantiles q in [0, 1] of every cell, (len(q), n_cells)
+        """
+        points, ranks = self.__ranks__()
+        targets = np.broadcast_to(np.sum(self.weights)*np.asarray(q, dtype = float), (len(points), len(q)))
+        return self.__interp__(points, ranks, targets).T
+
+def __uq_runs__(net, ks, c0s, options):
+
+    """
+    one batched integration of all cases, concentrations at record times as (n_time, n_cases, n_species)
+    """
+    return reactor.__bstr_sweep_cases__(net, ks, c0s, **options)[1]
+
+def __worker_uq__(task):
+
+    ks, c0s, options = task
+    return __uq_runs__(parallel.__WORKER_STATE__['net'], ks, c0s, options)
+
+def propagate(
+    net,
+    params = {},
+    record_times = [],
+    n_samples = 1000,
+    design = 'lhs',
+    percentiles = [5, 50, 95],
+    indices = False,
+    seed = None,
+    batch_size = 1000,
+    n_workers = 1,
+    dt = 0.01,
+    integrator = 'rosenbrock',
+    rtol = 1e-6,
+    atol = 1e-9,
+    sketch_size = 2000,
+    callback = None
+):
+    """
+    Monte Carlo uncertainty propagation through a batch reactor: uncertain rate constants and initial
+    concentrations are sampled, the ensemble is integrated in batches as one (batch_size, n_species) array each,
+    and statistics are accumulated batch by batch, so trajectories of all samples are never held together\n
+    Parameters:
+    ---
+    net: chemgaloo.network.network
+        compiled network, see chemgaloo.network.compile, chemicals and reactions are not modified
+    params: dict
+        map from chemgaloo.reaction (its k) or chemgaloo.chemical (its initial concentration) to distribution,
+        quantities not in params take present values, options:
+    >float s: log-normal with median at present value and standard deviation s of natural logarithm\n
+    >('lognormal', median, s), ('normal', mean, std), ('uniform', low, high), ('loguniform', low, high)\n
+    >object with method ppf, e.g. frozen distribution of scipy.stats, or callable mapping uniform samples in
+    (0, 1) to values\n
+    record_times: 1-d array, float
+        time points statistics are computed on
+    n_samples: int
+        number of samples
+    design: str
+        sampling of the unit hypercube, 'lhs' (Latin hypercube), 'sobol' (scrambled Sobol sequence, n_samples
+        best a power of 2) or 'random'
+    percentiles: 1-d array, float
+        percentiles of concentrations reported as bands, in [0, 100]
+    indices: bool
+        if True, also estimate first order and total Sobol indices of every parameter by the Saltelli scheme,
+        which costs n_samples*(len(params) + 2) integrations
+    seed: int
+        seed of random sampling and scrambling
+    batch_size: int
+        number of samples integrated in lockstep, with indices every sample brings len(params) + 2 cases
+    n_workers: int
+        number of worker processes batches are split over, 1 to run in present process, at most 2*n_workers
+        batches are in flight at once
+    dt, integrator, rtol, atol:
+        see chemgaloo.reactor.bstr
+    sketch_size: int
+        number of points kept per time point and chemical to estimate percentiles, rank error is about
+        1/sketch_size
+    callback: callable
+        if given, called as callback(n_done, mean, std) after every batch
+    Return:
+    ---
+    time: 1-d array, float
+        record_times
+    chem_c_mean: 2-d array, float
+        chem_c_mean[index_of_time][index_of_chemical], mean over samples
+    chem_c_std: 2-d array, float
+        chem_c_std[index_of_time][index_of_chemical], standard deviation over samples
+    chem_c_bands: 3-d array, float
+        chem_c_bands[index_of_percentile][index_of_time][index_of_chemical]
+    first_order: 3-d array, float or None
+        first_order[index_of_param][index_of_time][index_of_chemical], in the order of params,
+        nan where concentration does not vary, None if indices is False
+    total: 3-d array, float or None
+        total Sobol indices, same layout as first_order
+    """
+    record_times = np.sort(np.asarray(record_times, dtype = float))
+    if len(record_times) == 0:
+
+        raise ValueError('record_times should not be empty')
+    keys = list(params.keys())
+    n_params = len(keys)
+    locs = [reactor.__param_locate__(net, ikey) for ikey in keys]
+    present = [net.k[idx] if kind == 'k' else net.c0()[idx] for kind, idx in locs]
+    ppfs = [__ppf__(params[ikey], ipresent) for ikey, ipresent in zip(keys, present)]
+    n_blocks = n_params + 2 if indices else 1
+    u = __design__(n_samples, n_params*(2 if indices else 1), design = design, seed = seed)
+    options = {
+        'dt': dt, 'nstep': int(np.ceil(record_times[-1]/dt)), 'integrator': integrator, 'rtol': rtol,
+        'atol': atol, 'record_times': record_times
+        }
+
+    def cases(i, j):
+
+        """
+        sampled parameters of samples i to j, with indices stacked as blocks A, B, AB_1, ..., AB_n_params
+        """
+        a = np.column_stack([ippf(u[i:j, idx]) for idx, ippf in enumerate(ppfs)]) if n_params else np.empty((j - i, 0))
+        blocks = [a]
+        if indices:
+
+            b = np.column_stack([ippf(u[i:j, n_params + idx]) for idx, ippf in enumerate(ppfs)])
+            blocks.append(b)
+            for idx in range(n_params):
+
+                ab = a.copy()
+                ab[:, idx] = b[:, idx]
+                blocks.append(ab)
+        values = np.concatenate(blocks)
+        ks = np.tile(net.k, (len(values), 1))
+        c0s = np.tile(net.c0(), (len(values), 1))
+        for idx, (kind, idx_param) in enumerate(locs):
+
+            if kind == 'c0':
+
+                c0s[:, idx_param] = values[:, idx]
+            else:
+
+                ks[:, idx_param] = values[:, idx]
+        return ks, c0s
+
+    shape = (len(record_times), net.n_species)
+    moments = __moments__(shape)
+    sketch = __sketch__(np.prod(shape), size = sketch_size)
+    if indices:
+
+        moments_ab = __moments__(shape)
+        sum_first = np.zeros((n_params,) + shape)
+        sum_total = np.zeros((n_params,) + shape)
+
+    def accumulate(c_log, n_batch):
+
+        # c_log: (n_time, n_blocks*n_batch, n_species) -> (n_blocks, n_time, n_species, n_batch)
+        y = np.moveaxis(c_log.reshape(shape[0], n_blocks, n_batch, shape[1]), (1, 2), (0, 3))
+        moments.update(y[0])
+        sketch.update(y[0].reshape(-1, n_batch))
+        if indices:
+
+            moments_ab.update(np.concatenate((y[0], y[1]), axis = -1))
+            sum_first[...] += np.sum(y[1]*(y[2:] - y[0]), axis = -1)
+            sum_total[...] += 0.5*np.sum((y[0] - y[2:])**2, axis = -1)
+        if callback is not None:
+
+            callback(moments.n, moments.mean, np.sqrt(moments.var()))
+
+    spans = [(i, min(i + batch_size, n_samples)) for i in range(0, n_samples, batch_size)]
+    if n_workers > 1:
+
+        with ProcessPoolExecutor(
+            max_workers = n_workers, initializer = parallel.__worker_init__,
+            initargs = (pickle.dumps({'net': net}),)
+            ) as executor:
+
+            # at most 2*n_workers batches are submitted ahead, results are consumed in order so that
+            # statistics do not depend on which worker finishes first
+            pending = deque()
+            for i, j in spans:
+
+                if len(pending) == 2*n_workers:
+
+                    n_batch, future = pending.popleft()
+                    accumulate(future.result(), n_batch)
+                pending.append((j - i, executor.submit(__worker_uq__, cases(i, j) + (options,))))
+            while pending:
+
+                n_batch, future = pending.popleft()
+                accumulate(future.result(), n_batch)
+    else:
+
+        for i, j in spans:
+
+            accumulate(__uq_runs__(net, *cases(i, j), options), j - i)
+
+    bands = sketch.quantile(np.asarray(percentiles, dtype = float)/100).reshape((len(percentiles),) + shape)
+    first_order, total = None, None
+    if indices:
+
+        var = moments_ab.var()
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+
+            first_order = np.where(var > 0, sum_first/n_samples/var, np.nan)
+            total = np.where(var > 0, sum_total/n_samples/var, np.nan)
+    return record_times, moments.mean, np.sqrt(moments.var()), bands, first_order, total
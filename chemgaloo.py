@@ -2,6 +2,8 @@
 Chemgaloo: a numerical chemical kinetic simulation program\n
 
 """
+import numpy as np
+
 h = 6.626E-34
 NA = 6.02E23
 R = 8.314
@@ -11,11 +13,13 @@ class chemical:
     """
     chemicals in chemgaloo
     """
-    def __init__(self, concentration = 0.0):
+    def __init__(self, concentration = 0.0, name = ''):
         """
-        concentration: initial concentration of chemical defined, if not specified explicitly, 0.0 will be given as default
+        concentration: initial concentration of chemical defined, if not specified explicitly, 0.0 will be given as default\n
+        name: name of chemical, used in trajectory files and mechanism files
         """
         self.c = concentration
+        self.name = name
         self.ccstr_in = self.c
         self.ccstr_out = 0.
         # basic stoichemistry
@@ -119,9 +123,25 @@ class reaction:
         Helmholtz free energy change
     deltaG: float
         Gibbs free energy change
+    OPTIONAL temperature dependence of rate constant:
+    ---
+    rate_law: str
+        how k depends on temperature, see reaction.k_at, options:
+    >'constant': k does not depend on temperature\n
+    >'arrhenius': k = A * T**n * exp(-Ea/(R*T))\n
+    >'eyring': transition-state theory, k = kb*T/h * exp(-barrier/(R*T))\n
+    A: float
+        pre-exponential factor of Arrhenius law
+    Ea: float
+        activation energy of Arrhenius law, in J/mol
+    n: float
+        temperature exponent of modified Arrhenius law
+    barrier: float
+        Gibbs free energy barrier of Eyring law, in J/mol
     """
     def __init__(self, rxtns = [], prdts = [], stois = [], k = 0.0,
-    deltaU = 0., deltaH = 0., deltaS = 0., deltaF = 0., deltaG = 0.):
+    deltaU = 0., deltaH = 0., deltaS = 0., deltaF = 0., deltaG = 0.,
+    rate_law = 'constant', A = 0., Ea = 0., n = 0., barrier = 0.):
 
         self.rxtns = rxtns
         self.prdts = prdts
@@ -134,10 +154,38 @@ class reaction:
         self.deltaS = deltaS
         self.deltaF = deltaF
         self.deltaG = deltaG
+        self.rate_law = rate_law
+        self.A = A
+        self.Ea = Ea
+        self.n = n
+        self.barrier = barrier
 
         self.__c_bak__ = []
         self.__save_state__()
 
+    def k_at(self, temperature = 298.15):
+        """
+        rate constant at temperature, for rate_law 'constant', self.k is returned\n
+        Parameters:
+        ---
+        temperature: float
+            temperature in K
+        Return:
+        ---
+        k: float
+            rate constant
+        """
+        if self.rate_law == 'arrhenius':
+
+            return self.A * temperature**self.n * np.exp(-self.Ea/(R*temperature))
+        elif self.rate_law == 'eyring':
+
+            return kb*temperature/h * np.exp(-self.barrier/(R*temperature))
+        elif self.rate_law == 'constant':
+
+            return self.k
+        raise ValueError('unknown rate law: {}'.format(self.rate_law))
+
     def rate(self, c_from = 'present', mode = 'BSTR'):
         """
         reaction rate calculation\n
@@ -413,6 +461,15 @@ class reaction:
 
 
 import __reactor__ as reactor
+import __network__ as network
+import __integrator__ as integrator
+import __parallel__ as parallel
+import __trajectory__ as trajectory
+import __stochastic__ as stochastic
+import __fitting__ as fitting
+import __uncertainty__ as uncertainty
+import __reduction__ as reduction
+import __mechanism__ as mechanism
 
 class detector:
     """
@@ -423,7 +480,8 @@ class detector:
         short of attribute, define the type of property detected, options:
     >'c': concentration\n
     >'time': reaction time (not implemented yet)\n
-    >'temp': temperature of reaction system, need enthalpy data (not implemented yet)\n
+    >'temp': temperature of reaction system, only for non-isothermal batch reactor (bstr with heat_balance),
+    value is one temperature in K\n
     mode: str
         what type of signal, current available options:
     >'isolated': concentration of each chemical defined in keyword detect\n
@@ -443,7 +501,8 @@ class detector:
     >'record': save present time point by appending\n
     >'record_and_quench': save present time point by appending and quench reactions\n
     >'record_and_silent': ...\n
-    >'record_and_quench_and_silent': ...
+    >'record_and_quench_and_silent': ...\n
+    messages are sent to the logger given to reactor, nothing is printed if no logger is given
     """
     def __init__(
         self, 
@@ -40,7 +40,8 @@ time, c_log, _, _ = cg.reactor.batch_reactor(
     reactions = [rxn1, rxn2],
     dt = 0.01,
     nstep = 1000,
-    detectors = [detector1]
+    detectors = [detector1],
+    logger = print
     )
 
 plt.plot(time, c_log[0][:])
@@ -62,7 +62,8 @@ for k2 in k2s:
         reactions = [rxn1, rxn2],
         dt = 0.001,
         nstep = 5000,
-        detectors = [detector2]
+        detectors = [detector2],
+        logger = print
         )
 
     if not if_expire:
@@ -38,37 +38,42 @@ from numpy import linspace
 
 stois2 = [1, 1, 1]
 k2s = linspace(start = 1.0, stop = 5.0, num = 20)
+rxn2 = cg.reaction(
+    rxtns = [chem1, chem3],
+    prdts = [chem4],
+    stois = stois2,
+    k = k2s[0]
+)
 
-k_reach_record = []
-delta_ts = []
-
-for k2 in k2s:
+chem1.c = 5.0
+chem2.c = 1.0
+chem3.c = 0.0
+chem4.c = 0.0
 
-    rxn2 = cg.reaction(
-        rxtns = [chem1, chem3],
-        prdts = [chem4],
-        stois = stois2,
-        k = k2
+# all k2 values are simulated at once
+network = cg.network.compile(
+    chemicals = [chem1, chem2, chem3, chem4],
+    reactions = [rxn1, rxn2]
+    )
+time, c_log, if_expire, records = cg.reactor.bstr_sweep(
+    network,
+    params = {rxn2: k2s},
+    dt = 0.001,
+    nstep = 5000,
+    detectors = [detector1, detector2]
     )
 
-    chem1.c = 5.0
-    chem2.c = 1.0
-    chem3.c = 0.0
-    chem4.c = 0.0
+k_reach_record = []
+delta_ts = []
 
-    time, c_log, if_expire, record = cg.reactor.batch_reactor(
-        chemicals = [chem1, chem2, chem3, chem4],
-        reactions = [rxn1, rxn2],
-        dt = 0.001,
-        nstep = 5000,
-        detectors = [detector1, detector2]
-        )
+for idx_k2 in range(len(k2s)):
 
-    print('k2 = {}'.format(k2))
+    record = records[idx_k2]
+    print('k2 = {}'.format(k2s[idx_k2]))
     print(record)
     if len(record) >= 2:
         delta_ts.append(record[-1] - record[-2])
-        k_reach_record.append(k2)
+        k_reach_record.append(k2s[idx_k2])
 
 print(delta_ts)
 plt.plot(k_reach_record, delta_ts, 'r-')